@@ -0,0 +1,557 @@
+"""
+SSBJ test case - http://ntrs.nasa.gov/archive/nasa/casi.ntrs.nasa.gov/19980234657.pdf
+Python implementation and OpenMDAO integration developed by
+Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
+
+Timing benchmarks of the SSBJ disciplines and formulations.
+
+Usage: python ssbj_benchmarks.py [benchmark ...]  (all benchmarks by default)
+"""
+from __future__ import print_function
+from sys import argv
+from timeit import default_timer as timer
+import numpy as np
+
+from ssbj_disciplines.common import polynomial_function, polynomial_function_batch
+from ssbj_disciplines.reference import polynomial_reference
+from ssbj_disciplines.atmosphere import Atmosphere
+from ssbj_disciplines.structure import Structure
+from ssbj_disciplines.aerodynamics import Aerodynamics
+from ssbj_disciplines.propulsion import Propulsion
+from ssbj_disciplines.performance import Performance
+from ssbj_multistart import latin_hypercube
+# pylint: disable=C0103
+
+
+def bench_polynomial():
+    """
+    Scalar polynomial_function loop against polynomial_function_batch
+    on the 5-variable "sigma[1]" response.
+    """
+    print('=== polynomial: scalar loop vs batch (sigma[1], 5 variables) ===')
+    flag = [4, 1, 4, 1, 1]
+    S_bound = [0.1]*5
+    ref = np.array([0.05, 50606.7, 1.0, 37.08, 0.4])
+    d = {'sigma[1]': list(ref)}
+    rng = np.random.RandomState(0)
+
+    print('{:>8} {:>12} {:>12} {:>9} {:>10}'.format('N', 'scalar (s)', 'batch (s)',
+                                                    'speedup', 'max diff'))
+    for N in [1, 1000, 100000]:
+        S_new = ref*rng.uniform(0.7, 1.3, (N, 5))
+
+        t0 = timer()
+        scalar = np.array([polynomial_function(d, s, flag, S_bound, 'sigma[1]')
+                           for s in S_new])
+        t_scalar = timer() - t0
+
+        n_rep = max(1, 1000 // N)
+        t0 = timer()
+        for _ in range(n_rep):
+            batch = polynomial_function_batch(d, S_new, flag, S_bound, 'sigma[1]')
+        t_batch = (timer() - t0)/n_rep
+
+        print('{:>8} {:>12.4g} {:>12.4g} {:>9.1f} {:>10.2g}'.format(
+            N, t_scalar, t_batch, t_scalar/t_batch, np.max(np.abs(scalar - batch))))
+
+
+class _UncachedStructure(Structure):
+    """
+    Structure evaluating its analysis again in compute_partials, as it did
+    before the intermediates were shared with compute.
+    """
+
+    def _evaluate(self, inputs):
+        self._cache_key = None
+        return super(_UncachedStructure, self)._evaluate(inputs)
+
+
+def bench_structure(n_points=2000):
+    """
+    Structure compute followed by compute_partials around the test point
+    of ssbj_disciplines/structure.py, with and without the intermediates
+    shared between the two.
+    """
+    print('=== structure: compute + compute_partials ===')
+    scalers = {}
+    scalers['z'] = np.array([0.05, 45000., 1.6, 5.5, 55.0, 1000.0])
+    scalers['x_str'] = np.array([0.25, 1.0])
+    scalers['L'] = 49909.58578
+    scalers['Theta'] = 0.950978
+    scalers['WF'] = 7306.20261
+    scalers['WT'] = 49909.58578
+    scalers['WE'] = 5748.915355
+    scalers['sigma'] = np.array([1.12255, 1.08170213, 1.0612766,
+                                 1.04902128, 1.04085106])
+    pf = polynomial_reference(scalers['z'], np.array([0.25, 1.0]), 1.0, 0.5, scalers['L'])
+
+    # New input values at each evaluation, as in an optimization
+    rng = np.random.RandomState(0)
+    z = np.array([1.2, 1.333, 0.875, 0.45, 1.27, 1.5])*rng.uniform(0.99, 1.01, (n_points, 6))
+
+    times = {}
+    for name, cls in [('uncached', _UncachedStructure), ('shared', Structure)]:
+        comp = cls(scalers, pf)
+        inputs = {'x_str': np.array([1.6, 0.75]), 'L': np.array([0.888]),
+                  'WE': np.array([1.49])}
+        outputs = {}
+        J = {}
+
+        t0 = timer()
+        for i in range(n_points):
+            inputs['z'] = z[i]
+            comp.compute(inputs, outputs)
+            comp.compute_partials(inputs, J)
+        times[name] = (timer() - t0)/n_points
+        print('{:>8}: {:.1f} us per compute + compute_partials'.format(name, times[name]*1e6))
+    print('speedup: {:.2f}x'.format(times['uncached']/times['shared']))
+
+
+def _disciplines(scalers, pf, vec_size):
+    """
+    Atmosphere, structure, aerodynamics, propulsion and performance evaluating
+    vec_size points.
+    """
+    return [('Atmosphere', Atmosphere(scalers, vec_size=vec_size)),
+            ('Structure', Structure(scalers, pf, vec_size=vec_size)),
+            ('Aerodynamics', Aerodynamics(scalers, pf, vec_size=vec_size)),
+            ('Propulsion', Propulsion(scalers, pf, vec_size=vec_size)),
+            ('Performance', Performance(scalers, vec_size=vec_size))]
+
+
+def bench_vec_size():
+    """
+    N points evaluated by disciplines with vec_size=N against N copies
+    of the single point disciplines.
+    """
+    from openmdao.api import Problem
+    from ssbj_mda import init_ssbj_mda
+
+    print('=== vec_size: disciplines at N points, one vectorized model vs N copies ===')
+    scalers, pf = init_ssbj_mda()
+
+    print('{:>6} {:>11} {:>10} {:>10} {:>12}'.format('N', 'model', 'setup (s)', 'run (s)',
+                                                     'linearize (s)'))
+    for N in [1, 10, 100]:
+        for name, copies, vec_size in [('vec_size', 1, N), ('copies', N, 1)]:
+            prob = Problem()
+            for i in range(copies):
+                for discipline, comp in _disciplines(scalers, pf, vec_size):
+                    prob.model.add_subsystem('{}{}'.format(discipline, i), comp)
+
+            t0 = timer()
+            prob.setup()
+            prob.final_setup()
+            t_setup = timer() - t0
+
+            t0 = timer()
+            prob.run_model()
+            t_run = timer() - t0
+
+            t0 = timer()
+            prob.model.run_linearize()
+            t_lin = timer() - t0
+
+            print('{:>6} {:>11} {:>10.4f} {:>10.4f} {:>12.4f}'.format(N, name, t_setup,
+                                                                      t_run, t_lin))
+
+
+def bench_idf_couplings():
+    """
+    IDF optimizations with the squared coupling constraints against the
+    linear ones: optimizer iterations, function and gradient evaluations.
+    """
+    from ssbj_mda import init_ssbj_mda
+    from ssbj_idf import build_idf_problem
+
+    print('=== idf_couplings: squared vs linear IDF coupling constraints ===')
+    scalers, pf = init_ssbj_mda()
+    print('{:>9} {:>6} {:>6} {:>6} {:>9} {:>10} {:>8}'.format(
+        'couplings', 'iter', 'nfev', 'njev', 'time (s)', 'R', 'R check'))
+    for couplings in ['squared', 'linear']:
+        prob = build_idf_problem({'scalers': scalers, 'pf': pf, 'disp': False,
+                                  'couplings': couplings})
+        t0 = timer()
+        prob.run_driver()
+        elapsed = timer() - t0
+        result = prob.driver.result
+        R = -prob['obj'][0]*scalers['R'][0]
+        print('{:>9} {:>6} {:>6} {:>6} {:>9.3f} {:>10.4f} {:>8}'.format(
+            couplings, result.nit, result.nfev, result.njev, elapsed, R,
+            'ok' if 3950. < R < 3970. else 'FAILED'))
+
+
+def bench_idf_parallel(n_iterations=50):
+    """
+    Wall time of one IDF optimizer iteration, run_model and total derivatives,
+    with the disciplines in a serial Group against a ParallelGroup. Run under
+    MPI, e.g. mpirun -n 3, for the ParallelGroup to be concurrent.
+    """
+    from ssbj_mda import init_ssbj_mda
+    from ssbj_idf import build_idf_problem
+
+    scalers, pf = init_ssbj_mda()
+    for parallel in [False, True]:
+        prob = build_idf_problem({'scalers': scalers, 'pf': pf, 'disp': False,
+                                  'parallel': parallel})
+        prob.run_model()
+        t0 = timer()
+        for _ in range(n_iterations):
+            prob.run_model()
+            prob.compute_totals()
+        elapsed = (timer() - t0)/n_iterations
+        if prob.comm.rank == 0:
+            if not parallel:
+                print('=== idf_parallel: IDF iteration on {} processes ==='.format(prob.comm.size))
+                print('{:>10} {:>15} {:>9}'.format('layout', 'iteration (ms)', 'speedup'))
+                t_serial = elapsed
+            print('{:>10} {:>15.3f} {:>9.2f}'.format('parallel' if parallel else 'serial',
+                                                    elapsed*1e3, t_serial/elapsed))
+
+
+def bench_mda(n_points=20):
+    """
+    MDA strategies of SSBJ_MDA on a Latin hypercube of z within the design
+    bounds of ssbj_mdf.py, each point starting from the same coupling values.
+    """
+    from openmdao.api import Problem
+    from ssbj_mda import init_ssbj_mda, SSBJ_MDA, MDA_STRATEGIES
+
+    print('=== mda: strategies on a Latin hypercube of {} z ==='.format(n_points))
+    scalers, pf = init_ssbj_mda()
+    z = latin_hypercube(n_points, np.array([0.2, 0.666, 0.875, 0.45, 0.72, 0.5]),
+                        np.array([1.8, 1.333, 1.125, 1.45, 1.27, 1.5]))
+
+    print('{:>10} {:>10} {:>10} {:>12} {:>12}'.format(
+        'mda', 'mean iter', 'max iter', 'time (ms)', 'max resid'))
+    for mda in MDA_STRATEGIES:
+        prob = Problem(SSBJ_MDA(scalers, pf, mda=mda))
+        prob.setup()
+        prob.set_solver_print(level=-1)
+        prob.final_setup()
+        group = prob.model.Mda
+        couplings = [meta['prom_name'] for _, meta in
+                     group.list_outputs(prom_name=True, out_stream=None)]
+        start = dict((name, prob[name].copy()) for name in couplings)
+
+        iterations = []
+        residuals = []
+        t0 = timer()
+        for z_i in z:
+            for name in couplings:
+                prob[name] = start[name]
+            prob['z'] = z_i
+            prob.run_model()
+            iterations.append(group.nonlinear_solver._iter_count)
+            group.run_apply_nonlinear()
+            residuals.append(group._residuals.get_norm())
+        elapsed = timer() - t0
+        print('{:>10} {:>10.1f} {:>10} {:>12.2f} {:>12.3g}'.format(
+            mda, np.mean(iterations), max(iterations), elapsed/n_points*1e3,
+            max(residuals)))
+
+
+def bench_coloring():
+    """
+    Linear solves per total Jacobian, so per optimizer iteration, of the MDF
+    and IDF problems in each mode without and with total coloring, and their
+    optimization time in the fixed fwd mode against the colored chosen mode.
+    """
+    from ssbj_mda import init_ssbj_mda
+    from ssbj_mdf import build_mdf_problem
+    from ssbj_idf import build_idf_problem
+    from ssbj_coloring import uncolored_solves, total_colorings
+
+    print('=== coloring: linear solves per total Jacobian and optimization time ===')
+    scalers, pf = init_ssbj_mda()
+    print('{:>4} {:>6} {:>6} {:>10} {:>10} {:>6} {:>9} {:>6} {:>10}'.format(
+        '', 'fwd', 'rev', 'fwd color', 'rev color', 'mode', 'time (s)', 'iter', 'R'))
+    for name, build, objective in [('MDF', build_mdf_problem, 'R'),
+                                   ('IDF', build_idf_problem, 'obj')]:
+        options = {'scalers': scalers, 'pf': pf, 'disp': False, 'coloring': False}
+        prob = build(options)
+        solves = uncolored_solves(prob)
+        colorings = total_colorings(prob)
+        for coloring in [False, True]:
+            options['coloring'] = coloring
+            prob = build(options)
+            t0 = timer()
+            prob.run_driver()
+            elapsed = timer() - t0
+            print('{:>4} {:>6} {:>6} {:>10} {:>10} {:>6} {:>9.3f} {:>6} {:>10.4f}'.format(
+                name, solves['fwd'], solves['rev'], colorings['fwd'].total_solves(),
+                colorings['rev'].total_solves(), prob._mode + (' col' if coloring else ''),
+                elapsed, prob.driver.iter_count, abs(prob[objective][0])*scalers['R'][0]))
+
+
+def bench_co_partials(n_repeats=5, shift=0.1):
+    """
+    System-level total derivatives of CO with the post-optimality sensitivities
+    of the suboptimizations against their finite differences, at targets
+    shifted randomly by up to shift from the start point.
+    """
+    import contextlib
+    import io
+    from openmdao.api import Problem, ScipyOptimizeDriver
+    from ssbj_mda import init_ssbj_mda
+    from ssbj_co import SsbjCO
+
+    print('=== co_partials: CO total derivatives, KKT sensitivities vs FD suboptimizations ===')
+    scalers, pf = init_ssbj_mda()
+    targets = ['z', 'D_hat', 'WE_hat', 'WT_hat', 'Theta_hat', 'WF_hat', 'ESF_hat', 'fin_hat', 'SFC_hat']
+    print('{:>8} {:>9} {:>9} {:>12}'.format('partials', 'time (s)', 'vs kkt', 'max |dJ-kkt|'))
+    totals = {}
+    for partials in ['kkt', 'fd']:
+        prob = Problem()
+        prob.model = SsbjCO(scalers=scalers, pf=pf, subopt_driver=ScipyOptimizeDriver(),
+                            subopt_partials=partials, record=False)
+        times = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            prob.setup(mode='rev')
+            prob.final_setup()
+            rng = np.random.RandomState(0)
+            for name in targets:
+                prob[name] = prob[name] + shift*rng.uniform(-1, 1, np.shape(prob[name]))
+            prob.run_model()
+            for _ in range(n_repeats):
+                t0 = timer()
+                totals[partials] = prob.compute_totals(of=['J.J', 'performance.R'], wrt=targets,
+                                                       return_format='array')
+                times.append(timer() - t0)
+        elapsed = np.median(times)
+        if partials == 'kkt':
+            baseline = elapsed
+        print('{:>8} {:>9.3f} {:>9.1f} {:>12.2e}'.format(
+            partials, elapsed, elapsed/baseline, np.max(np.abs(totals[partials][0] - totals['kkt'][0]))))
+
+
+def bench_co_parallel(shift=0.1):
+    """
+    Wall time of one CO system iteration, run_model and total derivatives,
+    with the suboptimizations one after the other, in a ParallelGroup and on a
+    pool of processes, for each kind of suboptimization partials. Run under
+    MPI, e.g. mpirun -n 3, for the ParallelGroup to be concurrent.
+    """
+    import contextlib
+    import io
+    from openmdao.api import Problem, ScipyOptimizeDriver
+    from ssbj_mda import init_ssbj_mda
+    from ssbj_co import SsbjCO
+
+    scalers, pf = init_ssbj_mda()
+    targets = ['z', 'D_hat', 'WE_hat', 'WT_hat', 'Theta_hat', 'WF_hat', 'ESF_hat', 'fin_hat', 'SFC_hat']
+    for partials in ['kkt', 'fd']:
+        for parallel in [None, 'mpi', 'pool']:
+            prob = Problem()
+            prob.model = SsbjCO(scalers=scalers, pf=pf, subopt_driver=ScipyOptimizeDriver(),
+                                subopt_partials=partials, parallel=parallel, record=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                prob.setup(mode='rev')
+                prob.final_setup()
+                rng = np.random.RandomState(0)
+                for name in targets:
+                    prob[name] = prob[name] + shift*rng.uniform(-1, 1, np.shape(prob[name]))
+                t0 = timer()
+                prob.run_model()
+                t_run = timer() - t0
+                t0 = timer()
+                prob.compute_totals(of=['J.J', 'performance.R'], wrt=targets)
+                t_totals = timer() - t0
+                prob.cleanup()
+            if prob.comm.rank == 0:
+                if parallel is None:
+                    if partials == 'kkt':
+                        print('=== co_parallel: CO iteration on {} processes ==='.format(prob.comm.size))
+                        print('{:>8} {:>8} {:>9} {:>11} {:>9}'.format('partials', 'layout', 'run (s)',
+                                                                     'totals (s)', 'speedup'))
+                    t_serial = t_run + t_totals
+                print('{:>8} {:>8} {:>9.3f} {:>11.3f} {:>9.2f}'.format(
+                    partials, parallel or 'serial', t_run, t_totals, t_serial/(t_run + t_totals)))
+
+
+def bench_fast_mda(n_points=200, n_scan=10000):
+    """
+    Per point cost of the MDA by run_model on SSBJ_MDA against solve_mda and
+    solve_mda_batch, on a Latin hypercube of z, starting each point from the
+    same couplings, then of solve_mda_batch on a scan of n_scan points.
+    """
+    import warnings
+    from openmdao.api import Problem
+    from ssbj_mda import init_ssbj_mda, SSBJ_MDA
+    from ssbj_fast_mda import solve_mda, solve_mda_batch, COUPLINGS
+
+    print('=== fast_mda: SSBJ_MDA run_model vs solve_mda on {} points ==='.format(n_points))
+    scalers, pf = init_ssbj_mda()
+    lower = np.array([0.2, 0.666, 0.875, 0.45, 0.72, 0.5])
+    upper = np.array([1.8, 1.333, 1.125, 1.45, 1.27, 1.5])
+    z = latin_hypercube(n_points, lower, upper)
+    x_str = np.ones((n_points, 2))
+    x_aer = np.ones(n_points)
+    x_pro = np.ones(n_points)
+
+    prob = Problem(SSBJ_MDA(scalers, pf))
+    prob.setup()
+    prob.set_solver_print(level=-1)
+    prob.final_setup()
+    names = [name for name, _ in COUPLINGS]
+    start = dict((name, prob[name].copy()) for name in names)
+    R = np.zeros(n_points)
+    t0 = timer()
+    for i in range(n_points):
+        for name in names:
+            prob[name] = start[name]
+        prob['z'] = z[i]
+        prob.run_model()
+        R[i] = prob['R'][0]
+    t_model = (timer() - t0)/n_points
+
+    t0 = timer()
+    R_loop = np.array([solve_mda(scalers, pf, z[i], x_str[i], x_aer[i], x_pro[i])[0]['R'][0]
+                       for i in range(n_points)])
+    t_loop = (timer() - t0)/n_points
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        t0 = timer()
+        outputs, _, _ = solve_mda_batch(scalers, pf, z, x_str, x_aer, x_pro)
+        t_batch = (timer() - t0)/n_points
+
+    print('{:>10} {:>12} {:>10} {:>12}'.format('mda', 'cost (ms)', 'speedup', 'max R diff'))
+    for name, t, R_i in [('model', t_model, R), ('solve_mda', t_loop, R_loop),
+                         ('batch', t_batch, outputs['R'])]:
+        print('{:>10} {:>12.4f} {:>10.1f} {:>12.3g}'.format(name, t*1e3, t_model/t,
+                                                            np.max(np.abs(R_i - R))))
+
+    z = latin_hypercube(n_scan, lower, upper)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        t0 = timer()
+        _, iterations, converged = solve_mda_batch(scalers, pf, z, np.ones((n_scan, 2)),
+                                                   np.ones(n_scan), np.ones(n_scan))
+        elapsed = timer() - t0
+    print('batch scan of {} points: {:.3f} s, {} sweeps, {} not converged'.format(
+        n_scan, elapsed, iterations.max(), np.sum(~converged)))
+
+
+def bench_pool(n_points=400):
+    """
+    Throughput of evaluate_points on a Latin hypercube of z against the
+    number of worker processes, 1 being evaluated in this process, and with
+    the default number of workers.
+    """
+    import os
+    from ssbj_mda import init_ssbj_mda
+    from ssbj_pool import evaluate_points
+
+    n_cpus = os.cpu_count() or 1
+    print('=== pool: evaluate_points on {} points, {} processors ==='.format(n_points, n_cpus))
+    scalers, pf = init_ssbj_mda()
+    z = latin_hypercube(n_points, np.array([0.2, 0.666, 0.875, 0.45, 0.72, 0.5]),
+                        np.array([1.8, 1.333, 1.125, 1.45, 1.27, 1.5]))
+    ones = np.ones(n_points)
+
+    print('{:>8} {:>10} {:>14} {:>9}'.format('workers', 'time (s)', 'points per s', 'speedup'))
+    workers = sorted(set([1, 2, 4, n_cpus])) + [None]
+    for max_workers in workers:
+        t0 = timer()
+        for _ in evaluate_points(scalers, pf, z, np.ones((n_points, 2)), ones, ones,
+                                 max_workers=max_workers):
+            pass
+        elapsed = timer() - t0
+        if max_workers == 1:
+            t_serial = elapsed
+        print('{:>8} {:>10.3f} {:>14.1f} {:>9.2f}'.format(
+            'default' if max_workers is None else max_workers, elapsed,
+            n_points/elapsed, t_serial/elapsed))
+
+
+def bench_multistart(n_starts=8):
+    """
+    MDF optimizations from a Latin hypercube of start points run one after
+    the other on one problem against multistart_mdf with pools of processes,
+    1 worker running in this process, and with the default number of workers.
+    """
+    import os
+    from ssbj_mda import init_ssbj_mda
+    from ssbj_mdf import build_mdf_problem, run_mdf
+    from ssbj_multistart import start_points, multistart_mdf, unique_optima
+
+    n_cpus = os.cpu_count() or 1
+    print('=== multistart: MDF from {} start points, {} processors ==='.format(n_starts, n_cpus))
+    scalers, pf = init_ssbj_mda()
+    options = {'scalers': scalers, 'pf': pf, 'disp': False}
+    starts = start_points(n_starts)
+
+    print('{:>8} {:>10} {:>9} {:>7} {:>10}'.format('workers', 'time (s)', 'speedup',
+                                                   'optima', 'best R'))
+    t0 = timer()
+    prob = build_mdf_problem(options)
+    optima = unique_optima([run_mdf(x0, prob=prob)[1] for x0 in starts])
+    t_serial = timer() - t0
+    print('{:>8} {:>10.3f} {:>9.2f} {:>7} {:>10.4f}'.format('serial', t_serial, 1.,
+                                                           len(optima), optima[0]['R']))
+    for max_workers in sorted(set([1, 2, 4, n_cpus])) + [None]:
+        t0 = timer()
+        optima, _ = multistart_mdf(n_starts, options, max_workers=max_workers, starts=starts)
+        elapsed = timer() - t0
+        print('{:>8} {:>10.3f} {:>9.2f} {:>7} {:>10.4f}'.format(
+            'default' if max_workers is None else max_workers, elapsed, t_serial/elapsed,
+            len(optima), optima[0]['R']))
+
+    print('{:>5} {:>10} {:>7}'.format('rank', 'R', 'starts'))
+    for rank, optimum in enumerate(optima):
+        print('{:>5} {:>10.4f} {:>7}'.format(rank + 1, optimum['R'], optimum['count']))
+
+
+def bench_warm_start():
+    """
+    MDF optimizations whose MDA solves start from the nearest cached coupling
+    state against the state left by the previous solve, with analytic and
+    finite difference total derivatives. With analytic totals the previous
+    solve is already the nearest design, so only the finite difference runs
+    are expected to save evaluations.
+    """
+    from ssbj_mda import init_ssbj_mda, CouplingCache
+    from ssbj_mdf import build_mdf_problem
+
+    print('=== warm_start: MDF with and without the coupling cache ===')
+    scalers, pf = init_ssbj_mda()
+
+    print('{:>7} {:>9} {:>6} {:>7} {:>7} {:>11} {:>7} {:>9} {:>10}'.format(
+        'mda', 'totals', 'cache', 'solves', 'hits', 'evaluations', 'saved', 'time (s)', 'R'))
+    for mda in ['gs', 'newton']:
+        for fd in [False, True]:
+            # a cache of size 0 keeps the previous state and counts the evaluations
+            for name, cache in [('none', CouplingCache(maxsize=0)), ('lru', CouplingCache())]:
+                prob = build_mdf_problem({'scalers': scalers, 'pf': pf, 'mda': mda,
+                                          'coupling_cache': cache, 'fd': fd, 'disp': False})
+                t0 = timer()
+                prob.run_driver()
+                elapsed = timer() - t0
+                if name == 'none':
+                    baseline = cache.evaluations
+                print('{:>7} {:>9} {:>6} {:>7} {:>7} {:>11} {:>7} {:>9.3f} {:>10.4f}'.format(
+                    mda, 'fd' if fd else 'analytic', name, cache.hits + cache.misses,
+                    cache.hits, cache.evaluations, baseline - cache.evaluations, elapsed,
+                    prob['R'][0]*scalers['R'][0]))
+
+
+BENCHMARKS = {
+    'co_parallel': bench_co_parallel,
+    'co_partials': bench_co_partials,
+    'coloring': bench_coloring,
+    'fast_mda': bench_fast_mda,
+    'idf_couplings': bench_idf_couplings,
+    'idf_parallel': bench_idf_parallel,
+    'mda': bench_mda,
+    'multistart': bench_multistart,
+    'pool': bench_pool,
+    'polynomial': bench_polynomial,
+    'structure': bench_structure,
+    'vec_size': bench_vec_size,
+    'warm_start': bench_warm_start,
+}
+
+if __name__ == '__main__':
+    for name in argv[1:] or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
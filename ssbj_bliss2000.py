@@ -16,11 +16,13 @@ from openmdao.api import *
 
 import numpy as np
 
+from ssbj_disciplines.atmosphere import Atmosphere
 from ssbj_disciplines.aerodynamics import Aerodynamics
 from ssbj_disciplines.performance import Performance
 from ssbj_disciplines.propulsion import Propulsion
 from ssbj_disciplines.structure import Structure
 from ssbj_disciplines.dpdxcalc import DpdxCalc
+from ssbj_disciplines.constraints import SSBJConstraints, SUBOPT_CONSTRAINTS
 
 from ssbj_mda import init_ssbj_mda
 
@@ -56,6 +58,7 @@ class SubOpt(ExplicitComponent):
     def initialize(self):
         self.options.declare("discipline")
         self.options.declare("scalers")
+        self.options.declare("pf")
         self.options.declare("driver")
 
     def setup(self):
@@ -111,26 +114,14 @@ class SubOpt(ExplicitComponent):
             )
 
             # Disciplinary analysis
-            p.model.add_subsystem("structures", Structure(self.options["scalers"]))
+            p.model.add_subsystem("structures", Structure(self.options["scalers"], self.options["pf"]))
 
             # Local constraint functions
-            cstrs = [
-                "con_theta = Theta*" + str(self.options["scalers"]["Theta"]) + "-1.04"
-            ]
-            for i in range(5):
-                cstrs.append(
-                    "con_sigma"
-                    + str(i + 1)
-                    + " = sigma["
-                    + str(i)
-                    + "]*"
-                    + str(self.options["scalers"]["sigma"][i])
-                    + "-1.09"
-                )
             p.model.add_subsystem(
                 "constraints",
-                ExecComp(cstrs, sigma=np.zeros(5)),
-                promotes_outputs=["*"],
+                SSBJConstraints(
+                    self.options["scalers"], SUBOPT_CONSTRAINTS["structures"]
+                ),
             )
 
             # Local objective
@@ -194,12 +185,7 @@ class SubOpt(ExplicitComponent):
             p.model.add_objective("WCF.WCF")
 
             # Add constraints
-            p.model.add_constraint("con_theta", upper=0.0, lower=-0.04)
-            p.model.add_constraint("con_sigma1", upper=0.0)
-            p.model.add_constraint("con_sigma2", upper=0.0)
-            p.model.add_constraint("con_sigma3", upper=0.0)
-            p.model.add_constraint("con_sigma4", upper=0.0)
-            p.model.add_constraint("con_sigma5", upper=0.0)
+            p.model.add_constraint("constraints.con", upper=0.0)
 
             # Final setup
             p.setup()
@@ -269,7 +255,8 @@ class SubOpt(ExplicitComponent):
             )
 
             # Disciplinary analysis
-            p.model.add_subsystem("aerodynamics", Aerodynamics(self.options["scalers"]))
+            p.model.add_subsystem("atmosphere", Atmosphere(self.options["scalers"]))
+            p.model.add_subsystem("aerodynamics", Aerodynamics(self.options["scalers"], self.options["pf"]))
 
             # Local constraint functions -> N.B. The dpdx constraint is moved to the system-level
             # p.model.add_subsystem('constraints',
@@ -288,7 +275,9 @@ class SubOpt(ExplicitComponent):
             p.model.connect("Sref_hat", "map_design_vector.Sref_hat")
 
             # Aerodynamics component inputs
-            p.model.connect("map_design_vector.z", "aerodynamics.z")
+            p.model.connect("map_design_vector.z", ["atmosphere.z", "aerodynamics.z"])
+            p.model.connect("atmosphere.V", "aerodynamics.V")
+            p.model.connect("atmosphere.rho", "aerodynamics.rho")
             p.model.connect("x_aer", "aerodynamics.x_aer")
             p.model.connect("ESF_hat", "aerodynamics.ESF")
             p.model.connect("WT_hat", "aerodynamics.WT")
@@ -394,16 +383,15 @@ class SubOpt(ExplicitComponent):
             )
 
             # Disciplinary analysis
-            p.model.add_subsystem("propulsion", Propulsion(self.options["scalers"]))
+            p.model.add_subsystem("propulsion", Propulsion(self.options["scalers"], self.options["pf"]))
 
             # Local constraint functions
-            cnstrnts = [
-                "con_esf = ESF*" + str(self.options["scalers"]["ESF"]) + "-1.5",
-                "con_temp = Temp*" + str(self.options["scalers"]["Temp"]) + "-1.02",
-                "con_dt=DT",
-            ]
-
-            p.model.add_subsystem("constraints", ExecComp(cnstrnts))
+            p.model.add_subsystem(
+                "constraints",
+                SSBJConstraints(
+                    self.options["scalers"], SUBOPT_CONSTRAINTS["propulsion"]
+                ),
+            )
 
             # Local objective
             p.model.add_subsystem("WCF", ExecComp("WCF = w_WE*WE + w_ESF*ESF"))
@@ -462,9 +450,7 @@ class SubOpt(ExplicitComponent):
             p.model.add_objective("WCF.WCF")
 
             # Add constraints
-            p.model.add_constraint("constraints.con_esf", upper=0.0, lower=-1.0)
-            p.model.add_constraint("constraints.con_temp", upper=0.0)
-            p.model.add_constraint("constraints.con_dt", upper=0.0)
+            p.model.add_constraint("constraints.con", upper=0.0)
 
             # Final setup
             p.setup()
@@ -574,6 +560,7 @@ class SsbjBLISS2000(Group):
         self.options.declare("des_vars")
         self.options.declare("subsystems")
         self.options.declare("scalers")
+        self.options.declare("pf")
         self.options.declare("loop_number")
 
     def setup(self):
@@ -619,6 +606,11 @@ class SsbjBLISS2000(Group):
 
         # Add system-level analyses
         # Performance analysis
+        self.add_subsystem(
+            "atmosphere",
+            Atmosphere(self.options["scalers"]),
+            promotes_inputs=[("z", "z_sh")],
+        )
         self.add_subsystem(
             "performance",
             Performance(self.options["scalers"]),
@@ -637,14 +629,15 @@ class SsbjBLISS2000(Group):
         self.add_subsystem("consistency_constraints", ExecComp(cons_cons_eqs))
 
         # dpdx constraint at system level
-        self.add_subsystem("dpdxcalc", DpdxCalc(self.options["scalers"]))
+        self.add_subsystem("dpdxcalc", DpdxCalc(self.options["scalers"], self.options["pf"]))
         self.add_subsystem(
             "constraints",
-            ExecComp(
-                "con_dpdx = dpdx*" + str(self.options["scalers"]["dpdx"]) + "-1.04"
+            SSBJConstraints(
+                self.options["scalers"], SUBOPT_CONSTRAINTS["aerodynamics"]
             ),
         )
         self.connect("z_sh", "dpdxcalc.z0", src_indices=[0])
+        self.connect("atmosphere.theta", "performance.theta")
         self.connect("dpdxcalc.dpdx", "constraints.dpdx")
 
         # Connect variables correctly
@@ -906,7 +899,7 @@ def get_des_vars_and_qois(discipline):
     return relevant_des_vars, relevant_qois
 
 
-def get_optimized_subsystem(discipline, des_vars, scalers, opt_driver):
+def get_optimized_subsystem(discipline, des_vars, scalers, pf, opt_driver):
     """Method to run the optimizations of a subsystem based on a DOE.
 
     :param discipline: name of the discipline (structures, aerodynamics, propulsion)
@@ -915,6 +908,8 @@ def get_optimized_subsystem(discipline, des_vars, scalers, opt_driver):
     :type des_vars: dict
     :param scalers: scalers of all the system values
     :type scalers: dict
+    :param pf: polynomial function reference state
+    :type pf: PolynomialFunction
     :param opt_driver: type of optimization driver
     :type opt_driver: Driver
     :return: tuple with the sample and result values for all optimized subsystems
@@ -938,7 +933,7 @@ def get_optimized_subsystem(discipline, des_vars, scalers, opt_driver):
     # Add SubOpt() group to the problem
     p.model.add_subsystem(
         "sub_opt",
-        SubOpt(discipline=discipline, scalers=scalers, driver=opt_driver),
+        SubOpt(discipline=discipline, scalers=scalers, pf=pf, driver=opt_driver),
         promotes_outputs=["*"],
     )
 
@@ -1062,7 +1057,7 @@ def get_optimized_subsystem(discipline, des_vars, scalers, opt_driver):
     return sample_values, result_values
 
 
-def run_system_optimization(des_vars, subsystems, scalers, loop_number):
+def run_system_optimization(des_vars, subsystems, scalers, pf, loop_number):
     """Method to run the top-level system optimization based on the disciplinary surrogate models.
 
     :param des_vars: definition of design variables
@@ -1071,6 +1066,8 @@ def run_system_optimization(des_vars, subsystems, scalers, loop_number):
     :type subsystems: dict
     :param scalers: scalers of all the system values
     :type scalers: dict
+    :param pf: polynomial function reference state
+    :type pf: PolynomialFunction
     :param loop_number: number of the BLISS iteration
     :type loop_number: int
     :return: tuple with Problem object and driver status
@@ -1083,6 +1080,7 @@ def run_system_optimization(des_vars, subsystems, scalers, loop_number):
         des_vars=des_vars,
         subsystems=subsystems,
         scalers=scalers,
+        pf=pf,
         loop_number=loop_number,
     )
 
@@ -1109,7 +1107,7 @@ def run_system_optimization(des_vars, subsystems, scalers, loop_number):
     model.add_constraint("consistency_constraints.gc_Theta", equals=0.0)
     model.add_constraint("consistency_constraints.gc_ESF", equals=0.0)
     model.add_constraint("consistency_constraints.gc_WT_L", equals=0.0)
-    model.add_constraint("constraints.con_dpdx", upper=0.0)
+    model.add_constraint("constraints.con", upper=0.0)
 
     # Add recorder
     recorder = SqliteRecorder(
@@ -1165,7 +1163,7 @@ def run_system_optimization(des_vars, subsystems, scalers, loop_number):
     print("gc_Theta=", prob["consistency_constraints.gc_Theta"])
     print("gc_ESF=", prob["consistency_constraints.gc_ESF"])
     print("gc_WT_L=", prob["consistency_constraints.gc_WT_L"])
-    print("c_dpdx=", prob["constraints.con_dpdx"])
+    print("c_dpdx=", prob["constraints.con"])
     print("- - - - - - - - - - - - - - - - - - - - - - - - - -")
 
     return prob, prob.driver.fail
@@ -1339,7 +1337,7 @@ if __name__ == "__main__":
     print("Initializing overall system...")
 
     # Initialize SSBJ problem to get the right scalers
-    scalers = init_ssbj_mda()
+    scalers, pf = init_ssbj_mda()
 
     # Initialize design vectors and bounds
     z_ini = set_initial_values(
@@ -1396,7 +1394,7 @@ if __name__ == "__main__":
             (
                 subsys_dis["samples"][l],
                 subsys_dis["results"][l],
-            ) = get_optimized_subsystem(discipline, z, scalers, ScipyOptimizeDriver())
+            ) = get_optimized_subsystem(discipline, z, scalers, pf, ScipyOptimizeDriver())
 
             # Create surrogate model
             subsys_dis["surrogate_model"][l] = sm = MetaModelUnStructuredComp(
@@ -1416,7 +1414,7 @@ if __name__ == "__main__":
         # Perform system optimization using surrogate models
         print("\nPerforming system optimization using surrogate models..")
         sys_problems[l], fail_bools[l] = run_system_optimization(
-            z, subsystems, scalers, l
+            z, subsystems, scalers, pf, l
         )
 
         # Check optimization results and prepare next loop
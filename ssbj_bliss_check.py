@@ -14,9 +14,10 @@ from openmdao.api import Problem
 from openmdao.api import CaseReader
 
 from ssbj_mda import SSBJ_MDA, init_ssbj_mda
+from ssbj_disciplines.constraints import MDF_CONSTRAINTS, constraint_names
 
 if __name__ == "__main__":
-    scalers = init_ssbj_mda()
+    scalers, pf = init_ssbj_mda()
 
     # Pick up values from recorder
     cr_file_folder_name = 'files'
@@ -32,7 +33,7 @@ if __name__ == "__main__":
     des_vars_sh = case.outputs['z_sh']
 
     prob = Problem()
-    prob.model = SSBJ_MDA(scalers)
+    prob.model = SSBJ_MDA(scalers, pf)
     prob.setup()
     prob['z'] = des_vars_sh
     prob['z'][0] = 1.2
@@ -46,19 +47,8 @@ if __name__ == "__main__":
     print('X_aer_opt=', prob['x_aer'])
     print('X_pro_opt=', prob['x_pro'])
     print('R_opt=', prob['R'])
-    print('con_sigmas:')
-    print('   con_sigma1 (< 0.0)=', prob['con_sigma1'])
-    print('   con_sigma2 (< 0.0)=', prob['con_sigma2'])
-    print('   con_sigma3 (< 0.0)=', prob['con_sigma3'])
-    print('   con_sigma4 (< 0.0)=', prob['con_sigma4'])
-    print('   con_sigma5 (< 0.0)=', prob['con_sigma5'])
-    print('con_theta_up (< 0.0)=', prob['con_theta_up'])
-    print('con_theta_low (< 0.0)=', prob['con_theta_low'])
-    print('con_dpdx (<0.0)=', prob['con_dpdx'])
-    print('con1_esf (<0.0)', prob['con1_esf'])
-    print('con2_esf (<0.0)=', prob['con2_esf'])
-    print('con_temp (<0.0)=', prob['con_temp'])
-    print('con_dt (<0.0)=', prob['con_dt'])
+    for name, con in zip(constraint_names(MDF_CONSTRAINTS), prob['con']):
+        print('{} (< 0.0)='.format(name), con)
     print('Couplings')
     print('L=', prob['L'])
     print('D=', prob['D'])
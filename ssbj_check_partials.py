@@ -0,0 +1,122 @@
+"""
+SSBJ test case - http://ntrs.nasa.gov/archive/nasa/casi.ntrs.nasa.gov/19980234657.pdf
+Python implementation and OpenMDAO integration developed by
+Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
+
+Checks the analytic partials of the disciplines against finite differences
+on a set of design points on both sides of Mach 1 and of the tropopause, and
+the declared sparsity of the partials against the finite difference nonzeros.
+
+Usage: python ssbj_check_partials.py
+"""
+from __future__ import print_function
+import sys
+import numpy as np
+
+from openmdao.api import Problem
+
+from ssbj_mda import init_ssbj_mda
+from ssbj_disciplines import atmosphere, structure, aerodynamics, propulsion, performance, \
+    dpdxcalc
+# pylint: disable=C0103
+
+RTOL = 1e-5
+
+
+def design_points(scalers, n_points=8, seed=0):
+    """
+    Scaled inputs of the disciplines at n_points random design points, with
+    altitudes and Mach numbers spread around 36089 ft and Mach 1.
+    """
+    rng = np.random.RandomState(seed)
+    z = rng.uniform(0.85, 1.15, (n_points, 6))
+    z[:, 1] = rng.uniform(0.6, 1.3, n_points)
+    z[:, 2] = rng.uniform(0.4, 1.3, n_points)
+    values = {'z': z, 'z0': z[:, 0], 'x_str': rng.uniform(0.8, 1.2, (n_points, 2))}
+    for name in ['x_aer', 'x_pro', 'L', 'WE', 'WT', 'Theta', 'ESF', 'D',
+                 'WF', 'fin', 'SFC']:
+        values[name] = rng.uniform(0.9, 1.1, n_points)
+    values['Theta'] = rng.uniform(0.95, 1.05, n_points)
+    # ESF on both sides of the 0.75 lower bound of the Fo2 polynomial, which
+    # clips the ESF values of the usual designs
+    values['ESF'] = rng.uniform(0.5, 1.2, n_points)/scalers['ESF']
+    # Unscaled flight conditions of the design points
+    Z = z*scalers['z']
+    values['V'], values['rho'], values['theta'] = atmosphere.atmosphere(Z[:, 1], Z[:, 2])
+    return values
+
+
+def check_discipline(comp, sparsity, values, step=1e-7):
+    """
+    Returns the largest relative error of the partials of comp, evaluated at all
+    the points in values, against central finite differences of every output
+    with respect to every input, and the list of the (of, wrt) pairs whose finite
+    difference nonzeros differ from the declared sparsity.
+    """
+    n = comp.options['vec_size']
+    prob = Problem()
+    prob.model.add_subsystem('comp', comp, promotes=['*'])
+    prob.setup()
+    prob.final_setup()
+    inputs = [name for name, _ in comp.list_inputs(out_stream=None)]
+    outputs = [name for name, _ in comp.list_outputs(out_stream=None)]
+    for name in inputs:
+        prob[name] = values[name]
+    prob.run_model()
+    # Analytic partials of the declared pairs
+    analytic = prob.check_partials(out_stream=None, compact_print=True)['comp']
+
+    worst = 0.
+    mismatches = []
+    for wrt in inputs:
+        x0 = prob[wrt].copy()
+        J_fd = dict((of, np.zeros((prob[of].size, x0.size))) for of in outputs)
+        for j in range(x0.size):
+            for sign in [1., -1.]:
+                x = x0.copy()
+                x.flat[j] += sign*step
+                prob[wrt] = x
+                prob.run_model()
+                for of in outputs:
+                    J_fd[of][:, j] += sign*prob[of].ravel()/(2.*step)
+        prob[wrt] = x0
+
+        for of in outputs:
+            if (of, wrt) in analytic:
+                J_fwd = analytic[of, wrt]['J_fwd']
+            else:
+                J_fwd = np.zeros_like(J_fd[of])
+            worst = max(worst, np.max(np.abs(J_fwd - J_fd[of])) \
+                        /max(np.max(np.abs(J_fd[of])), 1e-8))
+
+            n_of, n_wrt = J_fd[of].shape[0]//n, J_fd[of].shape[1]//n
+            blocks = J_fd[of].reshape((n, n_of, n, n_wrt))
+            diagonal = blocks[np.arange(n), :, np.arange(n), :]
+            off_diagonal = blocks.copy()
+            off_diagonal[np.arange(n), :, np.arange(n), :] = 0.
+            nonzero = np.any(diagonal != 0., axis=0)
+            declared = np.zeros((n_of, n_wrt), dtype=bool)
+            declared[:, sparsity.get((of, wrt), [])] = True
+            if np.any(off_diagonal != 0.) or np.any(nonzero != declared):
+                mismatches.append((of, wrt))
+    return worst, mismatches
+
+
+if __name__ == "__main__":
+    scalers, pf = init_ssbj_mda()
+    values = design_points(scalers)
+    n_points = len(values['z'])
+
+    failed = False
+    print('{:>14} {:>12}  {}'.format('discipline', 'rel error', 'sparsity'))
+    for module, comp in [(atmosphere, atmosphere.Atmosphere(scalers, vec_size=n_points)),
+                         (structure, structure.Structure(scalers, pf, vec_size=n_points)),
+                         (aerodynamics, aerodynamics.Aerodynamics(scalers, pf, vec_size=n_points)),
+                         (propulsion, propulsion.Propulsion(scalers, pf, vec_size=n_points)),
+                         (performance, performance.Performance(scalers, vec_size=n_points)),
+                         (dpdxcalc, dpdxcalc.DpdxCalc(scalers, pf, vec_size=n_points))]:
+        worst, mismatches = check_discipline(comp, module.SPARSITY, values)
+        failed = failed or worst > RTOL or bool(mismatches)
+        print('{:>14} {:>12.3g}  {}'.format(comp.__class__.__name__, worst,
+                                            mismatches or 'ok'))
+    sys.exit(1 if failed else 0)
@@ -7,14 +7,18 @@ developed by Imco van Gent of TU Delft, Faculty of Aerospace Engineering.
 """
 import datetime
 import math
+from sys import argv
 
 from openmdao.api import *
 
+from ssbj_disciplines.atmosphere import Atmosphere
 from ssbj_disciplines.aerodynamics import Aerodynamics
 from ssbj_disciplines.performance import Performance
 from ssbj_disciplines.propulsion import Propulsion
 from ssbj_disciplines.structure import Structure
+from ssbj_disciplines.constraints import SSBJConstraints, SUBOPT_CONSTRAINTS, constraint_names
 from ssbj_mda import init_ssbj_mda
+from ssbj_pool import WorkerPool, worker
 
 import numpy as np
 
@@ -22,6 +26,25 @@ import numpy as np
 # Set keyword for case reader files (to be used in postprocessing script)
 cr_files_key_word = 'results'  # or use: str(datetime.datetime.now())
 
+# Disciplines of the suboptimizations
+DISCIPLINES = ['structures', 'aerodynamics', 'propulsion']
+
+# System-level inputs of the suboptimizations
+SUBOPT_PARAMS = {'structures': ['z', 'WE_hat', 'WF_hat', 'Theta_hat', 'WT_hat'],
+                 'aerodynamics': ['z', 'ESF_hat', 'WT_hat', 'Theta_hat', 'D_hat', 'fin_hat'],
+                 'propulsion': ['z', 'D_hat', 'ESF_hat', 'SFC_hat', 'WE_hat']}
+
+# System-level outputs of the suboptimizations and their variables in the subproblems
+SUBOPT_OUTPUTS = {'structures': [('z_hat_str', 'z_hat_str'), ('WF', 'structures.WF'),
+                                 ('Theta', 'structures.Theta'), ('WT', 'structures.WT')],
+                  'aerodynamics': [('z_hat_aer', 'z_hat_aer'), ('L', 'aerodynamics.L'),
+                                   ('fin', 'aerodynamics.fin'), ('D', 'aerodynamics.D')],
+                  'propulsion': [('z_hat_pro', 'z_hat_pro'), ('ESF', 'propulsion.ESF'),
+                                 ('SFC', 'propulsion.SFC'), ('WE', 'propulsion.WE')]}
+
+# Absolute step of the finite differences of the suboptimizations
+FD_STEP = 1e-4
+
 
 class SubOpt(ExplicitComponent):
     """Suboptimization component for the CO approach."""
@@ -29,7 +52,29 @@ class SubOpt(ExplicitComponent):
     def initialize(self):
         self.options.declare('discipline')
         self.options.declare('scalers')
+        self.options.declare('pf')
         self.options.declare('driver')
+        self.options.declare('partials', default='kkt', values=['kkt', 'fd'],
+                             desc='Post-optimality sensitivities from the KKT conditions of the '
+                                  'suboptimization or finite differences of whole suboptimizations')
+        self.options.declare('fd_step', default=FD_STEP,
+                             desc="Absolute step of the finite differences with partials='fd'")
+        self.options.declare('fd_form', default='forward', values=['forward', 'backward', 'central'],
+                             desc="Form of the finite differences with partials='fd'")
+        self.options.declare('record', default=True,
+                             desc='Records the suboptimization cases and writes its n2 model in files')
+
+    def declare_subopt_partials(self, discipline):
+        """Declares the partials of the system-level outputs of discipline with respect to its
+        system-level inputs, see SUBOPT_PARAMS and SUBOPT_OUTPUTS."""
+        self.params = SUBOPT_PARAMS[discipline]
+        self.sources = SUBOPT_OUTPUTS[discipline]
+        names = [output for output, _ in self.sources]
+        if self.options['partials'] == 'fd':
+            self.declare_partials(names, self.params, method='fd', step=self.options['fd_step'],
+                                  form=self.options['fd_form'], step_calc='abs')
+        else:
+            self.declare_partials(names, self.params)
 
     def setup(self):
         if self.options['discipline'] == 'structures':
@@ -47,17 +92,10 @@ class SubOpt(ExplicitComponent):
             self.add_output('WT', val=1.0)
 
             # Declare partials
-            self.declare_partials('z_hat_str', ['z', 'WE_hat', 'WF_hat', 'Theta_hat', 'WT_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
-            self.declare_partials('WF', ['z', 'WE_hat', 'WF_hat', 'Theta_hat', 'WT_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
-            self.declare_partials('Theta', ['z', 'WE_hat', 'WF_hat', 'Theta_hat', 'WT_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
-            self.declare_partials('WT', ['z', 'WE_hat', 'WF_hat', 'Theta_hat', 'WT_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
+            self.declare_subopt_partials('structures')
 
             # Set subproblem
-            self.prob = p = Problem()
+            self.prob = p = Problem(comm=self.comm)
 
             # Define the copies so that OpenMDAO can compute derivs w.r.t. these variables
             params = p.model.add_subsystem('params', IndepVarComp(), promotes=['*'])
@@ -75,14 +113,11 @@ class SubOpt(ExplicitComponent):
 
             # Define components
             # Disciplinary analysis
-            p.model.add_subsystem('structures', Structure(self.options['scalers']))
+            p.model.add_subsystem('structures', Structure(self.options['scalers'], self.options['pf']))
 
             # Local constraint functions
-            cstrs = ['con_theta = Theta*' + str(self.options['scalers']['Theta']) + '-1.04']
-            for i in range(5):
-                cstrs.append('con_sigma' + str(i + 1) + ' = sigma[' + str(i) + ']*' +
-                             str(self.options['scalers']['sigma'][i]) + '-1.09')
-            p.model.add_subsystem('constraints', ExecComp(cstrs, sigma=np.zeros(5)), promotes_outputs=['*'])
+            p.model.add_subsystem('constraints', SSBJConstraints(self.options['scalers'],
+                                                                 SUBOPT_CONSTRAINTS['structures']))
 
             # Local objective
             p.model.add_subsystem('J', ExecComp('J = ((z[0]-z_hat_str[0])**2 + (z[3]-z_hat_str[3])**2 +'
@@ -125,13 +160,14 @@ class SubOpt(ExplicitComponent):
             #p.driver.options['debug_print'] = ['desvars', 'objs', 'nl_cons']
 
             # Set recording options
-            recorder = SqliteRecorder(os.path.join('files', 'ssbj_cr_{}_subsystem_str.sql'.format(cr_files_key_word)))
-            p.driver.add_recorder(recorder)
-            p.driver.recording_options['includes'] = []
-            p.driver.recording_options['record_objectives'] = True
-            p.driver.recording_options['record_constraints'] = True
-            p.driver.recording_options['record_desvars'] = True
-            # p.driver.recording_options['record_metadata'] = True
+            if self.options['record']:
+                recorder = SqliteRecorder(os.path.join('files', 'ssbj_cr_{}_subsystem_str.sql'.format(cr_files_key_word)))
+                p.driver.add_recorder(recorder)
+                p.driver.recording_options['includes'] = []
+                p.driver.recording_options['record_objectives'] = True
+                p.driver.recording_options['record_constraints'] = True
+                p.driver.recording_options['record_desvars'] = True
+                # p.driver.recording_options['record_metadata'] = True
 
             # Add design variables
             p.model.add_design_var('x_str', lower=np.array([0.4, 0.75]), upper=np.array([1.6, 1.25]))
@@ -143,19 +179,15 @@ class SubOpt(ExplicitComponent):
             p.model.add_objective('J.J')
 
             # Add constraints
-            p.model.add_constraint('con_theta', upper=0.0, lower=-0.04)
-            p.model.add_constraint('con_sigma1', upper=0.0)
-            p.model.add_constraint('con_sigma2', upper=0.0)
-            p.model.add_constraint('con_sigma3', upper=0.0)
-            p.model.add_constraint('con_sigma4', upper=0.0)
-            p.model.add_constraint('con_sigma5', upper=0.0)
+            p.model.add_constraint('constraints.con', upper=0.0)
 
             # Final setup
             p.setup()
             p.final_setup()
 
             # n2 model
-            n2(p, outfile=os.path.join('files', 'co_n2_struc.html'), show_browser=False)
+            if self.options['record']:
+                n2(p, outfile=os.path.join('files', 'co_n2_struc.html'), show_browser=False)
 
         elif self.options['discipline'] == 'aerodynamics':
             # Add system-level inputs (N.B. L_hat is not used, instead L_hat = W_hat is assumed)
@@ -173,17 +205,10 @@ class SubOpt(ExplicitComponent):
             self.add_output('D', val=1.0)
 
             # Declare partials
-            self.declare_partials('z_hat_aer', ['z', 'ESF_hat', 'WT_hat', 'Theta_hat', 'D_hat', 'fin_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
-            self.declare_partials('L', ['z', 'ESF_hat', 'WT_hat', 'Theta_hat', 'D_hat', 'fin_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
-            self.declare_partials('fin', ['z', 'ESF_hat', 'WT_hat', 'Theta_hat', 'D_hat', 'fin_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
-            self.declare_partials('D', ['z', 'ESF_hat', 'WT_hat', 'Theta_hat', 'D_hat', 'fin_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
+            self.declare_subopt_partials('aerodynamics')
 
             # Set subproblem
-            self.prob = p = Problem()
+            self.prob = p = Problem(comm=self.comm)
 
             # Define the copies so that OpenMDAO can compute derivs w.r.t. these variables
             params = p.model.add_subsystem('params', IndepVarComp(), promotes=['*'])
@@ -201,11 +226,12 @@ class SubOpt(ExplicitComponent):
 
             # Define components
             # Disciplinary analysis
-            p.model.add_subsystem('aerodynamics', Aerodynamics(self.options['scalers']))
+            p.model.add_subsystem('atmosphere', Atmosphere(self.options['scalers']))
+            p.model.add_subsystem('aerodynamics', Aerodynamics(self.options['scalers'], self.options['pf']))
 
             # Local constraint functions
-            p.model.add_subsystem('constraints',
-                                  ExecComp('con_dpdx = dpdx*' + str(self.options['scalers']['dpdx']) + '-1.04'))
+            p.model.add_subsystem('constraints', SSBJConstraints(self.options['scalers'],
+                                                                 SUBOPT_CONSTRAINTS['aerodynamics']))
 
             # Local objective
             p.model.add_subsystem('J', ExecComp('J = (sum((z-z_hat_aer)**2) + (fin_hat-fin)**2 + (D_hat-D)**2 + '
@@ -213,7 +239,9 @@ class SubOpt(ExplicitComponent):
 
             # Connect variables in sub-problem
             # Aerodynamics component inputs
-            p.model.connect('z_hat_aer', 'aerodynamics.z')
+            p.model.connect('z_hat_aer', ['atmosphere.z', 'aerodynamics.z'])
+            p.model.connect('atmosphere.V', 'aerodynamics.V')
+            p.model.connect('atmosphere.rho', 'aerodynamics.rho')
             p.model.connect('x_aer', 'aerodynamics.x_aer')
             p.model.connect('ESF_hat', 'aerodynamics.ESF')
             p.model.connect('WT_hat', 'aerodynamics.WT')
@@ -246,13 +274,14 @@ class SubOpt(ExplicitComponent):
             #p.driver.options['debug_print'] = ['desvars', 'objs', 'nl_cons']
 
             # Set recording options
-            recorder = SqliteRecorder(os.path.join('files', 'ssbj_cr_{}_subsystem_aer.sql'.format(cr_files_key_word)))
-            p.driver.add_recorder(recorder)
-            p.driver.recording_options['includes'] = []
-            p.driver.recording_options['record_objectives'] = True
-            p.driver.recording_options['record_constraints'] = True
-            p.driver.recording_options['record_desvars'] = True
-            # p.driver.recording_options['record_metadata'] = True
+            if self.options['record']:
+                recorder = SqliteRecorder(os.path.join('files', 'ssbj_cr_{}_subsystem_aer.sql'.format(cr_files_key_word)))
+                p.driver.add_recorder(recorder)
+                p.driver.recording_options['includes'] = []
+                p.driver.recording_options['record_objectives'] = True
+                p.driver.recording_options['record_constraints'] = True
+                p.driver.recording_options['record_desvars'] = True
+                # p.driver.recording_options['record_metadata'] = True
 
             # Add design variables
             p.model.add_design_var('x_aer', lower=0.75, upper=1.25)
@@ -263,14 +292,15 @@ class SubOpt(ExplicitComponent):
             p.model.add_objective('J.J')
 
             # Add constraints
-            p.model.add_constraint('constraints.con_dpdx', upper=0.0)
+            p.model.add_constraint('constraints.con', upper=0.0)
 
             # Final setup
             p.setup()
             p.final_setup()
 
             # n2 model
-            n2(p, outfile=os.path.join('files', 'co_n2_aero.html'), show_browser=False)
+            if self.options['record']:
+                n2(p, outfile=os.path.join('files', 'co_n2_aero.html'), show_browser=False)
         elif self.options['discipline'] == 'propulsion':
             # Add system-level inputs
             self.add_input('z', val=np.ones(6))
@@ -286,17 +316,10 @@ class SubOpt(ExplicitComponent):
             self.add_output('WE', val=1.0)
 
             # Declare partials
-            self.declare_partials('z_hat_pro', ['z', 'D_hat', 'ESF_hat', 'SFC_hat', 'WE_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
-            self.declare_partials('ESF', ['z', 'D_hat', 'ESF_hat', 'SFC_hat', 'WE_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
-            self.declare_partials('SFC', ['z', 'D_hat', 'ESF_hat', 'SFC_hat', 'WE_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
-            self.declare_partials('WE', ['z', 'D_hat', 'ESF_hat', 'SFC_hat', 'WE_hat'],
-                                  method='fd', step=1e-4, step_calc='abs')
+            self.declare_subopt_partials('propulsion')
 
             # Set subproblem
-            self.prob = p = Problem()
+            self.prob = p = Problem(comm=self.comm)
 
             # Define the copies so that OpenMDAO can compute derivs w.r.t. these variables
             params = p.model.add_subsystem('params', IndepVarComp(), promotes=['*'])
@@ -313,14 +336,11 @@ class SubOpt(ExplicitComponent):
 
             # Define components
             # Disciplinary analysis
-            p.model.add_subsystem('propulsion', Propulsion(self.options['scalers']))
+            p.model.add_subsystem('propulsion', Propulsion(self.options['scalers'], self.options['pf']))
 
             # Local constraint functions
-            cnstrnts = ['con_esf = ESF*' + str(self.options['scalers']['ESF']) + '-1.5',
-                        'con_temp = Temp*' + str(self.options['scalers']['Temp']) + '-1.02',
-                        'con_dt=DT']
-
-            p.model.add_subsystem('constraints', ExecComp(cnstrnts))
+            p.model.add_subsystem('constraints', SSBJConstraints(self.options['scalers'],
+                                                                 SUBOPT_CONSTRAINTS['propulsion']))
 
             # Local objective
             p.model.add_subsystem('J', ExecComp('J = ((z[1]-z_hat_pro[1])**2 + (z[2]-z_hat_pro[2])**2 + '
@@ -362,13 +382,14 @@ class SubOpt(ExplicitComponent):
             #p.driver.options['debug_print'] = ['desvars', 'objs', 'nl_cons']
 
             # Set recording options
-            recorder = SqliteRecorder(os.path.join('files', 'ssbj_cr_{}_subsystem_pro.sql'.format(cr_files_key_word)))
-            p.driver.add_recorder(recorder)
-            p.driver.recording_options['includes'] = []
-            p.driver.recording_options['record_objectives'] = True
-            p.driver.recording_options['record_constraints'] = True
-            p.driver.recording_options['record_desvars'] = True
-            # p.driver.recording_options['record_metadata'] = True
+            if self.options['record']:
+                recorder = SqliteRecorder(os.path.join('files', 'ssbj_cr_{}_subsystem_pro.sql'.format(cr_files_key_word)))
+                p.driver.add_recorder(recorder)
+                p.driver.recording_options['includes'] = []
+                p.driver.recording_options['record_objectives'] = True
+                p.driver.recording_options['record_constraints'] = True
+                p.driver.recording_options['record_desvars'] = True
+                # p.driver.recording_options['record_metadata'] = True
 
             # Add design variables
             p.model.add_design_var('x_pro', lower=0.18, upper=1.81)
@@ -380,16 +401,15 @@ class SubOpt(ExplicitComponent):
             p.model.add_objective('J.J')
 
             # Add constraints
-            p.model.add_constraint('constraints.con_esf', upper=0.0, lower=-1.)  # TODO: Turn off to avoid issues
-            p.model.add_constraint('constraints.con_temp', upper=0.0)
-            p.model.add_constraint('constraints.con_dt', upper=0.0)
+            p.model.add_constraint('constraints.con', upper=0.0)
 
             # Final setup
             p.setup()
             p.final_setup()
 
             # n2 model
-            n2(p, outfile=os.path.join('files', 'co_n2_prop.html'), show_browser=False)
+            if self.options['record']:
+                n2(p, outfile=os.path.join('files', 'co_n2_prop.html'), show_browser=False)
         else:
             raise IOError('Unknown discipline {} provided in setup function.'.format(self.options['discipline']))
 
@@ -450,12 +470,284 @@ class SubOpt(ExplicitComponent):
         else:
             raise IOError('Unknown discipline {} provided in setup function.'.format(self.options['discipline']))
 
+    def compute_partials(self, inputs, partials):
+        if self.options['partials'] == 'fd':
+            return
+        # The subproblem is at the suboptimum of the inputs after compute
+        jac = optimal_sensitivities(self.prob, self.params, [source for _, source in self.sources])
+        for output, source in self.sources:
+            for param in self.params:
+                partials[output, param] = jac[source, param]
+
+
+def optimal_sensitivities(prob, params, outputs, tol=1e-6, step=1e-6):
+    """Post-optimality sensitivities of the outputs of the optimized problem prob with respect to
+    its parameters params (independent variables which are not design variables).
+
+    The derivatives of the optimal design variables solve the KKT conditions differentiated at the
+    optimum. The active set holds the constraints within tol of a bound, the design variables within
+    tol of a bound staying fixed. The objective J >= 0 is replaced by J**2/2, which has the same
+    optimum and is smooth at J = 0. The Lagrange multipliers are the least squares solution of the
+    stationarity condition. The second derivatives of the Lagrangian with respect to the free design
+    variables are forward differences of step of its analytic gradient, which costs a model run and
+    a total derivative computation per free design variable instead of a suboptimization per
+    parameter.
+    Returns the jacobians of the outputs keyed by (output, param).
+    """
+    driver = prob.driver
+    desvars = prob.model.get_design_vars()
+    cons = prob.model.get_constraints()
+    obj = list(prob.model.get_objectives())[0]
+    names = list(desvars)
+    responses = [obj] + list(cons)
+    wrt = names + list(params)
+
+    def set_x(x):
+        i = 0
+        for name in names:
+            driver.set_design_var(name, x[i:i + desvars[name]['size']])
+            i += desvars[name]['size']
+
+    values = driver.get_design_var_values()
+    x0 = np.hstack([np.reshape(values[name], -1) for name in names])
+    n = x0.size
+    lower = np.hstack([np.broadcast_to(desvars[name]['lower'], desvars[name]['size']) for name in names])
+    upper = np.hstack([np.broadcast_to(desvars[name]['upper'], desvars[name]['size']) for name in names])
+    free = np.flatnonzero((x0 - lower > tol) & (upper - x0 > tol))
+
+    # Totals of the objective, the constraints and the outputs at the optimum
+    of = responses + list(outputs)
+    totals = prob.compute_totals(of=of, wrt=wrt, return_format='array')
+    offsets = np.cumsum([0] + [np.size(prob[name]) for name in of])
+
+    # Active constraints, as rows of totals and signs of sign*(constraint - bound) <= 0, and
+    # whether they are equality constraints
+    active, signs, equality = [], [], []
+    values = driver.get_constraint_values()
+    for k, name in enumerate(responses[1:]):
+        meta = cons[name]
+        value = np.reshape(values[name], -1)
+        for i, v in enumerate(value):
+            if meta['equals'] is not None or np.broadcast_to(meta['upper'], value.size)[i] - v <= tol:
+                sign = 1.
+            elif v - np.broadcast_to(meta['lower'], value.size)[i] <= tol:
+                sign = -1.
+            else:
+                continue
+            active.append(offsets[1 + k] + i)
+            signs.append(sign)
+            equality.append(meta['equals'] is not None)
+    active, signs, equality = np.array(active, dtype=int), np.array(signs), np.array(equality, dtype=bool)
+
+    # Lagrange multipliers, dropping the inequality constraints with a negative one, the
+    # multipliers of the equality constraints having any sign
+    grad_F = float(prob[obj])*totals[0]
+    while True:
+        A = signs[:, np.newaxis]*totals[active]
+        lam = np.linalg.lstsq(A[:, free].T, -grad_F[free], rcond=None)[0]
+        keep = equality | (lam >= -tol)
+        if keep.all():
+            break
+        active, signs, equality = active[keep], signs[keep], equality[keep]
+
+    def grad_L(jac):
+        # Gradient of the Lagrangian with respect to the free design variables and the parameters
+        g = float(prob[obj])*jac[0] + (lam*signs).dot(jac[active])
+        return np.hstack([g[free], g[n:]])
+
+    # Second derivatives of the Lagrangian with respect to the free design variables and to the
+    # free design variables and the parameters
+    g0 = grad_L(totals)
+    H = np.zeros((g0.size, free.size))
+    for c, j in enumerate(free):
+        x = x0.copy()
+        x[j] += step
+        set_x(x)
+        prob.model.run_solve_nonlinear()
+        H[:, c] = (grad_L(prob.compute_totals(of=responses, wrt=wrt, return_format='array')) - g0)/step
+    set_x(x0)
+    prob.model.run_solve_nonlinear()
+
+    # KKT system of the derivatives of the free design variables and of the multipliers
+    m = active.size
+    K = np.block([[H[:free.size], A[:, free].T], [A[:, free], np.zeros((m, m))]])
+    rhs = -np.vstack([H[free.size:].T, A[:, n:]])
+    dx = np.zeros((n, totals.shape[1] - n))
+    dx[free] = np.linalg.lstsq(K, rhs, rcond=None)[0][:free.size]
+
+    # Chain rule to the outputs
+    jac = {}
+    rows = totals[offsets[len(responses)]:]
+    doutputs = rows[:, n:] + rows[:, :n].dot(dx)
+    i = 0
+    for name in outputs:
+        size = np.size(prob[name])
+        j = 0
+        for param in params:
+            size_p = np.size(prob[param])
+            jac[name, param] = doutputs[i:i + size, j:j + size_p]
+            j += size_p
+        i += size
+    return jac
+
+
+def _init_worker(scalers, pf, driver_class):
+    """Stores the options of the SubOpt components of the worker process, whose subproblems are set
+    up at their first use."""
+    worker['options'] = dict(scalers=scalers, pf=pf, driver=driver_class())
+
+
+def _worker_subopt(discipline, inputs, design):
+    """SubOpt component of discipline of the worker process, with its subproblem at the system-level
+    inputs and at the design variables of the dict design (its initial design when None), so that the
+    results do not depend on the tasks run before by the worker."""
+    if discipline not in worker:
+        prob = Problem()
+        prob.model.add_subsystem('subopt', SubOpt(discipline=discipline, record=False,
+                                                  **worker['options']))
+        prob.setup()
+        prob.final_setup()
+        p = prob.model.subopt.prob
+        worker[discipline] = (prob.model.subopt,
+                               dict((name, p[name].copy()) for name in p.model.get_design_vars()))
+    subopt, initial = worker[discipline]
+    p = subopt.prob
+    for name, value in inputs.items():
+        p[name] = value
+    for name, value in (design or initial).items():
+        p[name] = value
+    return subopt
+
+
+def _optimize(task):
+    """Runs the suboptimization of the task (discipline, inputs, start design) in the worker process.
+    Returns its system-level outputs and its optimal design."""
+    p = _worker_subopt(*task).prob
+    p.run_driver()
+    outputs = dict((output, p[source].copy()) for output, source in SUBOPT_OUTPUTS[task[0]])
+    return outputs, dict((name, p[name].copy()) for name in p.model.get_design_vars())
+
+
+def _sensitivities(task):
+    """Post-optimality sensitivities of the suboptimization at the optimal design of the task
+    (discipline, inputs, optimal design) in the worker process, keyed by (output, input)."""
+    subopt = _worker_subopt(*task)
+    subopt.prob.model.run_solve_nonlinear()
+    jac = optimal_sensitivities(subopt.prob, subopt.params, [source for _, source in subopt.sources])
+    return dict(((output, param), jac[source, param])
+                for output, source in subopt.sources for param in subopt.params)
+
+
+class SubOptPool(ExplicitComponent):
+    """Suboptimizations of the three disciplines run concurrently on a WorkerPool, each process
+    owning its subproblems. The partials are computed on the pool too: the post-optimality
+    sensitivities of each discipline or all the finite difference suboptimizations at once.
+    The pool starts at the first suboptimizations and stops at close, by Problem.cleanup or at the
+    exit of a with statement, otherwise at exit. As for the WorkerPool, a single worker or, by
+    default, a single processor runs the suboptimizations in this process."""
+
+    def initialize(self):
+        self.options.declare('scalers')
+        self.options.declare('pf')
+        self.options.declare('driver')
+        self.options.declare('partials', default='kkt', values=['kkt', 'fd'],
+                             desc='Partials of the suboptimizations, see SubOpt')
+        self.options.declare('max_workers', default=None, allow_none=True,
+                             desc='Number of processes, the number of processors by default')
+        self.pool = None
+
+    def setup(self):
+        # Optimal designs of the last suboptimizations, their next start points
+        self.designs = dict.fromkeys(DISCIPLINES)
+        self.optima = {}
+        params = []
+        for discipline in DISCIPLINES:
+            for name in SUBOPT_PARAMS[discipline]:
+                if name not in params:
+                    self.add_input(name, val=np.ones(6) if name == 'z' else 1.0)
+                    params.append(name)
+            for output, _ in SUBOPT_OUTPUTS[discipline]:
+                self.add_output(output, val=np.ones(6) if output.startswith('z_hat') else 1.0)
+            self.declare_partials([output for output, _ in SUBOPT_OUTPUTS[discipline]],
+                                  SUBOPT_PARAMS[discipline])
+
+    def _map(self, function, tasks):
+        if self.pool is None:
+            self.pool = WorkerPool(_init_worker, (self.options['scalers'], self.options['pf'],
+                                                  type(self.options['driver'])),
+                                   self.options['max_workers'])
+        return list(self.pool.map(function, tasks))
+
+    def close(self):
+        """Shuts down the pool of processes, started again by the next suboptimizations."""
+        if self.pool is not None:
+            self.pool.close()
+
+    def cleanup(self):
+        """Also shuts down the pool of processes, called by Problem.cleanup."""
+        super(SubOptPool, self).cleanup()
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _tasks(self, inputs):
+        return [(discipline, dict((name, inputs[name].copy()) for name in SUBOPT_PARAMS[discipline]),
+                 self.designs[discipline]) for discipline in DISCIPLINES]
+
+    def compute(self, inputs, outputs):
+        for discipline, (values, design) in zip(DISCIPLINES, self._map(_optimize, self._tasks(inputs))):
+            self.designs[discipline] = design
+            self.optima[discipline] = values
+            for name, value in values.items():
+                outputs[name] = value
+
+    def compute_partials(self, inputs, partials):
+        tasks = self._tasks(inputs)
+        if self.options['partials'] == 'kkt':
+            for jac in self._map(_sensitivities, tasks):
+                for key, value in jac.items():
+                    partials[key] = value
+            return
+
+        # Finite differences of the suboptimizations from their optima, all on the pool
+        fd_tasks, columns = [], []
+        for discipline, values, design in tasks:
+            for name in SUBOPT_PARAMS[discipline]:
+                for i in range(values[name].size):
+                    perturbed = dict(values)
+                    perturbed[name] = values[name].copy()
+                    perturbed[name].flat[i] += FD_STEP
+                    fd_tasks.append((discipline, perturbed, design))
+                    columns.append((discipline, name, i))
+        jac = {}
+        for (discipline, name, i), (values, _) in zip(columns, self._map(_optimize, fd_tasks)):
+            for output, _ in SUBOPT_OUTPUTS[discipline]:
+                column = (np.reshape(values[output] - self.optima[discipline][output], -1))/FD_STEP
+                jac.setdefault((output, name), np.zeros((column.size, inputs[name].size)))[:, i] = column
+        for key, value in jac.items():
+            partials[key] = value
+
 
 class SsbjCO(Group):
     """Main group for the SSBJ case to run it using Collaborative Optimization."""
     def initialize(self):
         self.options.declare('scalers')
+        self.options.declare('pf')
         self.options.declare('subopt_driver')
+        self.options.declare('subopt_partials', default='kkt', values=['kkt', 'fd'],
+                             desc='Partials of the suboptimizations, see SubOpt')
+        self.options.declare('parallel', default=None, values=[None, 'mpi', 'pool'],
+                             desc='Suboptimizations run one after the other, concurrently in a '
+                                  'ParallelGroup under MPI or on a pool of processes, see SubOptPool')
+        self.options.declare('max_workers', default=None, allow_none=True,
+                             desc='Number of processes of the pool, the number of processors by default')
+        self.options.declare('record', default=True,
+                             desc='Records the suboptimization cases and writes their n2 models in files, '
+                                  'see SubOpt')
 
     def setup(self):
         # Define system-level design variables
@@ -473,17 +765,30 @@ class SsbjCO(Group):
         des_vars.add_output('SFC_hat', val=1.)
 
         # Add suboptimizations
-        self.add_subsystem('subopt_struc', SubOpt(discipline='structures',
-                                                  scalers=self.options['scalers'],
-                                                  driver=self.options['subopt_driver']))
-        self.add_subsystem('subopt_aero', SubOpt(discipline='aerodynamics',
-                                                 scalers=self.options['scalers'],
-                                                 driver=self.options['subopt_driver']))
-        self.add_subsystem('subopt_prop', SubOpt(discipline='propulsion',
+        parallel = self.options['parallel']
+        if parallel == 'pool':
+            self.add_subsystem('subopts', SubOptPool(scalers=self.options['scalers'],
+                                                     pf=self.options['pf'],
+                                                     driver=self.options['subopt_driver'],
+                                                     partials=self.options['subopt_partials'],
+                                                     max_workers=self.options['max_workers']))
+            struc = aero = prop = 'subopts'
+        else:
+            # The ParallelGroup runs the suboptimizations one after the other without MPI
+            group = self.add_subsystem('subopts', ParallelGroup()) if parallel == 'mpi' else self
+            prefix = 'subopts.' if parallel == 'mpi' else ''
+            struc, aero, prop = prefix + 'subopt_struc', prefix + 'subopt_aero', prefix + 'subopt_prop'
+            for name, discipline in [('subopt_struc', 'structures'), ('subopt_aero', 'aerodynamics'),
+                                     ('subopt_prop', 'propulsion')]:
+                group.add_subsystem(name, SubOpt(discipline=discipline,
                                                  scalers=self.options['scalers'],
-                                                 driver=self.options['subopt_driver']))
+                                                 pf=self.options['pf'],
+                                                 driver=self.options['subopt_driver'],
+                                                 partials=self.options['subopt_partials'],
+                                                 record=self.options['record']))
 
         # Add system-level analyses
+        self.add_subsystem('atmosphere', Atmosphere(self.options['scalers']))
         self.add_subsystem('performance', Performance(self.options['scalers']))
         J_tot_expr = 'J = ((z[0]-z_hat_struc[0])**2 + (z[3]-z_hat_struc[3])**2 + (z[4]-z_hat_struc[4])**2 ' \
                      '+ (z[5]-z_hat_struc[5])**2 + (WF_hat-WF_struc)**2 + (Theta_hat-Theta_struc)**2 ' \
@@ -493,39 +798,43 @@ class SsbjCO(Group):
         self.add_subsystem('J', ExecComp(J_tot_expr, z=np.ones(6), z_hat_struc=np.ones(6),
                                          z_hat_aero=np.ones(6), z_hat_prop=np.ones(6)))
 
-        # Connect variables
-        self.connect('z', ['subopt_struc.z', 'subopt_aero.z', 'subopt_prop.z', 'performance.z', 'J.z'])
-        self.connect('D_hat', ['subopt_aero.D_hat', 'subopt_prop.D_hat', 'J.D_hat'])
-        self.connect('WE_hat', ['subopt_struc.WE_hat', 'subopt_prop.WE_hat', 'J.WE_hat'])
-        self.connect('WT_hat', ['performance.WT', 'subopt_struc.WT_hat', 'subopt_aero.WT_hat', 'J.WT_hat'])
-        self.connect('Theta_hat', ['subopt_struc.Theta_hat', 'subopt_aero.Theta_hat', 'J.Theta_hat'])
-        self.connect('WF_hat', ['performance.WF', 'subopt_struc.WF_hat', 'J.WF_hat'])
-        self.connect('ESF_hat', ['subopt_aero.ESF_hat', 'subopt_prop.ESF_hat', 'J.ESF_hat'])
-        self.connect('fin_hat', ['performance.fin', 'subopt_aero.fin_hat', 'J.fin_hat'])
-        self.connect('SFC_hat', ['performance.SFC', 'subopt_prop.SFC_hat', 'J.SFC_hat'])
-        self.connect('subopt_struc.z_hat_str', ['J.z_hat_struc'])
-        self.connect('subopt_struc.WF', ['J.WF_struc'])
-        self.connect('subopt_struc.Theta', ['J.Theta_struc'])
-        self.connect('subopt_struc.WT', ['J.WT_struc'])
-        self.connect('subopt_aero.z_hat_aer', ['J.z_hat_aero'])
-        self.connect('subopt_aero.fin', ['J.fin_aero'])
-        self.connect('subopt_aero.D', ['J.D_aero'])
-        self.connect('subopt_aero.L', ['J.L_aero'])
-        self.connect('subopt_prop.z_hat_pro', ['J.z_hat_prop'])
-        self.connect('subopt_prop.ESF', ['J.ESF_prop'])
-        self.connect('subopt_prop.WE', ['J.WE_prop'])
-        self.connect('subopt_prop.SFC', ['J.SFC_prop'])
-
+        # Connect variables, the pool of suboptimizations having a single input per variable
+        def connect(source, targets):
+            self.connect(source, [target for i, target in enumerate(targets) if target not in targets[:i]])
+
+        connect('z', [struc + '.z', aero + '.z', prop + '.z', 'atmosphere.z', 'performance.z', 'J.z'])
+        self.connect('atmosphere.theta', 'performance.theta')
+        connect('D_hat', [aero + '.D_hat', prop + '.D_hat', 'J.D_hat'])
+        connect('WE_hat', [struc + '.WE_hat', prop + '.WE_hat', 'J.WE_hat'])
+        connect('WT_hat', ['performance.WT', struc + '.WT_hat', aero + '.WT_hat', 'J.WT_hat'])
+        connect('Theta_hat', [struc + '.Theta_hat', aero + '.Theta_hat', 'J.Theta_hat'])
+        connect('WF_hat', ['performance.WF', struc + '.WF_hat', 'J.WF_hat'])
+        connect('ESF_hat', [aero + '.ESF_hat', prop + '.ESF_hat', 'J.ESF_hat'])
+        connect('fin_hat', ['performance.fin', aero + '.fin_hat', 'J.fin_hat'])
+        connect('SFC_hat', ['performance.SFC', prop + '.SFC_hat', 'J.SFC_hat'])
+        self.connect(struc + '.z_hat_str', ['J.z_hat_struc'])
+        self.connect(struc + '.WF', ['J.WF_struc'])
+        self.connect(struc + '.Theta', ['J.Theta_struc'])
+        self.connect(struc + '.WT', ['J.WT_struc'])
+        self.connect(aero + '.z_hat_aer', ['J.z_hat_aero'])
+        self.connect(aero + '.fin', ['J.fin_aero'])
+        self.connect(aero + '.D', ['J.D_aero'])
+        self.connect(aero + '.L', ['J.L_aero'])
+        self.connect(prop + '.z_hat_pro', ['J.z_hat_prop'])
+        self.connect(prop + '.ESF', ['J.ESF_prop'])
+        self.connect(prop + '.WE', ['J.WE_prop'])
+        self.connect(prop + '.SFC', ['J.SFC_prop'])
 
 if __name__ == '__main__':
 
     # Initialize problem
-    scalers = init_ssbj_mda()
+    scalers, pf = init_ssbj_mda()
     prob = Problem()
 
     subopt_driver = ScipyOptimizeDriver()
+    parallel = 'mpi' if '--mpi' in argv else 'pool' if '--pool' in argv else None
 
-    prob.model = model = SsbjCO(scalers=scalers, subopt_driver=subopt_driver)
+    prob.model = model = SsbjCO(scalers=scalers, pf=pf, subopt_driver=subopt_driver, parallel=parallel)
 
     if isinstance(subopt_driver, ScipyOptimizeDriver):
         prob.driver = pyOptSparseDriver()
@@ -585,27 +894,35 @@ if __name__ == '__main__':
     # prob.run_model()
     prob.run_driver()
 
+    # Suboptimizations of this process, on the processes of the pool with parallel='pool'
+    if parallel == 'pool':
+        subopts = []
+        designs = [prob.model.subopts.designs[discipline] for discipline in DISCIPLINES]
+    else:
+        group = prob.model.subopts if parallel == 'mpi' else prob.model
+        subopts = list(group.system_iter(recurse=False, typ=SubOpt))
+        designs = [dict((name, subopt.prob[name]) for name in subopt.prob.model.get_design_vars())
+                   for subopt in subopts]
+
     # Report result in the log
     print('Outcome of analysis:')
     print('\nDesign variables:')
     print('Z_opt=', prob['z'] * scalers['z'])
     print('Z_opt_c=', [[key, float(prob[key] * scalers[key.replace('_hat', '')])] for key in des_vars_def.keys()])
-    print('X_str_opt=', prob.model.subopt_struc.prob['x_str'])
-    print('X_aer_opt=', prob.model.subopt_aero.prob['x_aer'])
-    print('X_pro_opt=', prob.model.subopt_prop.prob['x_pro'])
+    for design in designs:
+        for name, value in design.items():
+            print(name.split('.')[-1] + '_opt=', value)
 
     print('\nObjectives')
     print('R_opt=', prob['performance.R'] * scalers['R'])
-    print('J_opt_str=', prob.model.subopt_struc.prob['J.J'])
-    print('J_opt_aer=', prob.model.subopt_aero.prob['J.J'])
-    print('J_opt_pro=', prob.model.subopt_prop.prob['J.J'])
+    for subopt in subopts:
+        print('J_opt_{}='.format(subopt.options['discipline'][:3]), subopt.prob['J.J'])
 
     print('\nConstraints')
     print('J_sys=', prob['J.J'])
-    for i in range(1, 6):
-        print('con_sigma{}='.format(i), prob.model.subopt_struc.prob['con_sigma{}'.format(i)])
-    print('con_theta=', prob.model.subopt_struc.prob['con_theta'])
-    print('con_dpdx=', prob.model.subopt_aero.prob['constraints.con_dpdx'])
-    print('con_dt=', prob.model.subopt_prop.prob['constraints.con_dt'])
-    print('con_esf=', prob.model.subopt_prop.prob['constraints.con_esf'])
-    print('con_temp=', prob.model.subopt_prop.prob['constraints.con_temp'])
+    for subopt in subopts:
+        names = constraint_names(SUBOPT_CONSTRAINTS[subopt.options['discipline']])
+        for name, con in zip(names, subopt.prob['constraints.con']):
+            print(name + '=', con)
+
+    prob.cleanup()
@@ -12,6 +12,8 @@ from openmdao.recorders.case_reader import CaseReader
 import plotly
 import plotly.graph_objs as go
 
+from ssbj_disciplines.constraints import SUBOPT_CONSTRAINTS, constraint_names
+
 cr_file_folder_name = 'files'
 cr_file_key_word = 'results'
 
@@ -88,12 +90,7 @@ for i, case_key in enumerate(case_keys):
     des_vars_str.append([float(case.outputs['x_str'][0]),
                     float(case.outputs['x_str'][1])])
     objectives_str.append(float(case.outputs['J.J']))
-    constraints_str.append([float(case.outputs['con_sigma1']),
-                        float(case.outputs['con_sigma2']),
-                        float(case.outputs['con_sigma3']),
-                        float(case.outputs['con_sigma4']),
-                        float(case.outputs['con_sigma5']),
-                        float(case.outputs['con_theta'])])
+    constraints_str.append([float(con) for con in case.outputs['constraints.con']])
 iters_str = range(0, len(des_vars_str))
 
 # Plot objective
@@ -106,7 +103,7 @@ plotly.offline.plot(data, filename=os.path.join('files', 'ssbj_co_sub_str_object
 
 # Plot constraint
 data = []
-legend_entries = ['con_sigma1', 'con_sigma1', 'con_sigma1', 'con_sigma1', 'con_sigma1', 'con_theta']
+legend_entries = constraint_names(SUBOPT_CONSTRAINTS['structures'])
 for i in range(0, len(constraints_str[0])):
     trace = go.Scatter(x=iters_str,
                        y=[val[i] for val in constraints_str],
@@ -139,7 +136,7 @@ for i, case_key in enumerate(case_keys):
     case = cr_struc.driver_cases.get_case(case_key)
     des_vars_aer.append([float(case.outputs['x_aer'][0])])
     objectives_aer.append(float(case.outputs['J.J']))
-    constraints_aer.append([float(case.outputs['constraints.con_dpdx'])])
+    constraints_aer.append([float(con) for con in case.outputs['constraints.con']])
 iters_aer = range(0, len(des_vars_aer))
 
 # Plot objective
@@ -152,7 +149,7 @@ plotly.offline.plot(data, filename=os.path.join('files', 'ssbj_co_sub_aer_object
 
 # Plot constraint
 data = []
-legend_entries = ['con_dpdx']
+legend_entries = constraint_names(SUBOPT_CONSTRAINTS['aerodynamics'])
 for i in range(0, len(constraints_aer[0])):
     trace = go.Scatter(x=iters_aer,
                        y=[val[i] for val in constraints_aer],
@@ -184,9 +181,7 @@ for i, case_key in enumerate(case_keys):
     case = cr_struc.driver_cases.get_case(case_key)
     des_vars_prop.append([float(case.outputs['x_pro'][0])])
     objectives_prop.append(float(case.outputs['J.J']))
-    constraints_prop.append([float(case.outputs['constraints.con_esf']),
-                             float(case.outputs['constraints.con_temp']),
-                             float(case.outputs['constraints.con_dt'])])
+    constraints_prop.append([float(con) for con in case.outputs['constraints.con']])
 iters_prop = range(0, len(des_vars_prop))
 
 # Plot objective
@@ -199,7 +194,7 @@ plotly.offline.plot(data, filename=os.path.join('files', 'ssbj_co_sub_prop_objec
 
 # Plot constraint
 data = []
-legend_entries = ['con_esf', 'con_temp', 'con_dt']
+legend_entries = constraint_names(SUBOPT_CONSTRAINTS['propulsion'])
 for i in range(0, len(constraints_prop[0])):
     trace = go.Scatter(x=iters_prop,
                        y=[val[i] for val in constraints_prop],
@@ -0,0 +1,101 @@
+"""
+SSBJ test case - http://ntrs.nasa.gov/archive/nasa/casi.ntrs.nasa.gov/19980234657.pdf
+Python implementation and OpenMDAO integration developed by
+Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
+
+Total derivative coloring of the optimization problems, with the derivative
+mode chosen from the number of linear solves of the colored total Jacobian.
+"""
+from __future__ import print_function
+import os
+import glob
+import hashlib
+import inspect
+import pickle
+import warnings
+
+from openmdao.utils.coloring import Coloring, compute_total_coloring
+
+from ssbj_mda import CACHE_DIR, prune_cache
+# pylint: disable=C0103
+
+MODES = ['fwd', 'rev']
+
+def _coloring_file(prob, coloring_dir):
+    """
+    Coloring file of the set up problem prob and the prefix of the coloring files
+    of the same problem. The prefix depends on the model and on its design variables
+    and responses, the rest of the name on the source of its model and of the
+    disciplines, so that any change of the problem invalidates it.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    sources = [inspect.getsourcefile(type(prob.model))] \
+              + sorted(glob.glob(os.path.join(here, 'ssbj_disciplines', '*.py')))
+    problem = hashlib.sha1(type(prob.model).__name__.encode())
+    for variables in [prob.model.get_design_vars(), prob.model.get_responses()]:
+        for name, meta in sorted(variables.items()):
+            problem.update('{}:{};'.format(name, meta['size']).encode())
+    key = hashlib.sha1(problem.digest())
+    for source in sources:
+        with open(source, 'rb') as f:
+            key.update(f.read())
+    prefix = 'ssbj_coloring_{}_'.format(problem.hexdigest()[:8])
+    return os.path.join(coloring_dir, '{}{}.pkl'.format(prefix, key.hexdigest()[:16])), prefix
+
+def uncolored_solves(prob):
+    """
+    Linear solves per total Jacobian of the set up problem prob without coloring,
+    in each mode.
+    """
+    return {'fwd': sum(meta['size'] for meta in prob.model.get_design_vars().values()),
+            'rev': sum(meta['size'] for meta in prob.model.get_responses().values())}
+
+def total_colorings(prob):
+    """
+    Total colorings of prob in each mode, setting it up again in each mode.
+    """
+    colorings = {}
+    for mode in MODES:
+        prob.setup(mode=mode)
+        prob.final_setup()
+        prob.set_solver_print(level=-1)
+        prob.run_model()
+        colorings[mode] = compute_total_coloring(prob, mode=mode)
+    return colorings
+
+def setup_total_coloring(prob, coloring_dir=CACHE_DIR, check=False):
+    """
+    Sets up prob, whose driver, design variables and responses are declared,
+    with the total coloring and in the mode which need the fewest linear solves.
+    The colorings are computed at the first setup of a problem and the best one
+    is stored in coloring_dir and reused by the next setups, None disables the
+    storage. Returns the mode and the coloring.
+    """
+    prob.setup(mode=MODES[0])
+    prob.final_setup()
+    filename, prefix = _coloring_file(prob, coloring_dir) if coloring_dir is not None else (None, None)
+
+    coloring = None
+    if filename is not None and os.path.exists(filename):
+        try:
+            coloring = Coloring.load(filename)
+        except (IOError, OSError, EOFError, AttributeError, ImportError, RuntimeError,
+                pickle.UnpicklingError):
+            coloring = None
+    if coloring is None:
+        colorings = total_colorings(prob)
+        coloring = colorings[min(MODES, key=lambda mode: colorings[mode].total_solves())]
+        if filename is not None:
+            tmp = '{}.{}.tmp'.format(filename, os.getpid())
+            try:
+                coloring.save(tmp)
+                os.replace(tmp, filename)
+            except (IOError, OSError) as err:
+                warnings.warn('total coloring not stored: {}'.format(err))
+            else:
+                prune_cache(filename, prefix)
+
+    mode = coloring.modes()[0]
+    prob.driver.use_fixed_coloring(coloring)
+    prob.setup(mode=mode, check=check)
+    return mode, coloring
@@ -7,16 +7,21 @@ from __future__ import print_function
 import numpy as np
 
 from openmdao.api import ExplicitComponent
-from .common import PolynomialFunction, CDMIN
+from .common import CDMIN, vec_shape, declare_block_partials
+from .atmosphere import atmosphere
 # pylint: disable=C0103
 
+# Nonzero input entries of each output, other partials are structurally zero
+SPARSITY = {('L', 'WT'): [0],
+            ('D', 'z'): [0, 2, 3, 4, 5], ('D', 'V'): [0], ('D', 'rho'): [0],
+            ('D', 'x_aer'): [0], ('D', 'WT'): [0], ('D', 'Theta'): [0], ('D', 'ESF'): [0],
+            ('fin', 'z'): [0, 2, 3, 4, 5], ('fin', 'V'): [0], ('fin', 'rho'): [0],
+            ('fin', 'x_aer'): [0], ('fin', 'WT'): [0], ('fin', 'Theta'): [0],
+            ('fin', 'ESF'): [0],
+            ('dpdx', 'z'): [0]}
+
 def aerodynamics(pf, x_aer, Z, WT, ESF, Theta):
-    if Z[1] <= 36089.0:
-        V = 1116.39 * Z[2] * np.sqrt(abs(1.0 - 6.875E-6*Z[1]))
-        rho = 2.377E-3 * (1. - 6.875E-6*Z[1])**4.2561
-    else:
-        V = 968.1 * abs(Z[2])
-        rho = 2.377E-3 * 0.2971 * np.exp((36089.0 - Z[1]) / 20806.7)
+    V, rho, _ = atmosphere(Z[1], Z[2])
     CL = WT / (0.5*rho*(V**2)*Z[5])
     Fo2 = pf([ESF, abs(x_aer)], [1, 1], [.25]*2, "Fo2")
 
@@ -37,28 +42,67 @@ def aerodynamics(pf, x_aer, Z, WT, ESF, Theta):
 
     return L, D, fin, dpdx 
 
+def aerodynamics_batch(pf, x_aer, Z, WT, ESF, Theta, V=None, rho=None):
+    """
+    Vectorized aerodynamics over N design points: Z is (N, 6), the other
+    arguments have length N. Speed V and air density rho are computed from
+    the altitude and Mach number of Z when not given.
+    Returns the length-N arrays L, D, fin, dpdx.
+    """
+    Z = np.atleast_2d(Z)
+    x_aer, WT, ESF, Theta = [np.reshape(a, -1) for a in (x_aer, WT, ESF, Theta)]
+    M = Z[:, 2]
+    if V is None or rho is None:
+        V, rho, _ = atmosphere(Z[:, 1], M)
+    CL = WT / (0.5*rho*(V**2)*Z[:, 5])
+    Fo2 = pf.batch(np.column_stack([ESF, abs(x_aer)]), [1, 1], [.25]*2, "Fo2")
+
+    CDmin = CDMIN*Fo2 + 3.05*abs(Z[:, 0])**(5.0/3.0) \
+            * abs(np.cos(Z[:, 4]*np.pi/180.0))**1.5
+    k = np.where(M >= 1,
+                 abs(Z[:, 3]) * (abs(M)**2-1.0) * np.cos(Z[:, 4]*np.pi/180.) \
+                 / (4.* abs(Z[:, 3])* np.sqrt(abs(Z[:, 4]**2 - 1.)) - 2.),
+                 (0.8 * np.pi * abs(Z[:, 3]))**-1)
+
+    Fo3 = pf.batch(Theta[:, None], [5], [.25], "Fo3")
+    CD = (CDmin + k * CL**2) * Fo3
+    D = CD * 0.5 * rho * V**2 * Z[:, 5]
+    fin = WT/D
+    L = WT
+    dpdx = pf.batch(Z[:, 0:1], [1], [.25], "dpdx")
+
+    return L, D, fin, dpdx
+
 class Aerodynamics(ExplicitComponent):
 
-    def __init__(self, scalers):
-        super(Aerodynamics, self).__init__()
+    def __init__(self, scalers, pf, **kwargs):
+        super(Aerodynamics, self).__init__(**kwargs)
         self.scalers = scalers
-        self.pf = PolynomialFunction()
+        self.pf = pf
+
+    def initialize(self):
+        self.options.declare('vec_size', types=int, default=1,
+                             desc='Number of design points evaluated at once')
 
     def setup(self):
+        n = self.options['vec_size']
         # Global Design Variable z=(t/c,h,M,AR,Lambda,Sref)
-        self.add_input('z', val=np.ones(6))
+        self.add_input('z', val=np.ones(vec_shape(n, 6)))
         # Local Design Variable x_aer=Cf
-        self.add_input('x_aer', val=1.0)
+        self.add_input('x_aer', val=np.ones(n))
         # Coupling parameters
-        self.add_input('WT', val=1.0)
-        self.add_input('Theta', val=1.0)
-        self.add_input('ESF', val=1.0)
+        self.add_input('WT', val=np.ones(n))
+        self.add_input('Theta', val=np.ones(n))
+        self.add_input('ESF', val=np.ones(n))
+        # Flight conditions from Atmosphere, not scaled
+        self.add_input('V', val=np.ones(n))
+        self.add_input('rho', val=np.ones(n))
         # Coupling output
-        self.add_output('L', val=1.0)
-        self.add_output('D', val=1.0)
-        self.add_output('fin', val=1.0)
-        self.add_output('dpdx', val=1.0)
-        self.declare_partials('*', '*')
+        self.add_output('L', val=np.ones(n))
+        self.add_output('D', val=np.ones(n))
+        self.add_output('fin', val=np.ones(n))
+        self.add_output('dpdx', val=np.ones(n))
+        declare_block_partials(self, SPARSITY, {'z': 6}, n)
 
     def compute(self, inputs, outputs):
 
@@ -68,7 +112,8 @@ class Aerodynamics(ExplicitComponent):
         ESF = inputs['ESF']*self.scalers['ESF']
         Theta = inputs['Theta']*self.scalers['Theta']
 
-        L, D, fin, dpdx = aerodynamics(self.pf, x_aer, Z, WT, ESF, Theta)
+        L, D, fin, dpdx = aerodynamics_batch(self.pf, x_aer, Z, WT, ESF, Theta,
+                                             inputs['V'], inputs['rho'])
 
         outputs['L'] = L/self.scalers['L']
         outputs['D'] = D/self.scalers['D']
@@ -77,163 +122,99 @@ class Aerodynamics(ExplicitComponent):
 
     def compute_partials(self, inputs, partials):
 
-        Z = inputs['z']*self.scalers['z']
+        n = self.options['vec_size']
+        Z = inputs['z'].reshape((n, 6))*self.scalers['z']
+        x_aer = inputs['x_aer']*self.scalers['x_aer']
         WT = inputs['WT']*self.scalers['WT']
         ESF = inputs['ESF']*self.scalers['ESF']
         Theta = inputs['Theta']*self.scalers['Theta']
+        V = inputs['V']
+        rho = inputs['rho']
 
         # auxiliary computations
-        if Z[1] <= 36089.0:
-            V = 1116.39 * Z[2] * np.sqrt(abs(1.0 - 6.875E-6 * Z[1]))
-            rho = 2.377E-3 * (1. - 6.875E-6*Z[1])**4.2561
-        else:
-            V = 968.1 * abs(Z[2])
-            rho = 2.377E-3*0.2971*np.exp((36089.0 - Z[1])/20806.7)
-        CL = WT / (0.5*rho*(V**2)*Z[5])
-        s_new = [ESF, abs(inputs['x_aer'])]
-        Fo2 = self.pf(s_new, [1, 1], [.25]*2, "Fo2")
-
-        CDmin = CDMIN * Fo2 + 3.05 * abs(Z[0])**(5.0/3.0) \
-                * abs(np.cos(Z[4]*np.pi/180.0))**1.5
-        if Z[2] >= 1.:
-            k = abs(Z[3]) * (abs(Z[2])**2-1.0) * np.cos(Z[4]*np.pi/180.) \
-                / (4. * abs(Z[3])* np.sqrt(abs(Z[4]**2 - 1.) - 2.))
-        else:
-            k = (0.8 * np.pi * abs(Z[3]))**-1
-
-        Fo3 = self.pf([Theta], [5], [.25], "Fo3")
+        M = Z[:, 2]
+        supersonic = M >= 1.
+        q = 0.5*rho*V**2
+        dqdV = rho*V
+        dqdrho = 0.5*V**2
+
+        CL = WT / (q*Z[:, 5])
+        Fo2, dFo2 = self.pf.batch(np.column_stack([ESF, abs(x_aer)]),
+                                  [1, 1], [.25]*2, "Fo2", deriv=True)
+
+        cos = np.cos(Z[:, 4]*np.pi/180.)
+        sin = np.sin(Z[:, 4]*np.pi/180.)
+        CDmin = CDMIN * Fo2 + 3.05 * abs(Z[:, 0])**(5.0/3.0) * abs(cos)**1.5
+        # k = AR*u/w on the supersonic side
+        AR = abs(Z[:, 3])
+        s = np.sqrt(abs(Z[:, 4]**2 - 1.))
+        u = (abs(M)**2-1.0) * cos
+        w = 4.* AR * s - 2.
+        k = np.where(supersonic, AR * u / w, (0.8 * np.pi * AR)**-1)
+        dkdM = np.where(supersonic, AR * 2.0*abs(M) * cos / w, 0.0)
+        dkdAR = np.where(supersonic, -2.0 * u / w**2, -1.0/(0.8 * np.pi * AR**2))
+        dudLambda = -(abs(M)**2-1.0) * sin * np.pi/180.
+        dwdLambda = 4.0 * AR * Z[:, 4] * np.sign(Z[:, 4]**2 - 1.) / s
+        dkdLambda = np.where(supersonic, AR * (dudLambda*w - u*dwdLambda) / w**2, 0.0)
+
+        Fo3, dFo3 = self.pf.batch(Theta[:, None], [5], [.25], "Fo3", deriv=True)
         CD = (CDmin + k * CL**2) * Fo3
-        D = CD * 0.5 * rho * V**2 * Z[5]
+        D = CD * q * Z[:, 5]
 
         # dL #################################################################
-        partials['L', 'x_aer'] = np.array([[0.0]])
-        partials['L', 'z'] = np.zeros((1, 6))
-        partials['L', 'WT'] = np.array([[1.0]])
-        partials['L', 'Theta'] = np.array([[0.0]])
-        partials['L', 'ESF'] = np.array([[0.0]])
+        partials['L', 'WT'] = np.ones(n)/self.scalers['L']*self.scalers['WT']
 
         # dD #################################################################
-        S_shifted, Ai, Aij = self.pf(s_new,
-                                          [1, 1], [.25]*2, "Fo2", deriv=True)
-        if abs(inputs['x_aer'])/self.pf.d['Fo2'][1]>=0.75 and \
-           abs(inputs['x_aer'])/self.pf.d['Fo2'][1]<=1.25:	  
-            dSCfdCf = 1.0/self.pf.d['Fo2'][1]
-        else:
-            dSCfdCf = 0.0
-        dSCfdCf2 = 2.0*S_shifted[0, 1]*dSCfdCf
-        dFo1dCf = Ai[1]*dSCfdCf+0.5*Aij[1, 1]*dSCfdCf2+Aij[0, 1]*S_shifted[0, 1]*dSCfdCf
-        dDdCf = 0.5*rho*V**2*Z[5]*Fo3*CDMIN*dFo1dCf
-        partials['D', 'x_aer'] = np.array([[dDdCf/self.scalers['D']]]).reshape((1, 1))
-        dDdtc = 0.5*rho*V**2*Z[5]*5.0/3.0*3.05*Fo3*Z[0]**(2./3.)*np.cos(Z[4]*np.pi/180.)**(3./2.)
-        if Z[1] <= 36089.0:
-            drhodh = 2.377E-3 * 4.2561 * 6.875E-6* (1. - 6.875E-6 * Z[1])**3.2561
-            dVdh = 6.875E-6*1116.39*Z[2]/2* (1.0 - 6.875E-6 * Z[1])**-0.5
-        else:
-            drhodh = 2.377E-3 * 0.2971 * (-1.0)/20806.7 *np.exp((36089.0 - Z[1]) / 20806.7)
-            dVdh = 0.0
-        dVdh2 = 2.0*dVdh*V
-        dCDdh = -k*Fo3*CL*WT/(0.5*Z[5])*(V**-2*rho**-2*drhodh+rho**-1*V**-3*dVdh)
-        dDdh = 0.5*Z[5]*(drhodh*CDmin*V**2+rho*dCDdh*V**2+rho*CDmin*dVdh2)
-        if Z[1] <= 36089.0:
-            dVdM = 1116.39*(1.0 - 6.875E-6 * Z[1])**-0.5
-        else:
-            dVdM = 968.1
-        if Z[2] >= 1:
-            dkdM = abs(Z[3]) * (2.0*abs(Z[2])) * np.cos(Z[4]*np.pi/180.) \
-                / (4. * abs(Z[3])* np.sqrt(abs(Z[4]**2 - 1.) - 2.))
-        else:
-            dkdM = 0.0
-        dVdM2 = 2.0*V*dVdM
-        dCLdM = -2.0*WT/(0.5*Z[5])*rho**-1*V**-3*dVdM
-        dCDdM = Fo3*(2.0*k*CL*dCLdM+CL**2*dkdM)
-        dDdM = 0.5*rho*Z[5]*(CD*dVdM2+V**2*dCDdM)
-        if Z[2] >= 1:
-            dkdAR = 0.0
-        else:
-            dkdAR = -1.0/(0.8 * np.pi * abs(Z[3])**2)
-        dCDdAR = Fo3*CL**2*dkdAR
-        dDdAR = 0.5*rho*Z[5]*V**2*dCDdAR
-        dCDmindLambda = -3.05*3.0/2.0*Z[0]**(5.0/3.0)\
-            *np.cos(Z[4]*np.pi/180.)**0.5*np.pi/180.*np.sin(Z[4]*np.pi/180.)
-        if Z[2] >= 1:
-            u = (Z[2]**2-1.)*np.cos(Z[4]*np.pi/180.)
-            up = -np.pi/180.0*(Z[2]**2-1.)*np.sin(Z[4]*np.pi/180.)
-            v = 4.0*np.sqrt(Z[4]**2-1.0)-2.0
-            vp = 4.0*Z[4]*(Z[4]**2-1.0)**-0.5
-            dkdLambda = (up*v-u*vp)/v**2
-        else:
-            dkdLambda = 0.0
-        dCDdLambda = Fo3*(dCDmindLambda+CL**2*dkdLambda)
-        dDdLambda = 0.5*rho*Z[5]*V**2*dCDdLambda
-        dCLdSref2 = 2.0*CL*-WT/(0.5*rho*V**2*Z[5]**2)
-        dCDdSref = Fo3*k*dCLdSref2
-        dDdSref = 0.5*rho*V**2*(CD+Z[5]*dCDdSref)
-        partials['D', 'z'] = np.array([np.append(dDdtc/self.scalers['D'], [dDdh/self.scalers['D'],
-                                 dDdM/self.scalers['D'], dDdAR/self.scalers['D'],
-                                 dDdLambda/self.scalers['D'],
-                                 dDdSref/self.scalers['D']])])*self.scalers['z']
-        dDdWT = Fo3*k*2.0*WT/(0.5*rho*V**2*Z[5])
-        partials['D', 'WT'] = np.array([[dDdWT/self.scalers['D']*self.scalers['WT']]])
-        S_shifted, Ai, Aij = self.pf([Theta], [5], [.25], "Fo3", deriv=True)
-        if Theta/self.pf.d['Fo3'][0]>=0.75 and Theta/self.pf.d['Fo3'][0]<=1.25: 
-            dSThetadTheta = 1.0/self.pf.d['Fo3'][0]
-        else:
-            dSThetadTheta = 0.0
-        dSThetadTheta2 = 2.0*S_shifted[0, 0]*dSThetadTheta
-        dFo3dTheta = Ai[0]*dSThetadTheta + 0.5*Aij[0, 0]*dSThetadTheta2
-        dCDdTheta = dFo3dTheta*(CDmin+k*CL**2)
-        dDdTheta = 0.5*rho*V**2*Z[5]*dCDdTheta
-        partials['D', 'Theta'] = np.array(
-            [[dDdTheta/self.scalers['D']*self.scalers['Theta']]]).reshape((1, 1))
-        S_shifted, Ai, Aij = self.pf(s_new,
-                                          [1, 1], [.25]*2, "Fo2", deriv=True)
-        if ESF/self.pf.d['Fo2'][0]>=0.75 and ESF/self.pf.d['Fo2'][0]<=1.25: 							  
-            dSESFdESF = 1.0/self.pf.d['Fo2'][0]
-        else:
-            dSESFdESF = 0.0
-        dSESFdESF2 = 2.0*S_shifted[0, 0]*dSESFdESF
-        dFo2dESF = Ai[0]*dSESFdESF+0.5*Aij[0, 0]*dSESFdESF2 \
-                   + Aij[1, 0]*S_shifted[0, 1]*dSESFdESF
-        dCDdESF = Fo3*CDMIN*dFo2dESF
-        dDdESF = 0.5*rho*V**2*Z[5]*dCDdESF
-        partials['D', 'ESF'] = np.array(
-            [[dDdESF/self.scalers['D']*self.scalers['ESF']]]).reshape((1, 1))
+        dDdCf = q*Z[:, 5]*Fo3*CDMIN*dFo2[:, 1]
+        partials['D', 'x_aer'] = dDdCf/self.scalers['D']*self.scalers['x_aer']
+        dDdtc = q*Z[:, 5]*Fo3*5.0/3.0*3.05*abs(Z[:, 0])**(2./3.)*abs(cos)**1.5
+        # CL = WT/(q*Sref) so that q*dCL/dq = -CL
+        dDdq = Z[:, 5]*(CD - 2.0*Fo3*k*CL**2)
+        dDdV = dDdq*dqdV
+        partials['D', 'V'] = dDdV/self.scalers['D']
+        dDdrho = dDdq*dqdrho
+        partials['D', 'rho'] = dDdrho/self.scalers['D']
+        dDdM = q*Z[:, 5]*Fo3*dkdM*CL**2
+        dDdAR = q*Z[:, 5]*Fo3*dkdAR*CL**2
+        dCDmindLambda = -3.05*1.5*abs(Z[:, 0])**(5.0/3.0)*abs(cos)**0.5*sin*np.pi/180.
+        dDdLambda = q*Z[:, 5]*Fo3*(dCDmindLambda + dkdLambda*CL**2)
+        dDdSref = q*(CD - 2.0*Fo3*k*CL**2)
+        # no altitude column, D depends on h through V and rho only
+        dDdz = np.column_stack([dDdtc, dDdM, dDdAR, dDdLambda, dDdSref]) \
+            *self.scalers['z'][SPARSITY['D', 'z']]
+        partials['D', 'z'] = (dDdz/self.scalers['D']).ravel()
+        dDdWT = 2.0*Fo3*k*CL
+        partials['D', 'WT'] = dDdWT/self.scalers['D']*self.scalers['WT']
+        dDdTheta = q*Z[:, 5]*dFo3[:, 0]*(CDmin + k*CL**2)
+        partials['D', 'Theta'] = dDdTheta/self.scalers['D']*self.scalers['Theta']
+        dDdESF = q*Z[:, 5]*Fo3*CDMIN*dFo2[:, 0]
+        partials['D', 'ESF'] = dDdESF/self.scalers['D']*self.scalers['ESF']
 
         # dpdx ################################################################
-        partials['dpdx', 'x_aer'] = np.array([[0.0]])
-        partials['dpdx', 'z'] = np.zeros((1, 6))
-        S_shifted, Ai, Aij = self.pf([Z[0]], [1], [.25], "dpdx", deriv=True)
-        if Z[0]/self.pf.d['dpdx'][0]>=0.75 and Z[0]/self.pf.d['dpdx'][0]<=1.25:
-            dStcdtc = 1.0/self.pf.d['dpdx'][0]
-        else:
-            dStcdtc = 0.0
-        dStcdtc2 = 2.0*S_shifted[0, 0]*dStcdtc
-        ddpdxdtc = Ai[0]*dStcdtc+0.5*Aij[0, 0]*dStcdtc2
-        partials['dpdx', 'z'][0, 0] = ddpdxdtc*self.scalers['z'][0]/self.scalers['dpdx']
-        partials['dpdx', 'WT'] = np.array([[0.0]])
-        partials['dpdx', 'Theta'] = np.array([[0.0]])
-        partials['dpdx', 'ESF'] = np.array([[0.0]])
-        
+        _, ddpdx = self.pf.batch(Z[:, 0:1], [1], [.25], "dpdx", deriv=True)
+        partials['dpdx', 'z'] = ddpdx[:, 0]/self.scalers['dpdx']*self.scalers['z'][0]
+
         # dfin ###############################################################
-        partials['fin', 'x_aer'] = np.array(
-            [[-dDdCf*WT/D**2/self.scalers['WT']*self.scalers['D']]]).reshape((1, 1))
-        partials['fin', 'z'] = np.array(
-            [-partials['D', 'z'][0]*WT/self.scalers['WT']/D**2*self.scalers['D']**2])
-        partials['fin', 'WT'] = np.array(
-            [[(D-dDdWT*WT)/D**2/self.scalers['WT']*self.scalers['D'] \
-              *self.scalers['WT']]]).reshape((1, 1))
-        partials['fin', 'Theta'] = np.array(
-            [[(-dDdTheta*WT)/D**2/self.scalers['WT']*self.scalers['D'] \
-              *self.scalers['Theta']]]).reshape((1, 1))
-        partials['fin', 'ESF'] = np.array(
-            [[(-dDdESF*WT)/D**2/self.scalers['WT']\
-              *self.scalers['D']*self.scalers['ESF']]]).reshape((1, 1))
+        # fin = WT/D
+        dfindD = -WT/D**2/self.scalers['fin']
+        partials['fin', 'x_aer'] = dfindD*dDdCf*self.scalers['x_aer']
+        partials['fin', 'z'] = (dfindD[:, None]*dDdz).ravel()
+        partials['fin', 'V'] = dfindD*dDdV
+        partials['fin', 'rho'] = dfindD*dDdrho
+        partials['fin', 'WT'] = (1.0/D + dfindD*self.scalers['fin']*dDdWT) \
+            /self.scalers['fin']*self.scalers['WT']
+        partials['fin', 'Theta'] = dfindD*dDdTheta*self.scalers['Theta']
+        partials['fin', 'ESF'] = dfindD*dDdESF*self.scalers['ESF']
 
 if __name__ == "__main__": # pragma: no cover
 
     from openmdao.api import Problem, Group, IndepVarComp 
+    from .reference import polynomial_reference
+    from .atmosphere import Atmosphere
     scalers = {}
     scalers['z'] = np.array([0.05, 45000., 1.6, 5.5, 55.0, 1000.0])
+    scalers['x_aer'] = 1.0
+    scalers['L'] = 49909.58578
     scalers['WT'] = 49909.58578
     scalers['ESF'] = 1.0
     scalers['Theta'] = 0.950978
@@ -241,6 +222,7 @@ if __name__ == "__main__": # pragma: no cover
     scalers['fin'] = 4.093062
     scalers['dpdx'] = 1.0
 
+    pf = polynomial_reference(scalers['z'], np.array([0.25, 1.0]), 1.0, 0.5, scalers['WT'])
     top = Problem()
     top.model.add_subsystem('z_in', IndepVarComp('z', np.array([1.2  ,  1.333,  0.875,  0.45 ,  1.27 ,  1.5])),
                             promotes=['*'])
@@ -248,6 +230,7 @@ if __name__ == "__main__": # pragma: no cover
     top.model.add_subsystem('WT_in', IndepVarComp('WT', 0.89), promotes=['*'])
     top.model.add_subsystem('Theta_in', IndepVarComp('Theta', 0.9975), promotes=['*'])
     top.model.add_subsystem('ESF_in', IndepVarComp('ESF', 1.463), promotes=['*'])
-    top.model.add_subsystem('Aer1', Aerodynamics(scalers, PolynomialFunction()), promotes=['*'])
+    top.model.add_subsystem('Atm1', Atmosphere(scalers), promotes=['*'])
+    top.model.add_subsystem('Aer1', Aerodynamics(scalers, pf), promotes=['*'])
     top.setup()
     top.check_partials(compact_print=True)
@@ -0,0 +1,89 @@
+"""
+SSBJ test case - http://ntrs.nasa.gov/archive/nasa/casi.ntrs.nasa.gov/19980234657.pdf
+Python implementation and OpenMDAO integration developed by
+Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
+"""
+from __future__ import print_function
+import numpy as np
+
+from openmdao.api import ExplicitComponent
+from .common import vec_shape, declare_block_partials
+# pylint: disable=C0103
+
+# Nonzero input entries of each output, other partials are structurally zero
+SPARSITY = {('V', 'z'): [1, 2], ('rho', 'z'): [1], ('theta', 'z'): [1]}
+
+TROPOPAUSE = 36089.0
+
+def atmosphere(h, M):
+    """
+    Speed V (ft/s), air density rho (slug/ft3) and temperature ratio theta
+    at altitude h (ft) and Mach number M, scalars or arrays of the same shape.
+    """
+    troposphere = h <= TROPOPAUSE
+    theta = np.where(troposphere, 1.0 - 6.875E-6*h, 0.7519)
+    V = np.where(troposphere, 1116.39 * M * np.sqrt(abs(theta)), 968.1 * abs(M))
+    rho = np.where(troposphere, 2.377E-3 * abs(theta)**4.2561,
+                   2.377E-3 * 0.2971 * np.exp((TROPOPAUSE - h) / 20806.7))
+    return V, rho, theta
+
+class Atmosphere(ExplicitComponent):
+
+    def __init__(self, scalers, **kwargs):
+        super(Atmosphere, self).__init__(**kwargs)
+        # scalers values
+        self.scalers = scalers
+
+    def initialize(self):
+        self.options.declare('vec_size', types=int, default=1,
+                             desc='Number of design points evaluated at once')
+
+    def setup(self):
+        n = self.options['vec_size']
+        # Global Design Variable z=(t/c,h,M,AR,Lambda,Sref)
+        self.add_input('z', val=np.ones(vec_shape(n, 6)))
+        # Flight conditions, not scaled
+        self.add_output('V', val=np.ones(n))
+        self.add_output('rho', val=np.ones(n))
+        self.add_output('theta', val=np.ones(n))
+        declare_block_partials(self, SPARSITY, {'z': 6}, n)
+
+    def compute(self, inputs, outputs):
+        n = self.options['vec_size']
+        Z = inputs['z'].reshape((n, 6))*self.scalers['z']
+
+        V, rho, theta = atmosphere(Z[:, 1], Z[:, 2])
+
+        outputs['V'] = V
+        outputs['rho'] = rho
+        outputs['theta'] = theta
+
+    def compute_partials(self, inputs, J):
+        n = self.options['vec_size']
+        Z = inputs['z'].reshape((n, 6))*self.scalers['z']
+        h = Z[:, 1]
+        M = Z[:, 2]
+
+        troposphere = h <= TROPOPAUSE
+        _, rho, theta = atmosphere(h, M)
+        dVdh = np.where(troposphere, -1116.39 * M * 6.875E-6 / (2.0*np.sqrt(abs(theta))), 0.0)
+        dVdM = np.where(troposphere, 1116.39 * np.sqrt(abs(theta)), 968.1 * np.sign(M))
+        drhodh = np.where(troposphere, -2.377E-3 * 4.2561 * 6.875E-6 * abs(theta)**3.2561,
+                          -rho / 20806.7)
+        dthetadh = np.where(troposphere, -6.875E-6, 0.0)
+
+        J['V', 'z'] = (np.column_stack([dVdh, dVdM])*self.scalers['z'][1:3]).ravel()
+        J['rho', 'z'] = drhodh*self.scalers['z'][1]
+        J['theta', 'z'] = dthetadh*self.scalers['z'][1]
+
+if __name__ == "__main__": # pragma: no cover
+
+    from openmdao.api import Problem, IndepVarComp
+    scalers = {}
+    scalers['z'] = np.array([0.05, 45000., 1.6, 5.5, 55.0, 1000.0])
+    top = Problem()
+    top.model.add_subsystem('z_in', IndepVarComp('z', np.array([1.2  ,  1.333,  0.875,  0.45 ,  1.27 ,  1.5])),
+                            promotes=['*'])
+    top.model.add_subsystem('Atm1', Atmosphere(scalers), promotes=['*'])
+    top.setup()
+    top.check_partials(compact_print=True)
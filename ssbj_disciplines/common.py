@@ -18,35 +18,34 @@ R = [[0.2736, 0.3970, 0.8152, 0.9230, 0.1108],
      [0.0878, 0.7248, 0.1978, 0.0200, 0.0169],
      [0.8955, 0.4568, 0.8075, 0.9239, 0.2525]]
 
-def polynomial_function(d, S_new, flag, S_bound, var, deriv=False):
-    if len(S_new) > 1:
-        res = np.array([])
-        S_new = np.append(res, S_new)
-
-    if var not in d:
-        d[var] = list(S_new)
-
-    S = d[var]
-    S_norm = []
-    S_shifted = []
-    Ai = []
-    Aij = [[0.0]*len(S_new) for i in range(len(S_new))]
-
-    assert len(S) == len(S_new)
-
-    for i in range(len(S)):
-        S_norm.append(S_new[i] / S[i])
-
-        if S_norm[i] > 1.25:
-            S_norm[i] = 1.25
-        elif S_norm[i] < 0.75:
-            S_norm[i] = 0.75
-
-        S_shifted.append(S_norm[i]-1)
+# Polynomial responses used by the disciplines: name -> (flag, S_bound).
+# Their coefficients are solved once at import and looked up by name; the
+# flag and S_bound arguments of the evaluation functions must match them.
+POLYNOMIALS = {
+    "twist": ([2, 4, 4, 3], [0.25]*4),
+    "Fo1": ([1], [.008]),
+    "sigma[1]": ([4, 1, 4, 1, 1], [0.1]*5),
+    "sigma[2]": ([4, 1, 4, 1, 1], [0.15]*5),
+    "sigma[3]": ([4, 1, 4, 1, 1], [0.2]*5),
+    "sigma[4]": ([4, 1, 4, 1, 1], [0.25]*5),
+    "sigma[5]": ([4, 1, 4, 1, 1], [0.30]*5),
+    "Fo2": ([1, 1], [.25]*2),
+    "Fo3": ([5], [.25]),
+    "dpdx": ([1], [.25]),
+    "Temp": ([2, 4, 2], [.25]*3),
+}
 
+def _polynomial_coefficients(flag, S_bound):
+    """
+    Solves for the coefficients (Ao, Ai, Aij) of the quadratic polynomial defined by
+    flag and S_bound.
+    """
+    n = len(flag)
+    Ai = np.zeros(n)
+    Aij = np.zeros((n, n))
+    for i in range(n):
         a = 0.1
         b = a
-
         if flag[i] == 3:
             a = -a
             b = a
@@ -62,59 +61,245 @@ def polynomial_function(d, S_new, flag, S_bound, var, deriv=False):
         Mtx_shifted = np.array([[1.0, Sl, Sl**2],
                                 [1.0, So, So**2],
                                 [1.0, Su, Su**2]])
-
         if flag[i] == 5:
-            F_bound = np.array([[1+(0.5*a)**2], [1.0], [1+(0.5*b)**2]])
+            F_bound = np.array([1+(0.5*a)**2, 1.0, 1+(0.5*b)**2])
         else:
-            F_bound = np.array([[1-(0.5*a)], [1.0], [1+(0.5*b)]])
+            F_bound = np.array([1-(0.5*a), 1.0, 1+(0.5*b)])
 
         A = np.linalg.solve(Mtx_shifted, F_bound)
-
         Ao = A[0]
-        B = A[1]
+        Ai[i] = A[1]
+        Aij[i, i] = A[2]
 
-        if var == "Fo1":
-            Ai.append(B)
-        else:
-            Ai.append(A[1])
+    for i in range(n):
+        for j in range(i+1, n):
+            Aij[i, j] = Aij[i, i] * R[i][j]
+            Aij[j, i] = Aij[i, j]
+    return Ao, Ai, Aij
 
-        Aij[i][i] = A[2]
+_COEFFICIENTS = {}
+for _var, (_flag, _S_bound) in POLYNOMIALS.items():
+    _COEFFICIENTS[_var] = _polynomial_coefficients(_flag, _S_bound)
+    for _array in _COEFFICIENTS[_var][1:]:
+        _array.flags.writeable = False
 
-    for i in range(len(S)):
-        for j in range(i+1, len(S)):
-            Aij[i][j] = Aij[i][i] * R[i][j]
-            Aij[j][i] = Aij[i][j]
+def polynomial_coefficients(var):
+    """
+    Coefficients (Ao, Ai, Aij) of the polynomial response var, solved at import
+    from its flag and S_bound in POLYNOMIALS.
+    """
+    try:
+        return _COEFFICIENTS[var]
+    except KeyError:
+        raise ValueError("Unknown polynomial response '{}', see POLYNOMIALS".format(var))
 
-    Ai = np.matrix(np.array(Ai))
-    Aij = np.matrix(np.array(Aij))
-    S_shifted = np.matrix(np.array(S_shifted))
+def check_polynomial(var, flag, S_bound):
+    """
+    Raises a ValueError when flag or S_bound differ from those of the polynomial
+    response var in POLYNOMIALS, from which its coefficients are solved.
+    """
+    if var not in POLYNOMIALS:
+        raise ValueError("Unknown polynomial response '{}', see POLYNOMIALS".format(var))
+    known_flag, known_bound = POLYNOMIALS[var]
+    if list(flag) != known_flag:
+        raise ValueError("flag {} of polynomial response '{}' differs from {} in POLYNOMIALS"
+                         .format(list(flag), var, known_flag))
+    if list(S_bound) != known_bound:
+        raise ValueError("S_bound {} of polynomial response '{}' differs from {} in POLYNOMIALS"
+                         .format(list(S_bound), var, known_bound))
 
-    if deriv:
-        return S_shifted, Ai, Aij
+_STACKED_COEFFICIENTS = {}
+
+def polynomial_coefficients_stack(variables):
+    """
+    Coefficients of several polynomial responses with the same flag stacked
+    along a first axis: Ao (m,), Ai (m, n) and Aij (m, n, n).
+    """
+    variables = tuple(variables)
+    try:
+        return _STACKED_COEFFICIENTS[variables]
+    except KeyError:
+        tables = [polynomial_coefficients(var) for var in variables]
+        coefficients = tuple(np.array([table[k] for table in tables]) for k in range(3))
+        for array in coefficients:
+            array.flags.writeable = False
+        _STACKED_COEFFICIENTS[variables] = coefficients
+        return coefficients
+
+def polynomial_stack(d, S_new, flag, S_bounds, variables, deriv=False):
+    """
+    Evaluates the polynomial responses in variables, which share the input vector
+    S_new and flag and differ by their S_bound, as one tensor operation.
+    S_new is either one point or an (N, n_vars) array of points. This is the one
+    implementation of the polynomial responses: polynomial_function and
+    polynomial_function_batch evaluate a single response through it.
+
+    Returns the m values and, if deriv is True, the (m, n_vars) gradients with
+    respect to the unnormalized S_new, with a leading N axis for N points.
+    Raises a ValueError when flag and S_bounds do not match POLYNOMIALS.
+    """
+    if len(S_bounds) != len(variables):
+        raise ValueError("{} S_bounds for {} polynomial responses".format(len(S_bounds), len(variables)))
+    for var, S_bound in zip(variables, S_bounds):
+        check_polynomial(var, flag, S_bound)
+    if not isinstance(S_new, np.ndarray):
+        S_new = np.hstack(S_new)
+    S_new = S_new.astype(float)
+    points = S_new.reshape((-1, S_new.shape[-1]))
+    for var in variables:
+        if var not in d:
+            d[var] = points[0].copy()
+
+    S = np.array([d[var] for var in variables], dtype=float)[:, None, :]
+    assert S.shape[2] == points.shape[1]
+
+    Ao, Ai, Aij = polynomial_coefficients_stack(variables)
+    Ai = Ai[:, None, :]
+
+    # responses along the first axis, so that the products with Aij are one
+    # batched matmul: S_shifted and AS are (m, N, n_vars)
+    S_norm = points / S
+    S_shifted = np.clip(S_norm, 0.75, 1.25) - 1.0
+    AS = np.matmul(S_shifted, Aij)
+    value = Ao[:, None] + ((Ai + 0.5*AS)*S_shifted).sum(axis=-1)
+    if S_new.ndim == 1:
+        value = value[:, 0]
     else:
-        return float((Ao + Ai.T * S_shifted.T + 0.5 * S_shifted * Aij * S_shifted.T)[0])
+        value = value.T
+    if deriv:
+        inside = (S_norm >= 0.75) & (S_norm <= 1.25)
+        grad = np.where(inside, (Ai + AS) / S, 0.0)
+        if S_new.ndim == 1:
+            return value, grad[:, 0]
+        return value, grad.transpose((1, 0, 2))
+    return value
 
-class _PolynomialFunction:
-    _instance = None
+def polynomial_function(d, S_new, flag, S_bound, var):
+    """
+    Value of the polynomial response var at the single point S_new.
+    """
+    return float(polynomial_stack(d, S_new, flag, [S_bound], [var])[0])
 
-    def __init__(self, d={}):
-        self.d = d
+def polynomial_function_batch(d, S_new, flag, S_bound, var, deriv=False):
+    """
+    Batched version of polynomial_function.
 
-    def __call__(self, S_new, flag, S_bound, var, deriv=False):
-        return polynomial_function(self.d, S_new, flag, S_bound, var, deriv) 
+    S_new is an (N, n_vars) array of points. Returns the N polynomial values and,
+    if deriv is True, the (N, n_vars) gradients with respect to the unnormalized S_new.
+    """
+    S_new = np.atleast_2d(np.asarray(S_new, dtype=float))
+    if deriv:
+        value, grad = polynomial_stack(d, S_new, flag, [S_bound], [var], deriv=True)
+        return value[:, 0], grad[:, 0]
+    return polynomial_stack(d, S_new, flag, [S_bound], [var])[:, 0]
 
-def PolynomialFunction(d={}):
-    if _PolynomialFunction._instance is None:
-        _PolynomialFunction._instance = _PolynomialFunction(d)
-    return _PolynomialFunction._instance
+def vec_shape(vec_size, size):
+    """
+    Shape of a discipline variable of the given size evaluated at vec_size
+    points. A single point keeps the plain (size,) shape.
+    """
+    if vec_size == 1:
+        return (size,)
+    return (vec_size, size)
 
-if __name__ == '__main__':
+def block_diagonal(vec_size, n_of, n_wrt, cols=None):
+    """
+    rows and cols of the partials of an output of size n_of with respect to an
+    input of size n_wrt when both are evaluated at vec_size independent points:
+    vec_size (n_of, n_wrt) blocks along the diagonal. cols are the nonzero input
+    entries in every row of a block, all of them by default. Values are ordered
+    by point, then output row, then cols.
+    """
+    if cols is None:
+        cols = np.arange(n_wrt)
+    cols = np.asarray(cols)
+    nnz = len(cols)
+    rows = np.repeat(np.arange(vec_size*n_of), nnz)
+    cols = np.tile(cols, vec_size*n_of) \
+        + np.repeat(np.arange(vec_size), n_of*nnz)*n_wrt
+    return rows, cols
+
+def declare_block_partials(component, sparsity, sizes, vec_size):
+    """
+    Declares the partials of component given by sparsity, a dict mapping (of, wrt)
+    to the nonzero entries of wrt in every row of of, for vec_size points. sizes
+    gives the size at one point of the non scalar variables. Pairs not in sparsity
+    are structurally zero and left undeclared.
+    """
+    for (of, wrt), cols in sorted(sparsity.items()):
+        rows, cols = block_diagonal(vec_size, sizes.get(of, 1), sizes.get(wrt, 1), cols)
+        component.declare_partials(of, wrt, rows=rows, cols=cols)
+
+class PolynomialFunction(object):
+    """
+    Polynomial responses of the disciplines evaluated around a fixed reference point.
+
+    d maps each response name to the values of its inputs at the reference point.
+    It is copied at creation and the instance cannot be modified afterwards, so the
+    same reference state can be shared by several problems, threads or processes.
+
+    Calling the instance evaluates one response at one point and batch at an (N, n_vars)
+    array of points. value_and_grad returns a response and its gradient with respect to
+    the unnormalized inputs in one evaluation, as batch and stack do with deriv=True.
+    stack evaluates several responses sharing their inputs, see polynomial_stack.
+    """
+    __slots__ = ('_d',)
+
+    def __init__(self, d):
+        reference = {}
+        for var in d:
+            S = np.array(np.hstack(d[var]), dtype=float)
+            S.flags.writeable = False
+            reference[var] = S
+        object.__setattr__(self, '_d', reference)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PolynomialFunction reference state is immutable")
+
+    def __reduce__(self):
+        return (PolynomialFunction, (self._d,))
 
-    p = PolynomialFunction()
+    def __repr__(self):
+        return 'PolynomialFunction({})'.format(self._d)
+
+    @property
+    def d(self):
+        return dict(self._d)
+
+    def _check(self, var):
+        if var not in self._d:
+            raise KeyError("No reference point for polynomial response '{}'".format(var))
+
+    def __call__(self, S_new, flag, S_bound, var):
+        self._check(var)
+        return polynomial_function(self._d, S_new, flag, S_bound, var)
+
+    def value_and_grad(self, S_new, flag, S_bound, var):
+        """
+        Value of the response var and its gradient with respect to the unnormalized
+        S_new: a float and an (n_vars,) array at a single point, or (N,) and
+        (N, n_vars) arrays for an (N, n_vars) array of points.
+        """
+        self._check(var)
+        value, grad = polynomial_stack(self._d, S_new, flag, [S_bound], [var], deriv=True)
+        if value.ndim == 1:
+            return float(value[0]), grad[0]
+        return value[:, 0], grad[:, 0]
+
+    def batch(self, S_new, flag, S_bound, var, deriv=False):
+        self._check(var)
+        return polynomial_function_batch(self._d, S_new, flag, S_bound, var, deriv)
+
+    def stack(self, S_new, flag, S_bounds, variables, deriv=False):
+        for var in variables:
+            self._check(var)
+        return polynomial_stack(self._d, S_new, flag, S_bounds, variables, deriv)
+
+if __name__ == '__main__':
 
-    init = [1.0, 37.080992435478315, 0.4, 1000.0]
-    b = [1.0, 37.080992435478315, 0.4, 26315.848165047268]
-    a = [1.0, 37.080992435478315, 0.4, -12243.514743699088]
+    p = PolynomialFunction({"Fo1": [1.0]})
 
-    print("it 1", p.eval([1.0], [1], [0.008], "Fo1"))
-    print("it 2", p.eval([0.766], [1], [0.008], "Fo1"))
+    print("it 1", p([1.0], [1], [0.008], "Fo1"))
+    print("it 2", p([0.766], [1], [0.008], "Fo1"))
+    print("batch", p.batch([[1.0], [0.766]], [1], [0.008], "Fo1"))
+    print("value_and_grad", p.value_and_grad([0.998], [1], [0.008], "Fo1"))
@@ -0,0 +1,173 @@
+"""
+SSBJ test case - http://ntrs.nasa.gov/archive/nasa/casi.ntrs.nasa.gov/19980234657.pdf
+Python implementation and OpenMDAO integration developed by
+Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
+"""
+from __future__ import print_function
+import numpy as np
+
+from openmdao.api import ExplicitComponent
+from .common import vec_shape
+# pylint: disable=C0103
+
+# Size of the non scalar constrained variables
+SIZES = {'sigma': 5}
+
+# Variables constrained without their scaler, as in the original con_dt = DT:
+# the bound is 0, so only the scaling of the constraint depends on it
+UNSCALED = ['DT']
+
+# Constraints (name, variable, index, sign, bound) of the MDF formulation:
+# sign*(variable[index]*scaler - bound), feasible when negative
+MDF_CONSTRAINTS = [('con_dt', 'DT', 0, 1., 0.),
+                   ('con_theta_up', 'Theta', 0, 1., 1.04),
+                   ('con_theta_low', 'Theta', 0, -1., 0.96)] \
+                + [('con_sigma'+str(i+1), 'sigma', i, 1., 1.09) for i in range(5)] \
+                + [('con_dpdx', 'dpdx', 0, 1., 1.04),
+                   ('con1_esf', 'ESF', 0, 1., 1.5),
+                   ('con2_esf', 'ESF', 0, -1., 0.5),
+                   ('con_temp', 'Temp', 0, 1., 1.02)]
+
+# Local constraints of the IDF formulation
+IDF_CONSTRAINTS = [('con_dt', 'DT', 0, 1., 0.),
+                   ('con_Theta_up', 'Theta', 0, 1., 1.04),
+                   ('con_Theta_low', 'Theta', 0, -1., 0.96)] \
+                + [('con_sigma'+str(i+1), 'sigma', i, 1., 1.9) for i in range(5)] \
+                + [('con_dpdx', 'dpdx', 0, 1., 1.04),
+                   ('con_esf', 'ESF', 0, 1., 1.5),
+                   ('con_temp', 'Temp', 0, 1., 1.0)]
+
+# Local constraints of the discipline suboptimizations of CO and BLISS-2000
+SUBOPT_CONSTRAINTS = {
+    'structures': [('con_theta_up', 'Theta', 0, 1., 1.04),
+                   ('con_theta_low', 'Theta', 0, -1., 1.0)] \
+                + [('con_sigma'+str(i+1), 'sigma', i, 1., 1.09) for i in range(5)],
+    'aerodynamics': [('con_dpdx', 'dpdx', 0, 1., 1.04)],
+    'propulsion': [('con1_esf', 'ESF', 0, 1., 1.5),
+                   ('con2_esf', 'ESF', 0, -1., 0.5),
+                   ('con_temp', 'Temp', 0, 1., 1.02),
+                   ('con_dt', 'DT', 0, 1., 0.)],
+}
+
+# Coupling constraints of the IDF formulation: (name, coupling variable),
+# the target of the optimizer minus the discipline output, feasible when zero
+IDF_COUPLINGS = [('con_str_aer_wt', 'WT'),
+                 ('con_str_aer_theta', 'Theta'),
+                 ('con_aer_str_l', 'L'),
+                 ('con_aer_pro_d', 'D'),
+                 ('con_pro_aer_esf', 'ESF'),
+                 ('con_pro_str_we', 'WE')]
+
+def constraint_names(table):
+    """
+    Names of the constraints of table in the order of the constraint vector.
+    """
+    return [row[0] for row in table]
+
+def _factors(scalers, table):
+    # Partial derivative of each constraint with respect to its scaled variable
+    return np.array([sign*(1. if var in UNSCALED else np.reshape(scalers[var], -1)[index])
+                     for _, var, index, sign, _ in table])
+
+def constraints(scalers, values, table=MDF_CONSTRAINTS):
+    """
+    Constraints of table computed from the scaled values of the constrained
+    variables, at one point or stacked along a first axis of length N.
+    Returns the (N, m) constraint vectors.
+    """
+    x = np.column_stack([np.reshape(values[var], (-1, SIZES.get(var, 1)))[:, index]
+                         for _, var, index, _, _ in table])
+    bounds = np.array([sign*bound for _, _, _, sign, bound in table])
+    return x*_factors(scalers, table) - bounds
+
+class SSBJConstraints(ExplicitComponent):
+    """
+    Constraint vector con of table, linear in the scaled variables so that its
+    sparse partials are constant and declared once at setup.
+    """
+    def __init__(self, scalers, table=MDF_CONSTRAINTS, **kwargs):
+        super(SSBJConstraints, self).__init__(**kwargs)
+        # scalers values
+        self.scalers = scalers
+        self.table = table
+
+    def initialize(self):
+        self.options.declare('vec_size', types=int, default=1,
+                             desc='Number of design points evaluated at once')
+
+    def setup(self):
+        n = self.options['vec_size']
+        m = len(self.table)
+        factors = _factors(self.scalers, self.table)
+        variables = []
+        for _, var, _, _, _ in self.table:
+            if var not in variables:
+                variables.append(var)
+
+        for var in variables:
+            size = SIZES.get(var, 1)
+            self.add_input(var, val=np.ones(vec_shape(n, size) if size > 1 else n))
+        self.add_output('con', val=np.zeros(vec_shape(n, m)))
+
+        for var in variables:
+            size = SIZES.get(var, 1)
+            k = np.array([k for k, row in enumerate(self.table) if row[1] == var])
+            index = np.array([self.table[i][2] for i in k])
+            points = np.repeat(np.arange(n), len(k))
+            self.declare_partials('con', var, rows=points*m + np.tile(k, n),
+                                  cols=points*size + np.tile(index, n),
+                                  val=np.tile(factors[k], n))
+
+    def compute(self, inputs, outputs):
+        outputs['con'] = constraints(self.scalers, inputs, self.table).reshape(
+            outputs['con'].shape)
+
+class CouplingConstraints(ExplicitComponent):
+    """
+    Vector con_couplings of the residuals var_target - var of the coupling
+    variables of table, see IDF_COUPLINGS, linear with constant sparse partials.
+    """
+    def __init__(self, table=IDF_COUPLINGS, **kwargs):
+        super(CouplingConstraints, self).__init__(**kwargs)
+        self.table = table
+
+    def initialize(self):
+        self.options.declare('vec_size', types=int, default=1,
+                             desc='Number of design points evaluated at once')
+
+    def setup(self):
+        n = self.options['vec_size']
+        m = len(self.table)
+        self.add_output('con_couplings', val=np.zeros(vec_shape(n, m)))
+        for k, (_, var) in enumerate(self.table):
+            self.add_input(var + '_target', val=np.ones(n))
+            self.add_input(var, val=np.ones(n))
+            rows = np.arange(n)*m + k
+            cols = np.arange(n)
+            self.declare_partials('con_couplings', var + '_target', rows=rows, cols=cols, val=1.)
+            self.declare_partials('con_couplings', var, rows=rows, cols=cols, val=-1.)
+
+    def compute(self, inputs, outputs):
+        residuals = np.column_stack([inputs[var + '_target'] - inputs[var]
+                                     for _, var in self.table])
+        outputs['con_couplings'] = residuals.reshape(outputs['con_couplings'].shape)
+
+if __name__ == "__main__": # pragma: no cover
+
+    from openmdao.api import Problem, IndepVarComp
+    scalers = {}
+    scalers['Theta'] = 0.950978
+    scalers['sigma'] = np.array([1.12255, 1.08170213, 1.0612766, 1.04902128, 1.04085106])
+    scalers['dpdx'] = 1.0
+    scalers['ESF'] = 0.5
+    scalers['Temp'] = 1.0
+    scalers['DT'] = 1.0
+    top = Problem()
+    inputs = top.model.add_subsystem('inputs', IndepVarComp(), promotes=['*'])
+    for var in ['Theta', 'dpdx', 'ESF', 'Temp', 'DT']:
+        inputs.add_output(var, 1.0)
+    inputs.add_output('sigma', np.ones(5))
+    top.model.add_subsystem('Con1', SSBJConstraints(scalers), promotes=['*'])
+    top.model.add_subsystem('Con2', CouplingConstraints(), promotes_outputs=['*'])
+    top.setup()
+    top.check_partials(compact_print=True)
@@ -7,7 +7,10 @@ from __future__ import print_function
 import numpy as np
 
 from openmdao.api import ExplicitComponent
-from .common import PolynomialFunction
+from .common import declare_block_partials
+
+# Nonzero input entries of each output
+SPARSITY = {('dpdx', 'z0'): [0]}
 
 
 def dpdx_constraint(pf, Z0):
@@ -18,21 +21,26 @@ def dpdx_constraint(pf, Z0):
 
 class DpdxCalc(ExplicitComponent):
 
-    def __init__(self, scalers):
-        super(DpdxCalc, self).__init__()
+    def __init__(self, scalers, pf, **kwargs):
+        super(DpdxCalc, self).__init__(**kwargs)
         self.scalers = scalers
-        self.pf = PolynomialFunction()
+        self.pf = pf
+
+    def initialize(self):
+        self.options.declare('vec_size', types=int, default=1,
+                             desc='Number of design points evaluated at once')
 
     def setup(self):
+        n = self.options['vec_size']
         # Global Design Variable z=(t/c,h,M,AR,Lambda,Sref)
-        self.add_input('z0', val=1.0)
-        self.add_output('dpdx', val=1.0)
-        self.declare_partials('*', '*')
+        self.add_input('z0', val=np.ones(n))
+        self.add_output('dpdx', val=np.ones(n))
+        declare_block_partials(self, SPARSITY, {}, n)
 
     def compute(self, inputs, outputs):
 
         Z0 = inputs['z0']*self.scalers['z'][0]
-        dpdx = dpdx_constraint(self.pf, Z0)
+        dpdx = self.pf.batch(Z0[:, None], [1], [.25], "dpdx")
         outputs['dpdx'] = dpdx/self.scalers['dpdx']
 
     def compute_partials(self, inputs, partials):
@@ -40,12 +48,6 @@ class DpdxCalc(ExplicitComponent):
         Z0 = inputs['z0']*self.scalers['z'][0]
 
         # dpdx ################################################################
-        # partials['dpdx', 'z0'] = np.zeros((1, 1))
-        S_shifted, Ai, Aij = self.pf([Z0], [1], [.25], "dpdx", deriv=True)
-        if Z0/self.pf.d['dpdx'][0]>=0.75 and Z0/self.pf.d['dpdx'][0]<=1.25:
-            dStcdtc = 1.0/self.pf.d['dpdx'][0]
-        else:
-            dStcdtc = 0.0
-        dStcdtc2 = 2.0*S_shifted[0, 0]*dStcdtc
-        ddpdxdtc = Ai[0]*dStcdtc+0.5*Aij[0, 0]*dStcdtc2
+        _, ddpdx = self.pf.batch(Z0[:, None], [1], [.25], "dpdx", deriv=True)
+        ddpdxdtc = ddpdx[:, 0]
         partials['dpdx', 'z0'] = ddpdxdtc*self.scalers['z'][0]/self.scalers['dpdx']
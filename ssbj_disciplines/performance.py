@@ -6,36 +6,59 @@ Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
 from __future__ import print_function
 import numpy as np
 from openmdao.api import ExplicitComponent
+from .common import vec_shape, declare_block_partials
+from .atmosphere import atmosphere
 # pylint: disable=C0103
 
+# Nonzero input entries of each output, other partials are structurally zero
+SPARSITY = {('R', 'z'): [2], ('R', 'theta'): [0], ('R', 'WT'): [0], ('R', 'WF'): [0],
+            ('R', 'fin'): [0], ('R', 'SFC'): [0]}
+
 def performance(Z, fin, SFC, WT, WF):
-    if Z[1] <= 36089.:
-        theta = 1.0-6.875E-6*Z[1]
-    else:
-        theta = 0.7519
+    _, _, theta = atmosphere(Z[1], Z[2])
     R = 661.0*np.sqrt(theta)*Z[2]*fin/SFC*np.log(abs(WT/(WT-WF)))
     return R
 
 
+def performance_batch(Z, fin, SFC, WT, WF, theta=None):
+    """
+    Vectorized performance over N design points: Z is (N, 6), the other
+    arguments have length N. The temperature ratio theta is computed from
+    the altitude of Z when not given. Returns the length-N range R.
+    """
+    Z = np.atleast_2d(Z)
+    fin, SFC, WT, WF = [np.reshape(a, -1) for a in (fin, SFC, WT, WF)]
+    if theta is None:
+        _, _, theta = atmosphere(Z[:, 1], Z[:, 2])
+    R = 661.0*np.sqrt(theta)*Z[:, 2]*fin/SFC*np.log(abs(WT/(WT-WF)))
+    return R
+
 class Performance(ExplicitComponent):
 
-    def __init__(self, scalers):
-        super(Performance, self).__init__()
+    def __init__(self, scalers, **kwargs):
+        super(Performance, self).__init__(**kwargs)
         # scalers values
         self.scalers = scalers
 
+    def initialize(self):
+        self.options.declare('vec_size', types=int, default=1,
+                             desc='Number of design points evaluated at once')
+
     def setup(self):
+        n = self.options['vec_size']
         # Global Design Variable z=(t/c,h,M,AR,Lambda,Sref)
-        self.add_input('z', val=np.ones(6))
+        self.add_input('z', val=np.ones(vec_shape(n, 6)))
         # Local Design Variable x_per=null
         # Coupling parameters
-        self.add_input('WT', val=1.0)
-        self.add_input('WF', val=1.0)
-        self.add_input('fin', val=1.0)
-        self.add_input('SFC', val=1.0)
+        self.add_input('WT', val=np.ones(n))
+        self.add_input('WF', val=np.ones(n))
+        self.add_input('fin', val=np.ones(n))
+        self.add_input('SFC', val=np.ones(n))
+        # Temperature ratio from Atmosphere, not scaled
+        self.add_input('theta', val=np.ones(n))
         # Coupling output
-        self.add_output('R', val=1.0)
-        self.declare_partials('*', '*')
+        self.add_output('R', val=np.ones(n))
+        declare_block_partials(self, SPARSITY, {'z': 6}, n)
 
     def compute(self, inputs, outputs):
         #Variables scaling
@@ -45,43 +68,37 @@ class Performance(ExplicitComponent):
         WT = inputs['WT']*self.scalers['WT']
         WF = inputs['WF']*self.scalers['WF']
 
-        R = performance(Z, fin, SFC, WT, WF)
+        R = performance_batch(Z, fin, SFC, WT, WF, inputs['theta'])
 
         outputs['R'] = R/self.scalers['R']
 
     def compute_partials(self, inputs, J):
-        Z = inputs['z']*self.scalers['z']
+        n = self.options['vec_size']
+        Z = inputs['z'].reshape((n, 6))*self.scalers['z']
         fin = inputs['fin']*self.scalers['fin']
         SFC = inputs['SFC']*self.scalers['SFC']
         WT = inputs['WT']*self.scalers['WT']
         WF = inputs['WF']*self.scalers['WF']
-        
-        if Z[1] <= 36089:
-            theta = 1.0-6.875E-6*Z[1]
-            dRdh = -0.5*661.0*theta**-0.5*6.875e-6*Z[2]*fin \
-                   /SFC*np.log(abs(WT/(WT-WF)))
-        else:
-            theta = 0.7519
-            dRdh = 0.0
+        theta = inputs['theta']
 
+        dRdtheta = 0.5*661.0*theta**-0.5*Z[:, 2]*fin/SFC*np.log(abs(WT/(WT-WF)))
+        J['R', 'theta'] = dRdtheta/self.scalers['R']
         dRdM = 661.0*np.sqrt(theta)*fin/SFC*np.log(abs(WT/(WT-WF)))
-
-        J['R', 'z'] = np.zeros((1, 6))
-        J['R', 'z'][0, 1] = np.array([dRdh/self.scalers['R'] *45000.0])
-        J['R', 'z'][0, 2] = np.array([dRdM/self.scalers['R'] *1.6])
-        dRdfin = 661.0*np.sqrt(theta)*Z[2]/SFC*np.log(abs(WT/(WT-WF)))
-        J['R', 'fin'] = np.array([[dRdfin/self.scalers['R']*self.scalers['fin']]])
-        dRdSFC = -661.0*np.sqrt(theta)*Z[2]*fin/SFC**2*np.log(abs(WT/(WT-WF)))
-        J['R', 'SFC'] = np.array([[dRdSFC/self.scalers['R']*self.scalers['SFC']]])
-        dRdWT = 661.0*np.sqrt(theta)*Z[2]*fin/SFC*-WF/(WT*(WT-WF))
-        J['R', 'WT'] = np.array([[dRdWT/self.scalers['R']*self.scalers['WT']]])
-        dRdWF = 661.0*np.sqrt(theta)*Z[2]*fin/SFC*1.0/(WT-WF)
-        J['R', 'WF'] = np.array([[dRdWF/self.scalers['R']*self.scalers['WF']]])
+        J['R', 'z'] = dRdM/self.scalers['R']*self.scalers['z'][2]
+        dRdfin = 661.0*np.sqrt(theta)*Z[:, 2]/SFC*np.log(abs(WT/(WT-WF)))
+        J['R', 'fin'] = dRdfin/self.scalers['R']*self.scalers['fin']
+        dRdSFC = -661.0*np.sqrt(theta)*Z[:, 2]*fin/SFC**2*np.log(abs(WT/(WT-WF)))
+        J['R', 'SFC'] = dRdSFC/self.scalers['R']*self.scalers['SFC']
+        dRdWT = 661.0*np.sqrt(theta)*Z[:, 2]*fin/SFC*-WF/(WT*(WT-WF))
+        J['R', 'WT'] = dRdWT/self.scalers['R']*self.scalers['WT']
+        dRdWF = 661.0*np.sqrt(theta)*Z[:, 2]*fin/SFC*1.0/(WT-WF)
+        J['R', 'WF'] = dRdWF/self.scalers['R']*self.scalers['WF']
 
 
 if __name__ == "__main__": # pragma: no cover
 
-    from openmdao.api import Problem, Group, IndepVarComp
+    from openmdao.api import Problem, IndepVarComp
+    from .atmosphere import Atmosphere
     scalers = {}
     scalers['z'] = np.array([0.05, 45000., 1.6, 5.5, 55.0, 1000.0])
     scalers['fin'] = 4.093062
@@ -90,13 +107,13 @@ if __name__ == "__main__": # pragma: no cover
     scalers['WT'] = 49909.58578
     scalers['R'] = 528.91363
     top = Problem()
-    top.root = Group()
-    top.root.add('z_in', IndepVarComp('z', np.array([1.2  ,  1.333,  0.875,  0.45 ,  1.27 ,  1.5])),
-                 promotes=['*'])
-    top.root.add('WT_in', IndepVarComp('WT', 0.888), promotes=['*'])
-    top.root.add('WF_in', IndepVarComp('WF', 2.66), promotes=['*'])
-    top.root.add('fin_in', IndepVarComp('fin', 1.943), promotes=['*'])
-    top.root.add('SFC_in', IndepVarComp('SFC', 0.8345), promotes=['*'])
-    top.root.add('Per1', Performance(scalers), promotes=['*'])
+    top.model.add_subsystem('z_in', IndepVarComp('z', np.array([1.2  ,  1.333,  0.875,  0.45 ,  1.27 ,  1.5])),
+                            promotes=['*'])
+    top.model.add_subsystem('WT_in', IndepVarComp('WT', 0.888), promotes=['*'])
+    top.model.add_subsystem('WF_in', IndepVarComp('WF', 2.66), promotes=['*'])
+    top.model.add_subsystem('fin_in', IndepVarComp('fin', 1.943), promotes=['*'])
+    top.model.add_subsystem('SFC_in', IndepVarComp('SFC', 0.8345), promotes=['*'])
+    top.model.add_subsystem('Atm1', Atmosphere(scalers), promotes=['*'])
+    top.model.add_subsystem('Per1', Performance(scalers), promotes=['*'])
     top.setup()
     top.check_partials(compact_print=True)
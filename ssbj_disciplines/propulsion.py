@@ -6,9 +6,16 @@ Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
 from __future__ import print_function
 import numpy as np
 from openmdao.api import ExplicitComponent
-from .common import PolynomialFunction, WBE
+from .common import WBE, vec_shape, declare_block_partials
 # pylint: disable=C0103
 
+# Nonzero input entries of each output, other partials are structurally zero
+SPARSITY = {('SFC', 'z'): [1, 2], ('SFC', 'x_pro'): [0],
+            ('ESF', 'x_pro'): [0], ('ESF', 'D'): [0],
+            ('WE', 'x_pro'): [0], ('WE', 'D'): [0],
+            ('DT', 'z'): [1, 2], ('DT', 'x_pro'): [0],
+            ('Temp', 'z'): [1, 2], ('Temp', 'x_pro'): [0]}
+
 def propulsion(pf, x_pro, Z, D):
     Tbar = abs(x_pro) * 16168.6
     Temp = pf([Z[2], Z[1], abs(x_pro)], [2, 4, 2], [.25]*3, "Temp")
@@ -22,36 +29,62 @@ def propulsion(pf, x_pro, Z, D):
     DT = Tbar/TUAbar - 1.0
     return Temp, ESF, SFC, WE, DT
 
+def propulsion_batch(pf, x_pro, Z, D):
+    """
+    Vectorized propulsion over N design points: Z is (N, 6), x_pro and D
+    have length N. Returns the length-N arrays Temp, ESF, SFC, WE, DT.
+    """
+    Z = np.atleast_2d(Z)
+    x_pro, D = [np.reshape(a, -1) for a in (x_pro, D)]
+    h = Z[:, 1]
+    M = Z[:, 2]
+    Tbar = abs(x_pro) * 16168.6
+    Temp = pf.batch(np.column_stack([M, h, abs(x_pro)]), [2, 4, 2], [.25]*3, "Temp")
+    ESF = (D/3.0)/Tbar
+    SFC = 1.1324 + 1.5344*M - 3.2956E-05*h - 1.6379E-04*Tbar \
+        - 0.31623*M**2 + 8.2138E-06*M*h - 10.496E-5*Tbar*M \
+        - 8.574E-11*h**2 + 3.8042E-9*Tbar*h + 1.06E-8*Tbar**2
+    WE = 3.0*WBE*abs(ESF)**1.05
+    TUAbar = 11484.0 + 10856.0 * M - 0.50802 * h \
+        + 3200.2*(M**2) - 0.29326 * M * h + 6.8572E-6 * h**2
+    DT = Tbar/TUAbar - 1.0
+    return Temp, ESF, SFC, WE, DT
+
 class Propulsion(ExplicitComponent):
 
-    def __init__(self, scalers):
-        super(Propulsion, self).__init__()
+    def __init__(self, scalers, pf, **kwargs):
+        super(Propulsion, self).__init__(**kwargs)
         # scalers values
         self.scalers = scalers
-        # Polynomial function initialized with given constant values
-        self.pf = PolynomialFunction()
+        # Polynomial function initialized with given reference values
+        self.pf = pf
+
+    def initialize(self):
+        self.options.declare('vec_size', types=int, default=1,
+                             desc='Number of design points evaluated at once')
 
     def setup(self):
+        n = self.options['vec_size']
         # Global Design Variable z=(t/c,h,M,AR,Lambda,Sref)
-        self.add_input('z', val=np.ones(6))
+        self.add_input('z', val=np.ones(vec_shape(n, 6)))
         # Local Design Variable x_pro=T
-        self.add_input('x_pro', val=1.0)
+        self.add_input('x_pro', val=np.ones(n))
         # Coupling parameters
-        self.add_input('D', val=1.0)
+        self.add_input('D', val=np.ones(n))
         # Coupling output
-        self.add_output('SFC', val=1.0)
-        self.add_output('WE', val=1.0)
-        self.add_output('ESF', val=1.0)
-        self.add_output('DT', val=1.0)
-        self.add_output('Temp', val=1.0)
-        self.declare_partials('*', '*')
+        self.add_output('SFC', val=np.ones(n))
+        self.add_output('WE', val=np.ones(n))
+        self.add_output('ESF', val=np.ones(n))
+        self.add_output('DT', val=np.ones(n))
+        self.add_output('Temp', val=np.ones(n))
+        declare_block_partials(self, SPARSITY, {'z': 6}, n)
 
     def compute(self, inputs, outputs):
         Z = inputs['z']*self.scalers['z']
         x_pro = inputs['x_pro']*self.scalers['x_pro']
         D = inputs['D']*self.scalers['D']
 
-        Temp, ESF, SFC, WE, DT = propulsion(self.pf, x_pro, Z, D)
+        Temp, ESF, SFC, WE, DT = propulsion_batch(self.pf, x_pro, Z, D)
 
         outputs['Temp'] = Temp/self.scalers['Temp']
         outputs['ESF'] = ESF/self.scalers['ESF']
@@ -61,79 +94,55 @@ class Propulsion(ExplicitComponent):
 
     def compute_partials(self, inputs, J):
         #Changement de variable
-        Z = inputs['z']*self.scalers['z']
+        n = self.options['vec_size']
+        Z = inputs['z'].reshape((n, 6))*self.scalers['z']
         Xpro = inputs['x_pro']*self.scalers['x_pro']
+        D = inputs['D']*self.scalers['D']
+        h = Z[:, 1]
+        M = Z[:, 2]
         Tbar = abs(Xpro) * 16168.6
-        ESF = (inputs['D']*self.scalers['D']/3.0)/Tbar
-        TUAbar = 11484.0 + 10856.0 * Z[2] - 0.50802 * Z[1] \
-            + 3200.2 * Z[2]**2 - 0.29326 * Z[2] * Z[1] + 6.8572E-6 * Z[1]**2
+        ESF = (D/3.0)/Tbar
+        TUAbar = 11484.0 + 10856.0 * M - 0.50802 * h \
+            + 3200.2 * M**2 - 0.29326 * M * h + 6.8572E-6 * h**2
         ##############SFC
-        dSFCdT = -1.6379e-4*16168.6-10.496e-5*16168.6*Z[2]\
-            +3.8042e-9*16168.6*Z[1]+2.0*1.06e-8*16168.6**2*Xpro
+        dSFCdT = -1.6379e-4*16168.6-10.496e-5*16168.6*M\
+            +3.8042e-9*16168.6*h+2.0*1.06e-8*16168.6**2*Xpro
         J['SFC', 'x_pro'] = dSFCdT/self.scalers['SFC']*self.scalers['x_pro']
-        dSFCdh = -3.2956e-5+8.2138e-6*Z[2]-2.0*8.574e-11*Z[1]+3.8042e-9*Tbar
-        dSFCdM = 1.5344-2.0*0.31623*Z[2]+8.2138e-6*Z[1]-10.496e-5*Tbar
-        J['SFC', 'z'] = np.zeros((1, 6))
-        J['SFC', 'z'][0, 1] = dSFCdh/self.scalers['SFC']*self.scalers['z'][1]
-        J['SFC', 'z'][0, 2] = dSFCdM/self.scalers['SFC']*self.scalers['z'][2]
-        J['SFC', 'D'] = np.array([[0]])
+        dSFCdh = -3.2956e-5+8.2138e-6*M-2.0*8.574e-11*h+3.8042e-9*Tbar
+        dSFCdM = 1.5344-2.0*0.31623*M+8.2138e-6*h-10.496e-5*Tbar
+        J['SFC', 'z'] = (np.column_stack([dSFCdh, dSFCdM])/self.scalers['SFC'] \
+            *self.scalers['z'][1:3]).ravel()
         ###############ESF
-        dESFdT = (-inputs['D']*self.scalers['D']/3.0)/(16168.6*Xpro**2)
-        J['ESF', 'x_pro'] = np.array(
-            [[dESFdT/self.scalers['ESF']*self.scalers['x_pro']]])
-        J['ESF', 'z'] = np.zeros((1, 6))
+        dESFdT = (-D/3.0)/(16168.6*Xpro**2)
+        J['ESF', 'x_pro'] = dESFdT/self.scalers['ESF']*self.scalers['x_pro']
         dESFdD = (1.0/3.0)/Tbar
-        J['ESF', 'D'] = np.array([[dESFdD/self.scalers['ESF']*self.scalers['D']]])
+        J['ESF', 'D'] = dESFdD/self.scalers['ESF']*self.scalers['D']
         ###############WE
         dWEdT = 3.0*WBE*1.05*ESF**0.05*dESFdT
-        J['WE', 'x_pro'] = np.array([[dWEdT/self.scalers['WE']*self.scalers['x_pro']]])
-        J['WE', 'z'] = np.zeros((1, 6))
+        J['WE', 'x_pro'] = dWEdT/self.scalers['WE']*self.scalers['x_pro']
         dWEdD = 3.0*WBE*1.05*ESF**0.05*dESFdD
-        J['WE', 'D'] = np.array([[dWEdD/self.scalers['WE']*self.scalers['D']]])
+        J['WE', 'D'] = dWEdD/self.scalers['WE']*self.scalers['D']
         ##############DT
         dDTdT = 16168.6/TUAbar
-        J['DT', 'x_pro'] = np.array([[dDTdT/self.scalers['DT']*self.scalers['x_pro']]])
-        dDTdh = -(-0.50802-0.29326*Z[2]+2.0*6.8572e-6*Z[1])*TUAbar**-2*Tbar
-        dDTdM = -(10856.0+2.0*3200.2*Z[2]-0.29326*Z[1])*TUAbar**-2*Tbar
-        J['DT', 'z'] = np.zeros((1, 6))
-        J['DT', 'z'][0, 1] = dDTdh/self.scalers['DT']*self.scalers['z'][1]
-        J['DT', 'z'][0, 2] = dDTdM/self.scalers['DT']*self.scalers['z'][2]
-        J['DT', 'D'] = np.array([[0.0]])
+        J['DT', 'x_pro'] = dDTdT/self.scalers['DT']*self.scalers['x_pro']
+        dDTdh = -(-0.50802-0.29326*M+2.0*6.8572e-6*h)*TUAbar**-2*Tbar
+        dDTdM = -(10856.0+2.0*3200.2*M-0.29326*h)*TUAbar**-2*Tbar
+        J['DT', 'z'] = (np.column_stack([dDTdh, dDTdM])/self.scalers['DT'] \
+            *self.scalers['z'][1:3]).ravel()
         #############Temp
-        S_shifted, Ai, Aij = self.pf([Z[2], Z[1], abs(Xpro)], [2, 4, 2],
-                                          [.25]*3, "Temp", deriv=True)
-        if abs(Xpro)/self.pf.d['Temp'][2]<=1.25 and abs(Xpro)/self.pf.d['Temp'][2]>=0.75:						  
-            dSTdT = 1.0/self.pf.d['Temp'][2]
-        else:
-            dSTdT = 0.0
-        dSTdT2 = 2.0*S_shifted[0, 2]*dSTdT
-        dTempdT = Ai[2]*dSTdT+0.5*Aij[2, 2]*dSTdT2 \
-            +Aij[0, 2]*S_shifted[0, 0]*dSTdT+Aij[1, 2]*S_shifted[0, 1]*dSTdT
-        J['Temp', 'x_pro'] = np.array(
-            [[dTempdT/self.scalers['Temp']*self.scalers['x_pro']]]).reshape((1, 1))
-        J['Temp', 'z'] = np.zeros((1, 6))
-        if Z[1]/self.pf.d['Temp'][1]<=1.25 and Z[1]/self.pf.d['Temp'][1]>=0.75: 	
-            dShdh = 1.0/self.pf.d['Temp'][1]
-        else:
-            dShdh = 0.0
-        dShdh2 = 2.0*S_shifted[0, 1]*dShdh
-        dTempdh = Ai[1]*dShdh+0.5*Aij[1, 1]*dShdh2 \
-            + Aij[0, 1]*S_shifted[0, 0]*dShdh+Aij[2, 1]*S_shifted[0, 2]*dShdh
-        if Z[2]/self.pf.d['Temp'][0]<=1.25 and Z[2]/self.pf.d['Temp'][0]>=0.75: 	
-            dSMdM = 1.0/self.pf.d['Temp'][0]
-        else:
-            dSMdM = 0.0
-        dSMdM2 = 2.0*S_shifted[0, 0]*dSMdM
-        dTempdM = Ai[0]*dSMdM+0.5*Aij[0, 0]*dSMdM2 \
-            +Aij[1, 0]*S_shifted[0, 1]*dSMdM+Aij[2, 0]*S_shifted[0, 2]*dSMdM
-        J['Temp', 'z'][0, 1] = dTempdh/self.scalers['Temp']*self.scalers['z'][1]
-        J['Temp', 'z'][0, 2] = dTempdM/self.scalers['Temp']*self.scalers['z'][2]
-        J['Temp', 'D'] = np.array([[0.0]])
-        return J
+        _, dTemp = self.pf.batch(np.column_stack([M, h, abs(Xpro)]), [2, 4, 2],
+                                 [.25]*3, "Temp", deriv=True)
+        dTempdT = dTemp[:, 2]
+        J['Temp', 'x_pro'] = dTempdT/self.scalers['Temp']*self.scalers['x_pro']
+        dTempdh = dTemp[:, 1]
+        dTempdM = dTemp[:, 0]
+        J['Temp', 'z'] = (np.column_stack([dTempdh, dTempdM])/self.scalers['Temp'] \
+            *self.scalers['z'][1:3]).ravel()
 
 if __name__ == "__main__": # pragma: no cover
 
-    from openmdao.api import Component, Problem, Group, IndepVarComp
+    from openmdao.api import Problem, IndepVarComp
+    from .reference import polynomial_reference
     scalers = {}
     scalers['z'] = np.array([0.05, 45000., 1.6, 5.5, 55.0, 1000.0])
     scalers['x_pro'] = 0.5
@@ -143,11 +152,12 @@ if __name__ == "__main__": # pragma: no cover
     scalers['WE'] = 5748.915355
     scalers['DT'] = 0.278366
     scalers['D'] = 12193.7018
+    pf = polynomial_reference(scalers['z'], np.array([0.25, 1.0]), 1.0, 0.5, 49909.58578)
     top = Problem()
     top.model.add_subsystem('z_in', IndepVarComp('z', np.array([1.2,  1.333,  0.875,  0.45 ,  1.27 ,  1.5])),
                             promotes=['*'])
     top.model.add_subsystem('x_pro_in', IndepVarComp('x_pro', 0.3126), promotes=['*'])
     top.model.add_subsystem('D_in', IndepVarComp('D', 0.457), promotes=['*'])
-    top.model.add_subsystem('Pro1', Propulsion(scalers, PolynomialFunction()), promotes=['*'])
+    top.model.add_subsystem('Pro1', Propulsion(scalers, pf), promotes=['*'])
     top.setup()
     top.check_partials(compact_print=True)
@@ -0,0 +1,39 @@
+"""
+SSBJ test case - http://ntrs.nasa.gov/archive/nasa/casi.ntrs.nasa.gov/19980234657.pdf
+Python implementation and OpenMDAO integration developed by
+Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
+"""
+from .common import PolynomialFunction, polynomial_function, polynomial_stack
+from .structure import structure
+from .aerodynamics import aerodynamics
+from .propulsion import propulsion
+# pylint: disable=C0103
+
+class _Recorder(object):
+    """
+    Polynomial evaluations which record in d the inputs of the first call
+    to each response.
+    """
+
+    def __init__(self, d):
+        self.d = d
+
+    def __call__(self, S_new, flag, S_bound, var):
+        return polynomial_function(self.d, S_new, flag, S_bound, var)
+
+    def stack(self, S_new, flag, S_bounds, variables):
+        return polynomial_stack(self.d, S_new, flag, S_bounds, variables)
+
+def polynomial_reference(Z, x_str, x_aer, x_pro, WT, WE=1.0, ESF=1.0):
+    """
+    Returns the PolynomialFunction whose reference point is given by the inputs
+    of the first Gauss-Seidel pass through structure, aerodynamics and propulsion
+    at the design point (Z, x_str, x_aer, x_pro), starting from the WT, WE and ESF
+    coupling guesses.
+    """
+    d = {}
+    pf = _Recorder(d)
+    Theta, _, WT, _ = structure(pf, x_str, Z, WT, WE)
+    _, D, _, _ = aerodynamics(pf, x_aer, Z, WT, ESF, Theta)
+    propulsion(pf, x_pro, Z, D)
+    return PolynomialFunction(d)
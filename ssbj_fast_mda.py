@@ -0,0 +1,162 @@
+"""
+SSBJ test case - http://ntrs.nasa.gov/archive/nasa/casi.ntrs.nasa.gov/19980234657.pdf
+Python implementation and OpenMDAO integration developed by
+Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
+
+Multidisciplinary analysis of SSBJ_MDA written with the discipline functions
+only, without the OpenMDAO Problem, for bulk analyses of many design points.
+Inputs and outputs are scaled as in SSBJ_MDA.
+"""
+from __future__ import print_function
+import warnings
+import numpy as np
+
+from ssbj_disciplines.structure import structure, structure_batch
+from ssbj_disciplines.aerodynamics import aerodynamics, aerodynamics_batch
+from ssbj_disciplines.propulsion import propulsion, propulsion_batch
+from ssbj_disciplines.performance import performance, performance_batch
+from ssbj_disciplines.constraints import constraints
+# pylint: disable=C0103
+
+# Outputs of the coupled structure, aerodynamics and propulsion disciplines
+# with their sizes, whose change between two Gauss-Seidel sweeps is the
+# convergence norm of NonlinearBlockGS
+COUPLINGS = [('Theta', 1), ('WF', 1), ('WT', 1), ('sigma', 5),
+             ('L', 1), ('D', 1), ('fin', 1), ('dpdx', 1),
+             ('SFC', 1), ('WE', 1), ('ESF', 1), ('DT', 1), ('Temp', 1)]
+
+# Discipline functions at one design point and at N design points
+KERNELS = (structure, aerodynamics, propulsion)
+BATCH_KERNELS = (structure_batch, aerodynamics_batch, propulsion_batch)
+
+def _sweep(scalers, pf, Z, x_str, x_aer, x_pro, outputs, kernels=KERNELS):
+    """
+    Gauss-Seidel sweep through the structure, aerodynamics and propulsion
+    kernels updating the scaled outputs in place.
+    """
+    s = scalers
+    structure_, aerodynamics_, propulsion_ = kernels
+    Theta, WF, WT, sigma = structure_(pf, x_str, Z, outputs['L']*s['L'], outputs['WE']*s['WE'])
+    outputs['Theta'] = Theta/s['Theta']
+    outputs['WF'] = WF/s['WF']
+    outputs['WT'] = WT/s['WT']
+    outputs['sigma'] = np.reshape(sigma, np.shape(outputs['sigma']))/s['sigma']
+
+    L, D, fin, dpdx = aerodynamics_(pf, x_aer, Z, outputs['WT']*s['WT'],
+                                    outputs['ESF']*s['ESF'], outputs['Theta']*s['Theta'])
+    outputs['L'] = L/s['L']
+    outputs['D'] = D/s['D']
+    outputs['fin'] = fin/s['fin']
+    outputs['dpdx'] = dpdx/s['dpdx']
+
+    Temp, ESF, SFC, WE, DT = propulsion_(pf, x_pro, Z, outputs['D']*s['D'])
+    outputs['SFC'] = SFC/s['SFC']
+    outputs['WE'] = WE/s['WE']
+    outputs['ESF'] = ESF/s['ESF']
+    outputs['DT'] = DT/s['DT']
+    outputs['Temp'] = Temp/s['Temp']
+
+def _coupling_vector(outputs):
+    return np.hstack([outputs[name] for name, _ in COUPLINGS])
+
+def _coupling_matrix(outputs):
+    return np.column_stack([outputs[name] for name, _ in COUPLINGS])
+
+def solve_mda(scalers, pf, z, x_str, x_aer, x_pro, atol=1.0e-3, rtol=1.0e-10,
+              maxiter=10, start=None):
+    """
+    Multidisciplinary analysis of SSBJ_MDA at one design point, converged by
+    Gauss-Seidel sweeps with the semantics of NonlinearBlockGS: the norm is the
+    change of the coupled disciplines outputs over a sweep and the sweeps stop
+    when it falls below atol, or rtol times its first value, or after maxiter
+    sweeps. The couplings start from the scaled values of start, all ones by
+    default as in a new SSBJ_MDA problem.
+    Returns the dictionary of the scaled outputs, couplings, range R and
+    constraint vector con, the number of sweeps and whether the couplings converged.
+    """
+    s = scalers
+    Z = np.asarray(z, dtype=float)*s['z']
+    x_str = np.asarray(x_str, dtype=float)*s['x_str']
+    x_aer = np.asarray(x_aer, dtype=float)*s['x_aer']
+    x_pro = np.asarray(x_pro, dtype=float)*s['x_pro']
+
+    outputs = dict((name, np.ones(size)) for name, size in COUPLINGS)
+    if start is not None:
+        outputs.update((name, np.array(start[name], dtype=float).reshape(size))
+                       for name, size in COUPLINGS)
+
+    norm0 = None
+    iterations = 0
+    while True:
+        previous = _coupling_vector(outputs)
+        _sweep(scalers, pf, Z, x_str, x_aer, x_pro, outputs)
+        iterations += 1
+        norm = np.linalg.norm(_coupling_vector(outputs) - previous)
+        if norm0 is None:
+            norm0 = norm if norm != 0. else 1.
+        converged = norm <= atol or norm/norm0 <= rtol
+        if converged or iterations >= maxiter:
+            break
+
+    R = performance(Z, outputs['fin']*s['fin'], outputs['SFC']*s['SFC'],
+                    outputs['WT']*s['WT'], outputs['WF']*s['WF'])
+    outputs['R'] = np.reshape(R, -1)/s['R']
+    outputs['con'] = constraints(scalers, outputs)[0]
+    return outputs, iterations, converged
+
+def solve_mda_batch(scalers, pf, z, x_str, x_aer, x_pro, atol=1.0e-3, rtol=1.0e-10,
+                    maxiter=10, start=None):
+    """
+    solve_mda at N design points at once: z is (N, 6), x_str is (N, 2), x_aer
+    and x_pro have length N. The Gauss-Seidel sweeps are vectorized over the
+    points whose couplings have not converged yet, each point stopping as
+    solve_mda would. The couplings start from the scaled values of start,
+    arrays of N values or of (N, 5) for sigma, all ones by default.
+    Returns the dictionary of the outputs stacked along a first axis of length
+    N, and the length-N arrays of the numbers of sweeps and of the convergence
+    flags. Warns about the points whose couplings did not converge.
+    """
+    s = scalers
+    z = np.atleast_2d(z)
+    n = z.shape[0]
+    Z = np.asarray(z, dtype=float)*s['z']
+    x_str = np.reshape(x_str, (n, 2))*s['x_str']
+    x_aer = np.reshape(x_aer, n)*s['x_aer']
+    x_pro = np.reshape(x_pro, n)*s['x_pro']
+
+    outputs = dict((name, np.ones((n, size)) if size > 1 else np.ones(n))
+                   for name, size in COUPLINGS)
+    if start is not None:
+        outputs.update((name, np.array(start[name], dtype=float).reshape(outputs[name].shape))
+                       for name, _ in COUPLINGS)
+
+    norm0 = np.ones(n)
+    iterations = np.zeros(n, dtype=int)
+    converged = np.zeros(n, dtype=bool)
+    active = np.arange(n)
+    while active.size:
+        active_outputs = dict((name, outputs[name][active]) for name, _ in COUPLINGS)
+        previous = _coupling_matrix(active_outputs)
+        _sweep(scalers, pf, Z[active], x_str[active], x_aer[active], x_pro[active],
+               active_outputs, BATCH_KERNELS)
+        for name, _ in COUPLINGS:
+            outputs[name][active] = active_outputs[name]
+        norm = np.linalg.norm(_coupling_matrix(active_outputs) - previous, axis=1)
+        first = iterations[active] == 0
+        norm0[active[first]] = np.where(norm[first] != 0., norm[first], 1.)
+        iterations[active] += 1
+        done = (norm <= atol) | (norm/norm0[active] <= rtol)
+        converged[active] = done
+        active = active[~done & (iterations[active] < maxiter)]
+
+    R = performance_batch(Z, outputs['fin']*s['fin'], outputs['SFC']*s['SFC'],
+                          outputs['WT']*s['WT'], outputs['WF']*s['WF'])
+    outputs['R'] = R/s['R']
+    outputs['con'] = constraints(scalers, outputs)
+
+    if not np.all(converged):
+        failed = np.flatnonzero(~converged)
+        warnings.warn('MDA not converged after {} sweeps at {} of {} design points: {}{}'.format(
+            maxiter, failed.size, n, ', '.join(str(i) for i in failed[:10]),
+            ', ...' if failed.size > 10 else ''))
+    return outputs, iterations, converged
@@ -4,116 +4,151 @@ Python implementation and OpenMDAO integration developed by
 Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
 """
 from __future__ import print_function
+import six
 from sys import argv
-import re
-import numpy as np
-import matplotlib.pylab as plt
 
 from openmdao.api import Problem
 from openmdao.api import SqliteRecorder, ScipyOptimizeDriver #, pyOptSparseDriver
 
 from ssbj_idf_mda import SSBJ_IDF_MDA
 from ssbj_mda import init_ssbj_mda
+from ssbj_mdf import BOUNDS
+from ssbj_coloring import setup_total_coloring
 # pylint: disable=C0103
 
-# Optimization problem
-scalers = init_ssbj_mda()
-print(scalers)
-
-prob = Problem()
-prob.model = SSBJ_IDF_MDA(scalers)
-
-# Optimizer options
-prob.driver = ScipyOptimizeDriver()
-# prob.driver = pyOptSparseDriver()
-optimizer = 'SLSQP'
-prob.driver.options['optimizer'] = optimizer
-#prob.driver.options['tol'] = 1e-3
-#prob.driver.options['debug_print'] = ['desvars','ln_cons','nl_cons','objs']
-
-#Design variables
-prob.model.add_design_var('z', lower=np.array([0.2, 0.666,0.875,0.45,0.72,0.5]),
-                            upper=np.array([1.8,1.333,1.125,1.45,1.27,1.5]))
-prob.model.add_design_var('x_str', lower=np.array([0.4,0.75]), upper=np.array([1.6,1.25]))
-prob.model.add_design_var('x_aer', lower=0.75, upper=1.25)
-prob.model.add_design_var('x_pro', lower=0.18, upper=1.81)
-
-prob.model.add_design_var('Theta')
-prob.model.add_design_var('L')
-prob.model.add_design_var('WE')
-prob.model.add_design_var('WT')
-prob.model.add_design_var('ESF')
-prob.model.add_design_var('D')
-
-# Objective function
-prob.model.add_objective('obj')
-
-#Constraints
-prob.model.add_constraint('con_dt', upper=0.0)
-prob.model.add_constraint('con_Theta_up', upper=0.0)
-prob.model.add_constraint('con_Theta_low', upper=0.0)
-prob.model.add_constraint('con_sigma1', upper=0.0)
-prob.model.add_constraint('con_sigma2', upper=0.0)
-prob.model.add_constraint('con_sigma3', upper=0.0)
-prob.model.add_constraint('con_sigma4', upper=0.0)
-prob.model.add_constraint('con_sigma5', upper=0.0)
-prob.model.add_constraint('con_dpdx', upper=0.0)
-prob.model.add_constraint('con_esf', upper=0.0)
-prob.model.add_constraint('con_temp', upper=0.0)
-
-#Coupling constraints
-#Threshold for the coupling (constraints define as (x_in-x_out)**2<epsilon)
-epsilon=1e-10
-prob.model.add_constraint('con_str_aer_wt',upper=epsilon)
-prob.model.add_constraint('con_str_aer_theta',upper=epsilon)
-prob.model.add_constraint('con_aer_str_l',upper=epsilon)
-prob.model.add_constraint('con_aer_pro_d',upper=epsilon)
-prob.model.add_constraint('con_pro_aer_esf',upper=epsilon)
-prob.model.add_constraint('con_pro_str_we',upper=epsilon)
-#Recorder
-db_name = 'ssbj_idf.sqlite'
-if "--plot" in argv:
-    recorder = SqliteRecorder(db_name)
-#    recorder2 = WebRecorder("", case_name="SSBJ IDF")
-    prob.driver.recording_options['record_desvars'] = True
-    prob.driver.recording_options['record_objectives'] = True
-    prob.driver.recording_options['record_constraints'] = True
-    prob.driver.add_recorder(recorder)
-#    prob.driver.add_recorder(recorder2)
-
-#Run optimization
-prob.setup(mode='fwd')
-prob.run_driver()
-#prob.run_model()
-#prob.check_partials()
-#prob.cleanup()
-
-print('Z_opt=', prob['z']*scalers['z'])
-print('X_str_opt=', prob['x_str']*scalers['x_str'])
-print('X_aer_opt=', prob['x_aer'])
-print('X_pro_opt=', prob['x_pro']*scalers['x_pro'])
-print('R_opt=', -prob['obj']*scalers['R'])
-
-if "--plot" in argv:
-    from openmdao.recorders.case_reader import CaseReader
-    plt.figure()
-
-    cr = CaseReader(db_name)
-    print('Number of driver cases recorded =', cr.driver_cases.num_cases )
-    case_keys = cr.driver_cases.list_cases()
-    r = []
-    for case_key in case_keys:    
-        r.append(-cr.driver_cases.get_case(case_key).objectives['obj']*scalers['R'])
-    plt.plot(r)
-    plt.xlabel('Iteration')
-    plt.ylabel('Range (Nm)')
-    plt.show()
-
-# Check R =~ 3964Nm
-R = float(-prob['obj']*scalers['R'])
-assert(R > 3950.)
-assert(R < 3970.)
-# from openmdao.devtools.problem_viewer.problem_viewer import view_model
-# view_model(prob)
-
-
+# Coupling variables, design variables of the IDF formulation
+COUPLINGS = ['Theta', 'L', 'WE', 'WT', 'ESF', 'D']
+
+# Options of build_idf_problem
+DEFAULT_OPTIONS = {
+    'scalers': None,        # scalers and polynomial reference of init_ssbj_mda,
+    'pf': None,             # computed when not given
+    'optimizer': 'SLSQP',
+    'maxiter': 200,
+    'tol': 1e-6,
+    'disp': True,
+    'couplings': 'squared', # coupling constraints, see SSBJ_IDF_MDA
+    'epsilon': 1e-10,       # threshold of the squared coupling constraints
+    'parallel': False,      # disciplines in a ParallelGroup, see SSBJ_IDF_MDA
+    'coloring': True,       # total coloring and derivative mode, see ssbj_coloring
+    'mode': 'fwd',          # derivative mode without coloring
+    'check': False,         # setup checks
+    'recorder': None,       # sqlite database of the driver cases
+}
+
+def idf_options(options=None):
+    """
+    DEFAULT_OPTIONS updated with options, raising a KeyError on an unknown option.
+    """
+    merged = dict(DEFAULT_OPTIONS)
+    for key, value in six.iteritems(options or {}):
+        if key not in DEFAULT_OPTIONS:
+            raise KeyError('Unknown IDF option {}, expected one of {}'.format(
+                key, sorted(DEFAULT_OPTIONS)))
+        merged[key] = value
+    return merged
+
+def build_idf_problem(options=None):
+    """
+    Sets up the IDF optimization problem of SSBJ_IDF_MDA with options, see
+    DEFAULT_OPTIONS.
+    """
+    options = idf_options(options)
+    scalers, pf = options['scalers'], options['pf']
+    if scalers is None or pf is None:
+        scalers, pf = init_ssbj_mda()
+
+    prob = Problem()
+    prob.model = SSBJ_IDF_MDA(scalers, pf, parallel=options['parallel'],
+                              couplings=options['couplings'])
+
+    # Optimizer options
+    prob.driver = ScipyOptimizeDriver(optimizer=options['optimizer'], maxiter=options['maxiter'],
+                                      tol=options['tol'], disp=options['disp'])
+    # prob.driver = pyOptSparseDriver()
+    #prob.driver.options['debug_print'] = ['desvars','ln_cons','nl_cons','objs']
+
+    #Design variables
+    for name, (lower, upper) in BOUNDS.items():
+        prob.model.add_design_var(name, lower=lower, upper=upper)
+    for name in COUPLINGS:
+        prob.model.add_design_var(name)
+
+    # Objective function
+    prob.model.add_objective('obj')
+
+    #Constraints
+    prob.model.add_constraint('con', upper=0.0)
+
+    #Coupling constraints
+    if options['couplings'] == 'linear':
+        prob.model.add_constraint('con_couplings', equals=0.0)
+    else:
+        #Threshold for the coupling (constraints define as (x_in-x_out)**2<epsilon)
+        epsilon = options['epsilon']
+        prob.model.add_constraint('con_str_aer_wt',upper=epsilon)
+        prob.model.add_constraint('con_str_aer_theta',upper=epsilon)
+        prob.model.add_constraint('con_aer_str_l',upper=epsilon)
+        prob.model.add_constraint('con_aer_pro_d',upper=epsilon)
+        prob.model.add_constraint('con_pro_aer_esf',upper=epsilon)
+        prob.model.add_constraint('con_pro_str_we',upper=epsilon)
+
+    #Recorder
+    if options['recorder']:
+        recorder = SqliteRecorder(options['recorder'])
+        prob.driver.recording_options['record_desvars'] = True
+        prob.driver.recording_options['record_objectives'] = True
+        prob.driver.recording_options['record_constraints'] = True
+        prob.driver.add_recorder(recorder)
+
+    if options['coloring']:
+        setup_total_coloring(prob, check=options['check'])
+    else:
+        prob.setup(check=options['check'], mode=options['mode'])
+    if not options['disp']:
+        prob.set_solver_print(level=-1)
+    prob.final_setup()
+    return prob
+
+if __name__ == '__main__':
+    db_name = 'ssbj_idf.sqlite'
+    scalers, pf = init_ssbj_mda()
+    print(scalers)
+
+    #Run optimization
+    prob = build_idf_problem({'scalers': scalers, 'pf': pf, 'parallel': "--parallel" in argv,
+                              'couplings': 'linear' if "--linear" in argv else 'squared',
+                              'recorder': db_name if "--plot" in argv else None})
+    prob.run_driver()
+    #prob.run_model()
+    #prob.check_partials()
+    #prob.cleanup()
+
+    print('Z_opt=', prob['z']*scalers['z'])
+    print('X_str_opt=', prob['x_str']*scalers['x_str'])
+    print('X_aer_opt=', prob['x_aer'])
+    print('X_pro_opt=', prob['x_pro']*scalers['x_pro'])
+    print('R_opt=', -prob['obj']*scalers['R'])
+
+    if "--plot" in argv:
+        import matplotlib.pylab as plt
+        from openmdao.recorders.case_reader import CaseReader
+        plt.figure()
+
+        cr = CaseReader(db_name)
+        print('Number of driver cases recorded =', cr.driver_cases.num_cases )
+        case_keys = cr.driver_cases.list_cases()
+        r = []
+        for case_key in case_keys:
+            r.append(-cr.driver_cases.get_case(case_key).objectives['obj']*scalers['R'])
+        plt.plot(r)
+        plt.xlabel('Iteration')
+        plt.ylabel('Range (Nm)')
+        plt.show()
+
+    # Check R =~ 3964Nm
+    R = float(-prob['obj']*scalers['R'])
+    assert(R > 3950.)
+    assert(R < 3970.)
+    # from openmdao.devtools.problem_viewer.problem_viewer import view_model
+    # view_model(prob)
@@ -4,22 +4,44 @@ Python implementation and OpenMDAO integration developed by
 Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
 """
 import numpy as np
-from openmdao.api import Group, ExecComp, IndepVarComp
+from openmdao.api import Group, ParallelGroup, ExecComp, IndepVarComp
 
+from ssbj_disciplines.atmosphere import Atmosphere
 from ssbj_disciplines.aerodynamics import Aerodynamics
 from ssbj_disciplines.performance import Performance
 from ssbj_disciplines.propulsion import Propulsion
 from ssbj_disciplines.structure import Structure
+from ssbj_disciplines.constraints import SSBJConstraints, IDF_CONSTRAINTS
+from ssbj_disciplines.constraints import CouplingConstraints, IDF_COUPLINGS
 # pylint: disable=C0103
 
+# Formulations of the coupling constraints
+COUPLING_MODES = ['squared', 'linear']
+
+# Discipline computing each coupling variable
+COUPLING_SOURCES = {'WT': 'Struc', 'Theta': 'Struc', 'L': 'Aero', 'D': 'Aero',
+                    'ESF': 'Propu', 'WE': 'Propu'}
+
 class SSBJ_IDF_MDA(Group):
     """
     Analysis for IDF formulation where couplings are managed as additional constraints
     on input/output variables of related disciplines.
+    The structure, aerodynamics and propulsion disciplines, which only depend on
+    design variables, are in a ParallelGroup when parallel, so that they run
+    concurrently on separate processes under MPI.
+    The coupling constraints are the squared differences of each coupling
+    target and discipline output, or their differences when couplings is
+    'linear', see COUPLING_MODES.
     """
-    def __init__(self, scalers):
+    def __init__(self, scalers, pf, parallel=False, couplings='squared'):
         super(SSBJ_IDF_MDA, self).__init__()
         self.scalers = scalers
+        self.pf = pf
+        self.parallel = parallel
+        if couplings not in COUPLING_MODES:
+            raise ValueError('Unknown coupling constraints {}, expected one of {}'.format(
+                couplings, COUPLING_MODES))
+        self.couplings = couplings
 
     def setup(self):        
         #Design variables
@@ -37,102 +59,98 @@ class SSBJ_IDF_MDA(Group):
         self.add_subsystem('D_ini', IndepVarComp('D', 0.457), promotes=['*'])
 
         #Disciplines
-        self.add_subsystem('Struc', Structure(self.scalers))
-        self.add_subsystem('Aero', Aerodynamics(self.scalers))
-        self.add_subsystem('Propu', Propulsion(self.scalers))
+        self.add_subsystem('Atmo', Atmosphere(self.scalers))
+        if self.parallel:
+            disciplines = self.add_subsystem('Disciplines', ParallelGroup())
+            prefix = 'Disciplines.'
+        else:
+            disciplines = self
+            prefix = ''
+        disciplines.add_subsystem('Struc', Structure(self.scalers, self.pf))
+        disciplines.add_subsystem('Aero', Aerodynamics(self.scalers, self.pf))
+        disciplines.add_subsystem('Propu', Propulsion(self.scalers, self.pf))
         self.add_subsystem('Perfo', Performance(self.scalers))
 
         #Shared variables z
-        self.connect('z', 'Struc.z')
-        self.connect('z', 'Aero.z')
-        self.connect('z', 'Propu.z')
+        self.connect('z', 'Atmo.z')
+        self.connect('z', prefix+'Struc.z')
+        self.connect('z', prefix+'Aero.z')
+        self.connect('z', prefix+'Propu.z')
         self.connect('z', 'Perfo.z')
 
         # Local variables
-        self.connect('x_str', 'Struc.x_str')
-        self.connect('x_aer', 'Aero.x_aer')
-        self.connect('x_pro', 'Propu.x_pro')
+        self.connect('x_str', prefix+'Struc.x_str')
+        self.connect('x_aer', prefix+'Aero.x_aer')
+        self.connect('x_pro', prefix+'Propu.x_pro')
+
+        # Flight conditions
+        self.connect('Atmo.V', prefix+'Aero.V')
+        self.connect('Atmo.rho', prefix+'Aero.rho')
+        self.connect('Atmo.theta', 'Perfo.theta')
 
         # Coupling variables
-        self.connect('L', 'Struc.L')
-        self.connect('WE', 'Struc.WE')
-        self.connect('WT', 'Aero.WT')
-        self.connect('Theta', 'Aero.Theta')
-        self.connect('ESF', 'Aero.ESF')
-        self.connect('D','Propu.D')
+        self.connect('L', prefix+'Struc.L')
+        self.connect('WE', prefix+'Struc.WE')
+        self.connect('WT', prefix+'Aero.WT')
+        self.connect('Theta', prefix+'Aero.Theta')
+        self.connect('ESF', prefix+'Aero.ESF')
+        self.connect('D',prefix+'Propu.D')
 
         # Objective function
         self.add_subsystem('Obj', ExecComp('obj=-R'), promotes=['obj'])
 
         # Connections
         self.connect('Perfo.R','Obj.R')
-        self.connect('Propu.SFC','Perfo.SFC')
-        self.connect('Aero.fin','Perfo.fin')
-        self.connect('Struc.WT','Perfo.WT')
-        self.connect('Struc.WF','Perfo.WF')
+        self.connect(prefix+'Propu.SFC','Perfo.SFC')
+        self.connect(prefix+'Aero.fin','Perfo.fin')
+        self.connect(prefix+'Struc.WT','Perfo.WT')
+        self.connect(prefix+'Struc.WF','Perfo.WF')
 
         #Coupling constraints
-        self.add_subsystem('con_Str_Aer_WT', ExecComp('con_str_aer_wt = (WTi-WT)**2',WTi=1.0),
-                 promotes=['con_str_aer_wt'])
-        self.connect('Struc.WT','con_Str_Aer_WT.WT')
-        self.connect('WT','con_Str_Aer_WT.WTi')
-
-        self.add_subsystem('con_Str_Aer_Theta', ExecComp('con_str_aer_theta = (Thetai-Theta)**2'),
-                 promotes=['con_str_aer_theta'])
-        self.connect('Struc.Theta', 'con_Str_Aer_Theta.Theta')
-        self.connect('Theta', 'con_Str_Aer_Theta.Thetai')
-
-        self.add_subsystem('con_Aer_Str_L', ExecComp('con_aer_str_l = (Li-L)**2'),
-                 promotes=['con_aer_str_l'])
-        self.connect('Aero.L','con_Aer_Str_L.L')
-        self.connect('L','con_Aer_Str_L.Li')
-
-        self.add_subsystem('con_Aer_Pro_D', ExecComp('con_aer_pro_d = (Di-D)**2'),
-                 promotes=['con_aer_pro_d'])
-        self.connect('Aero.D','con_Aer_Pro_D.D')
-        self.connect('D','con_Aer_Pro_D.Di')
-
-        self.add_subsystem('con_Pro_Aer_ESF', ExecComp('con_pro_aer_esf = (ESFi-ESF)**2'),
-                 promotes=['con_pro_aer_esf'])
-        self.connect('Propu.ESF','con_Pro_Aer_ESF.ESF')
-        self.connect('ESF','con_Pro_Aer_ESF.ESFi')
-
-        self.add_subsystem('con_Pro_Str_WE',ExecComp('con_pro_str_we = (WEi-WE)**2'),
-                 promotes=['con_pro_str_we'])
-        self.connect('Propu.WE','con_Pro_Str_WE.WE')
-        self.connect('WE','con_Pro_Str_WE.WEi')
+        if self.couplings == 'linear':
+            self.add_subsystem('Couplings', CouplingConstraints(IDF_COUPLINGS),
+                     promotes_outputs=['con_couplings'])
+            for _, var in IDF_COUPLINGS:
+                self.connect(var, 'Couplings.'+var+'_target')
+                self.connect(prefix+COUPLING_SOURCES[var]+'.'+var, 'Couplings.'+var)
+        else:
+            self.add_subsystem('con_Str_Aer_WT', ExecComp('con_str_aer_wt = (WTi-WT)**2',WTi=1.0),
+                     promotes=['con_str_aer_wt'])
+            self.connect(prefix+'Struc.WT','con_Str_Aer_WT.WT')
+            self.connect('WT','con_Str_Aer_WT.WTi')
+
+            self.add_subsystem('con_Str_Aer_Theta', ExecComp('con_str_aer_theta = (Thetai-Theta)**2'),
+                     promotes=['con_str_aer_theta'])
+            self.connect(prefix+'Struc.Theta', 'con_Str_Aer_Theta.Theta')
+            self.connect('Theta', 'con_Str_Aer_Theta.Thetai')
+
+            self.add_subsystem('con_Aer_Str_L', ExecComp('con_aer_str_l = (Li-L)**2'),
+                     promotes=['con_aer_str_l'])
+            self.connect(prefix+'Aero.L','con_Aer_Str_L.L')
+            self.connect('L','con_Aer_Str_L.Li')
+
+            self.add_subsystem('con_Aer_Pro_D', ExecComp('con_aer_pro_d = (Di-D)**2'),
+                     promotes=['con_aer_pro_d'])
+            self.connect(prefix+'Aero.D','con_Aer_Pro_D.D')
+            self.connect('D','con_Aer_Pro_D.Di')
+
+            self.add_subsystem('con_Pro_Aer_ESF', ExecComp('con_pro_aer_esf = (ESFi-ESF)**2'),
+                     promotes=['con_pro_aer_esf'])
+            self.connect(prefix+'Propu.ESF','con_Pro_Aer_ESF.ESF')
+            self.connect('ESF','con_Pro_Aer_ESF.ESFi')
+
+            self.add_subsystem('con_Pro_Str_WE',ExecComp('con_pro_str_we = (WEi-WE)**2'),
+                     promotes=['con_pro_str_we'])
+            self.connect(prefix+'Propu.WE','con_Pro_Str_WE.WE')
+            self.connect('WE','con_Pro_Str_WE.WEi')
 
         #Local constraints
-        self.add_subsystem('con_Theta_sup', 
-                 ExecComp('con_Theta_up = Theta*'+str(self.scalers['Theta'])+'-1.04'),
-                 promotes=['con_Theta_up'])
-        self.connect('Theta','con_Theta_sup.Theta')
-
-        self.add_subsystem('con_Theta_inf',
-                 ExecComp('con_Theta_low = 0.96-Theta*'+str(self.scalers['Theta'])),
-                 promotes=['con_Theta_low'])
-
-        self.connect('Theta','con_Theta_inf.Theta')
-        for i in range(5):
-            self.add_subsystem('con_Sigma'+str(i+1),
-                     ExecComp('con_sigma'+str(i+1)+'=sigma['+str(i)+']*'+\
-                              str(self.scalers['sigma'][i])+'-1.9',
-                              sigma=np.zeros(5)),
-                     promotes=['con_sigma'+str(i+1)])
-            self.connect('Struc.sigma','con_Sigma'+str(i+1)+'.sigma')
-
-        self.add_subsystem('con_Dpdx',ExecComp('con_dpdx=dpdx*'+str(self.scalers['dpdx'])+'-1.04'),
-                 promotes=['con_dpdx'])
-        self.connect('Aero.dpdx','con_Dpdx.dpdx')
-
-        self.add_subsystem('con_ESF', ExecComp('con_esf=ESF*'+str(self.scalers['ESF'])+'-1.5'),
-                 promotes=['con_esf'])
-        self.connect('ESF','con_ESF.ESF')
-
-        self.add_subsystem('con_Temp', ExecComp('con_temp=Temp*'+str(self.scalers['Temp'])+'-1.0'),
-                 promotes=['con_temp'])
-        self.connect('Propu.Temp', 'con_Temp.Temp')
-        
-        self.add_subsystem('con_DT', ExecComp('con_dt=DT'), promotes=['con_dt'])
-        self.connect('Propu.DT', 'con_DT.DT')
+        self.add_subsystem('Constraints', SSBJConstraints(self.scalers, IDF_CONSTRAINTS),
+                 promotes_outputs=['con'])
+        self.connect('Theta', 'Constraints.Theta')
+        self.connect(prefix+'Struc.sigma', 'Constraints.sigma')
+        self.connect(prefix+'Aero.dpdx', 'Constraints.dpdx')
+        self.connect('ESF', 'Constraints.ESF')
+        self.connect(prefix+'Propu.Temp', 'Constraints.Temp')
+        self.connect(prefix+'Propu.DT', 'Constraints.DT')
 
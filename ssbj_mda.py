@@ -4,26 +4,189 @@ Python implementation and OpenMDAO integration developed by
 Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
 """
 from __future__ import print_function
+import os
+import glob
+import hashlib
+import warnings
+import zipfile
+from collections import OrderedDict
 from six import iterkeys
 import numpy as np
 
-from openmdao.api import ExecComp, IndepVarComp
+from openmdao.api import IndepVarComp
 from openmdao.api import Group, Problem
-from openmdao.api import NonlinearBlockGS, ScipyKrylov
+from openmdao.api import NonlinearBlockGS, NonlinearBlockJac, NewtonSolver
+from openmdao.api import ScipyKrylov, DirectSolver
 
+from ssbj_disciplines.atmosphere import Atmosphere
 from ssbj_disciplines.aerodynamics import Aerodynamics
 from ssbj_disciplines.performance import Performance
 from ssbj_disciplines.propulsion import Propulsion
-from ssbj_disciplines.structure import Structure
+from ssbj_disciplines.structure import Structure, weight_guess
+from ssbj_disciplines.constraints import SSBJConstraints
 from ssbj_disciplines.common import PolynomialFunction
+from ssbj_disciplines.reference import polynomial_reference
+
+# Folder of the init_ssbj_mda results cache, None disables the cache
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files')
+# Incremented when the layout of the cache files changes
+CACHE_VERSION = 1
+
+# Strategies available to converge the structure/aerodynamics/propulsion couplings
+MDA_STRATEGIES = ['gs', 'gs_aitken', 'jacobi', 'newton']
+
+def mda_solvers(mda):
+    """
+    Returns the nonlinear and linear solvers of the coupled disciplines for the
+    MDA strategy mda: Gauss-Seidel ('gs'), Gauss-Seidel with Aitken relaxation
+    ('gs_aitken'), Jacobi ('jacobi') or Newton with a direct linear solver ('newton').
+    """
+    if mda == 'gs':
+        nonlinear_solver = NonlinearBlockGS(atol=1.0e-3)
+    elif mda == 'gs_aitken':
+        nonlinear_solver = NonlinearBlockGS(atol=1.0e-3, use_aitken=True)
+    elif mda == 'jacobi':
+        nonlinear_solver = NonlinearBlockJac(atol=1.0e-3)
+    elif mda == 'newton':
+        # Uses the analytic partials of the disciplines
+        nonlinear_solver = NewtonSolver(atol=1.0e-10, rtol=1.0e-10, maxiter=20,
+                                        solve_subsystems=False)
+        return nonlinear_solver, DirectSolver()
+    else:
+        raise ValueError('Unknown MDA strategy {}'.format(mda))
+    return nonlinear_solver, ScipyKrylov()
+
+class CouplingCache(object):
+    """
+    Bounded cache of converged coupling states keyed by the design variables,
+    the least recently used state being dropped first. A solve starts from the
+    state of the nearest cached design when it lies within radius (euclidean
+    distance of the scaled design variables), and from the state left by the
+    previous solve otherwise.
+
+    The previous solve is the nearest design as long as the designs follow a
+    path, as with analytic total derivatives, and the cache then saves nothing.
+    It pays off when the solves jump between designs: finite difference steps
+    around a base point, line search backtracking or several start points.
+    """
+
+    def __init__(self, maxsize=32, radius=0.05):
+        self.maxsize = maxsize
+        self.radius = radius
+        self._states = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.hit_evaluations = 0
+        self.miss_evaluations = 0
+
+    def __len__(self):
+        return len(self._states)
+
+    def lookup(self, x):
+        """
+        Returns the coupling state of the nearest cached design within radius of x,
+        None if there is none or if it is the most recently stored design, whose
+        state the previous solve left in place.
+        """
+        nearest = None
+        for key, (x_i, state) in self._states.items():
+            distance = np.linalg.norm(x_i - x)
+            if distance <= self.radius and (nearest is None or distance < nearest[0]):
+                nearest = (distance, key, state)
+        if nearest is None or nearest[1] == next(reversed(self._states)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._states.move_to_end(nearest[1])
+        return nearest[2]
+
+    def store(self, x, state, evaluations, hit):
+        """
+        Caches the converged coupling state of the design x, whose solve took
+        evaluations of the disciplines starting from a cached state when hit.
+        """
+        if hit:
+            self.hit_evaluations += evaluations
+        else:
+            self.miss_evaluations += evaluations
+        key = np.asarray(x, dtype=float).tobytes()
+        self._states[key] = (np.array(x, dtype=float), np.array(state, dtype=float))
+        self._states.move_to_end(key)
+        while len(self._states) > self.maxsize:
+            self._states.popitem(last=False)
+
+    @property
+    def evaluations(self):
+        """
+        Number of evaluations of the disciplines by all the stored solves.
+        """
+        return self.hit_evaluations + self.miss_evaluations
+
+class CoupledDisciplines(Group):
+    """
+    Structure, aerodynamics and propulsion disciplines coupled by WT, L, Theta,
+    D, ESF and WE. Each solve starts from the coupling state of coupling_cache,
+    when given, for the nearest design already solved.
+
+    The cache is read and written in guess_nonlinear, at the start of each solve.
+    The converged state of a solve is stored when the next one starts, from the
+    outputs left in place. Finite difference totals restore the outputs of the
+    base point between the steps, so a step design may be stored with the state
+    of the base point, which is close and only used as a starting point.
+    """
+    # Inputs which define a design, the other inputs being couplings or
+    # computed from these ones
+    DESIGN_INPUTS = ['Structure.z', 'Structure.x_str', 'Aerodynamics.x_aer',
+                     'Propulsion.x_pro']
+
+    def __init__(self, coupling_cache=None, **kwargs):
+        super(CoupledDisciplines, self).__init__(**kwargs)
+        self.coupling_cache = coupling_cache
+        # Design, cache hit and evaluation count at the start of the last solve
+        self._last_solve = None
+
+    def _evaluations(self):
+        """
+        Number of evaluations of the first discipline: one per Gauss-Seidel
+        iteration, one residual evaluation per Newton iteration and line search step.
+        """
+        discipline = next(self.system_iter(recurse=False))
+        return discipline.iter_count + discipline.iter_count_apply
+
+    def guess_nonlinear(self, inputs, outputs, residuals):
+        cache = self.coupling_cache
+        if cache is None:
+            return
+
+        evaluations = self._evaluations()
+        if self._last_solve is not None:
+            x, hit, start = self._last_solve
+            cache.store(x, outputs.asarray(), evaluations - start, hit)
+
+        x = np.hstack([inputs[name] for name in self.DESIGN_INPUTS])
+        state = cache.lookup(x)
+        if state is not None:
+            outputs.set_val(state)
+        self._last_solve = (x, state is not None, evaluations)
 
 class SSBJ_MDA(Group):
     """
     SSBJ Analysis with aerodynamics, performance, propulsion and structure disciplines.
+    The couplings are converged with the MDA strategy mda, see mda_solvers, starting
+    from the states of coupling_cache when given, see CouplingCache.
     """
-    def __init__(self, scalers):
+    def __init__(self, scalers, pf, mda='gs', coupling_cache=None):
         super(SSBJ_MDA, self).__init__()
         self.scalers = scalers
+        self.pf = pf
+        self.coupling_cache = coupling_cache
+        if mda not in MDA_STRATEGIES:
+            raise ValueError('Unknown MDA strategy {}, expected one of {}'.format(mda,
+                                                                              MDA_STRATEGIES))
+        if mda == 'jacobi' and coupling_cache is not None:
+            # NonlinearBlockJac does not call guess_nonlinear
+            raise ValueError('The coupling cache is not available with the jacobi MDA strategy')
+        self.mda = mda
 
     def setup(self):
         #Design variables
@@ -36,38 +199,98 @@ class SSBJ_MDA(Group):
                  promotes=['*'])
         self.add_subsystem('x_pro_ini', IndepVarComp('x_pro', 1.0), promotes=['*'])
 
+        #Flight conditions, which do not depend on the couplings
+        self.add_subsystem('Atmosphere', Atmosphere(self.scalers), promotes=['*'])
+
         #Disciplines
-        sap_group = Group()
-        sap_group.add_subsystem('Structure', Structure(self.scalers), promotes=['*'])
-        sap_group.add_subsystem('Aerodynamics', Aerodynamics(self.scalers), promotes=['*'])
-        sap_group.add_subsystem('Propulsion', Propulsion(self.scalers),promotes=['*'])
-
-        sap_group.nonlinear_solver = NonlinearBlockGS()
-        sap_group.nonlinear_solver.options['atol'] = 1.0e-3
-        sap_group.linear_solver = ScipyKrylov()
+        sap_group = CoupledDisciplines(self.coupling_cache)
+        sap_group.add_subsystem('Structure', Structure(self.scalers, self.pf), promotes=['*'])
+        sap_group.add_subsystem('Aerodynamics', Aerodynamics(self.scalers, self.pf), promotes=['*'])
+        sap_group.add_subsystem('Propulsion', Propulsion(self.scalers, self.pf),promotes=['*'])
+
+        sap_group.nonlinear_solver, sap_group.linear_solver = mda_solvers(self.mda)
         self.add_subsystem('Mda', sap_group, promotes=['*'])
 
         self.add_subsystem('Performance', Performance(self.scalers), promotes=['*'])
 
         #Constraints
-        cstrs = ['con_theta_up = Theta*'+str(self.scalers['Theta'])+'-1.04',
-                 'con_theta_low = 0.96-Theta*'+ str(self.scalers['Theta']),
-                 'con_dpdx = dpdx*'+str(self.scalers['dpdx'])+'-1.04',
-                 'con1_esf = ESF*'+str(self.scalers['ESF'])+'-1.5',
-                 'con2_esf = 0.5-ESF*'+str(self.scalers['ESF']),
-                 'con_temp = Temp*'+str(self.scalers['Temp'])+'-1.02',
-                 'con_dt=DT'
-                 ]
-        for i in range(5):
-            cstrs.append('con_sigma'+str(i+1)+' = sigma['+str(i)+']*'+ str(self.scalers['sigma'][i])+'-1.09')
-        self.add_subsystem('Constraints', ExecComp(cstrs, sigma=np.zeros(5)), promotes=['*'])
-
-def init_ssbj_mda():
-    """
-    Runs the analysis once.
+        self.add_subsystem('Constraints', SSBJConstraints(self.scalers), promotes=['*'])
+
+def _cache_file(scalers, cache_dir):
     """
-    prob = Problem()
+    Cache file of the init_ssbj_mda results for the start point in scalers.
+    The name depends on the start point, the cache version and the source of
+    this module and of the disciplines, so that any change of the code which
+    may change the results invalidates the cache.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    sources = [os.path.abspath(__file__)] \
+              + sorted(glob.glob(os.path.join(here, 'ssbj_disciplines', '*.py')))
+    key = hashlib.sha1(str(CACHE_VERSION).encode())
+    for name in ['z', 'x_str', 'x_aer', 'x_pro']:
+        key.update(np.asarray(scalers[name], dtype=float).tobytes())
+    for source in sources:
+        with open(source, 'rb') as f:
+            key.update(f.read())
+    return os.path.join(cache_dir, 'ssbj_mda_init_{}.npz'.format(key.hexdigest()[:16]))
+
+def prune_cache(filename, prefix):
+    """
+    Removes the files of the directory of filename whose name starts with prefix,
+    other than filename and the files being written: the entries of the cache
+    left by previous versions of the code.
+    """
+    for other in glob.glob(os.path.join(os.path.dirname(filename), prefix + '*')):
+        if other != filename and not other.endswith('.tmp'):
+            try:
+                os.remove(other)
+            except OSError:
+                pass
+
+def _load_cache(filename):
+    """
+    Returns the scalers and the polynomial function reference state stored
+    in filename, or None if it cannot be read.
+    """
+    try:
+        with np.load(filename, allow_pickle=False) as data:
+            scalers = {}
+            d = {}
+            for name in data.files:
+                kind, key = name.split('/', 1)
+                if kind == 'scalers':
+                    value = data[name]
+                    scalers[key] = float(value) if value.ndim == 0 else value
+                else:
+                    d[key] = data[name]
+    except (IOError, OSError, ValueError, zipfile.BadZipfile):
+        return None
+    return scalers, PolynomialFunction(d)
+
+def _save_cache(filename, scalers, pf):
+    """
+    Stores the scalers and the polynomial function reference state in filename.
+    """
+    arrays = dict(('scalers/' + key, np.asarray(value)) for key, value in scalers.items())
+    arrays.update(('pf/' + key, value) for key, value in pf.d.items())
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, filename)
+    except (IOError, OSError) as err:
+        warnings.warn('init_ssbj_mda results not cached: {}'.format(err))
+    else:
+        prune_cache(filename, 'ssbj_mda_init_')
 
+def init_ssbj_mda(cache_dir=CACHE_DIR):
+    """
+    Runs the analysis once at the start point.
+    Returns the scalers and the polynomial function reference state.
+    The results are stored in and reused from cache_dir, None disables the cache.
+    """
     # Mean point is chosen for the design variables
     scalers = {}
     #scalers['z'] = np.array([0.06, 60000., 1.4, 2.475, 69.85, 1500.0])  # optimum
@@ -92,24 +315,21 @@ def init_ssbj_mda():
     scalers['dpdx']=1.0
     scalers['sigma']=np.array([1.0,1.0,1.0,1.0,1.0])
 
-    prob.model = SSBJ_MDA(scalers)
-    prob.setup()
+    if cache_dir is not None:
+        filename = _cache_file(scalers, cache_dir)
+        cached = _load_cache(filename)
+        if cached is not None:
+            return cached
 
     #Initialization of acceptable values as initial values for the polynomial functions
-    Z = prob['z']*scalers['z']
-    Wfo = 2000
-    Wo = 25000
-    We = 3*4360.0*(1.0**1.05)
-    t = Z[0]*Z[5]/np.sqrt(Z[5]*Z[3])
-    Wfw = (5.*Z[5]/18.)*(2.0/3.0*t)*(42.5)
-    Fo = 1.0
-    Wtotal = 80000.
-    Wtot=1.1*Wtotal
-    while abs(Wtot - Wtotal) > Wtotal*0.0001:
-        Wtot = Wtotal
-        Ww  = Fo*(.0051*((Wtot*6.0)**0.557)*Z[5]**.649*Z[3]**.5*Z[0]**-.4*((1.0+0.25)**.1)*\
-                  ((np.cos(Z[4]*np.pi/180))**-1)*((.1875*Z[5])**.1))
-        Wtotal = Wo + Ww + Wfo + Wfw + We
+    Wtotal = weight_guess(scalers['z'], taper=scalers['x_str'][0])
+
+    pf = polynomial_reference(scalers['z'], scalers['x_str'], scalers['x_aer'],
+                              scalers['x_pro'], Wtotal)
+
+    prob = Problem()
+    prob.model = SSBJ_MDA(scalers, pf)
+    prob.setup()
 
     prob['WT'] = Wtotal
     # prob['sap']['Aero.WT'] = Wtotal
@@ -122,11 +342,12 @@ def init_ssbj_mda():
     for key in iterkeys(scalers):
         if key not in ['z', 'x_str', 'x_aer', 'x_pro']:
             scalers[key] = prob[key]
-    return scalers
 
-def get_initial_state():
-    return init_ssbj_mda(), PolynomialFunction().d
+    if cache_dir is not None:
+        _save_cache(filename, scalers, pf)
+    return scalers, pf
 
 if __name__ == "__main__":
-    scalers = init_ssbj_mda()
+    scalers, pf = init_ssbj_mda()
     print(scalers)
+    print(pf)
@@ -6,69 +6,149 @@ Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
 from __future__ import print_function
 import six
 from sys import argv
-import re
+from collections import OrderedDict
 import numpy as np
-import matplotlib.pylab as plt
-import sqlitedict
-
 
 from openmdao.api import Problem, SqliteRecorder, ScipyOptimizeDriver
 
 from ssbj_mda import init_ssbj_mda, SSBJ_MDA
+from ssbj_coloring import setup_total_coloring
 # pylint: disable=C0103
 
-# Optimization problem
-scalers = init_ssbj_mda()
-prob = Problem()
-prob.model = SSBJ_MDA(scalers)
-
-# Optimizer options
-prob.driver = ScipyOptimizeDriver()
-#prob.driver = pyOptSparseDriver()
-optimizer ='SLSQP'
-prob.driver.options['optimizer'] = optimizer
-
-# Design variables
-prob.model.add_design_var('z', lower=np.array([0.2, 0.666, 0.875, 0.45, 0.72, 0.5]),
-                          upper=np.array([1.8, 1.333, 1.125, 1.45, 1.27, 1.5]))
-prob.model.add_design_var('x_str', lower=np.array([0.4, 0.75]),
-                          upper=np.array([1.6, 1.25]))
-prob.model.add_design_var('x_aer', lower=0.75, upper=1.25)
-prob.model.add_design_var('x_pro', lower=0.18, upper=1.81)
-
-# Objective function
-prob.model.add_objective('R', scaler=-1.)
-
-# Constraints
-prob.model.add_constraint('con_dt', upper=0.0)
-prob.model.add_constraint('con_theta_up', upper=0.0)
-prob.model.add_constraint('con_theta_low', upper=0.0)
-prob.model.add_constraint('con_sigma1', upper=0.0)
-prob.model.add_constraint('con_sigma2', upper=0.0)
-prob.model.add_constraint('con_sigma3', upper=0.0)
-prob.model.add_constraint('con_sigma4', upper=0.0)
-prob.model.add_constraint('con_sigma5', upper=0.0)
-prob.model.add_constraint('con_dpdx', upper=0.0)
-prob.model.add_constraint('con1_esf', upper=0.0)
-prob.model.add_constraint('con2_esf', upper=0.0)
-prob.model.add_constraint('con_temp', upper=0.0)
-
-# Recorder
-db_name = 'ssbj_mdf.sqlite'
-if "--plot" in argv:
-    recorder = SqliteRecorder(db_name)
-    # recorder2 = WebRecorder("", case_name="SSBJ MDF")
-    prob.driver.recording_options['record_desvars'] = True
-    prob.driver.recording_options['record_objectives'] = True
-    prob.driver.recording_options['record_constraints'] = True
-    prob.driver.add_recorder(recorder)
-    # prob.driver.add_recorder(recorder2)
-
-#Run optimization
-prob.setup(check=True, mode='fwd')
+# Scaled bounds of the design variables
+BOUNDS = OrderedDict([('z', (np.array([0.2, 0.666, 0.875, 0.45, 0.72, 0.5]),
+                              np.array([1.8, 1.333, 1.125, 1.45, 1.27, 1.5]))),
+                      ('x_str', (np.array([0.4, 0.75]), np.array([1.6, 1.25]))),
+                      ('x_aer', (0.75, 1.25)),
+                      ('x_pro', (0.18, 1.81))])
+
+# Options of build_mdf_problem
+DEFAULT_OPTIONS = {
+    'scalers': None,        # scalers and polynomial reference of init_ssbj_mda,
+    'pf': None,             # computed when not given
+    'optimizer': 'SLSQP',
+    'maxiter': 200,
+    'tol': 1e-6,
+    'disp': True,
+    'mda': 'gs',            # MDA strategy, see ssbj_mda.mda_solvers
+    'coupling_cache': None, # see ssbj_mda.CouplingCache
+    'fd': False,            # finite difference total derivatives
+    'coloring': True,       # total coloring and derivative mode, see ssbj_coloring
+    'mode': 'fwd',          # derivative mode without coloring
+    'check': False,         # setup checks
+    'recorder': None,       # sqlite database of the driver cases
+}
+
+def mdf_options(options=None):
+    """
+    DEFAULT_OPTIONS updated with options, raising a KeyError on an unknown option.
+    """
+    merged = dict(DEFAULT_OPTIONS)
+    for key, value in six.iteritems(options or {}):
+        if key not in DEFAULT_OPTIONS:
+            raise KeyError('Unknown MDF option {}, expected one of {}'.format(
+                key, sorted(DEFAULT_OPTIONS)))
+        merged[key] = value
+    return merged
+
+def build_mdf_problem(options=None):
+    """
+    Sets up the MDF optimization problem of SSBJ_MDA with options, see
+    DEFAULT_OPTIONS. The problem can be run again from other start points
+    with run_mdf without setting it up again.
+    """
+    options = mdf_options(options)
+    scalers, pf = options['scalers'], options['pf']
+    if scalers is None or pf is None:
+        scalers, pf = init_ssbj_mda()
+
+    prob = Problem()
+    prob.model = SSBJ_MDA(scalers, pf, mda=options['mda'],
+                          coupling_cache=options['coupling_cache'])
+
+    # Optimizer options
+    prob.driver = ScipyOptimizeDriver(optimizer=options['optimizer'], maxiter=options['maxiter'],
+                                      tol=options['tol'], disp=options['disp'])
+
+    # Design variables
+    for name, (lower, upper) in BOUNDS.items():
+        prob.model.add_design_var(name, lower=lower, upper=upper)
+
+    # Objective function
+    prob.model.add_objective('R', scaler=-1.)
+
+    # Constraints
+    prob.model.add_constraint('con', upper=0.0)
+
+    if options['fd']:
+        prob.model.approx_totals(method='fd')
+
+    # Recorder
+    if options['recorder']:
+        recorder = SqliteRecorder(options['recorder'])
+        prob.driver.recording_options['record_desvars'] = True
+        prob.driver.recording_options['record_objectives'] = True
+        prob.driver.recording_options['record_constraints'] = True
+        prob.driver.add_recorder(recorder)
+
+    if options['coloring'] and not options['fd']:
+        setup_total_coloring(prob, check=options['check'])
+    else:
+        prob.setup(check=options['check'], mode=options['mode'])
+    if not options['disp']:
+        prob.set_solver_print(level=-1)
+    prob.final_setup()
+    return prob
+
+def run_mdf(x0=None, options=None, prob=None):
+    """
+    Runs the MDF optimization from the scaled design variables of the dict x0,
+    the current values for the missing ones, on prob or on a new problem built
+    with options. The couplings restart from ones, as in a new problem, so that
+    the result does not depend on the previous runs of prob.
+    Returns the problem and the dict of the scaled optimal design variables,
+    the range R in Nm, the success flag and the number of driver iterations.
+    """
+    if prob is None:
+        prob = build_mdf_problem(options)
+    for _, meta in prob.model.Mda.list_outputs(prom_name=True, out_stream=None):
+        prob[meta['prom_name']] = 1.0
+    for name, value in six.iteritems(x0 or {}):
+        prob[name] = value
+
+    failed = prob.run_driver()
+
+    result = dict((name, prob[name].copy()) for name in BOUNDS)
+    result['R'] = float(prob['R'][0]*prob.model.scalers['R'][0])
+    result['success'] = not failed
+    result['iterations'] = prob.driver.iter_count
+    return prob, result
+
+def plot_range(db_name, scalers):
+    """
+    Plots the range of the driver cases recorded in db_name.
+    """
+    import matplotlib.pylab as plt
+    from openmdao.recorders.case_reader import CaseReader
+
+    plt.figure()
+
+    cr = CaseReader(db_name)
+    print('Number of driver cases recorded =', cr.driver_cases.num_cases )
+    case_keys = cr.driver_cases.list_cases()
+    r = []
+    for case_key in case_keys:
+        r.append(-cr.driver_cases.get_case(case_key).objectives['R']*scalers['R'])
+    plt.plot(r)
+    plt.xlabel('Iteration')
+    plt.ylabel('Range (Nm)')
+    plt.show()
 
 if __name__=='__main__':
-    prob.run_driver()
+    db_name = 'ssbj_mdf.sqlite'
+    scalers, pf = init_ssbj_mda()
+    prob, result = run_mdf(options={'scalers': scalers, 'pf': pf, 'check': True,
+                                    'recorder': db_name if "--plot" in argv else None})
     prob.cleanup()
 
     print('Z_opt=', prob['z']*scalers['z'])
@@ -78,23 +158,10 @@ if __name__=='__main__':
     print('R_opt=', prob['R']*scalers['R'])
 
     if "--plot" in argv:
-        from openmdao.recorders.case_reader import CaseReader
-
-        plt.figure()
-
-        cr = CaseReader(db_name)
-        print('Number of driver cases recorded =', cr.driver_cases.num_cases )
-        case_keys = cr.driver_cases.list_cases()
-        r = []
-        for case_key in case_keys:    
-            r.append(-cr.driver_cases.get_case(case_key).objectives['R']*scalers['R'])
-        plt.plot(r)
-        plt.xlabel('Iteration')
-        plt.ylabel('Range (Nm)')
-        plt.show()
+        plot_range(db_name, scalers)
 
     # Check R =~ 3964Nm
-    R = float(prob['R']*scalers['R'])
+    R = result['R']
 
     for key in six.iterkeys(scalers):
         if key not in ['z', 'x_str', 'x_pro']:
@@ -104,4 +171,3 @@ if __name__=='__main__':
     assert(R < 3970.)
     # from openmdao.devtools.problem_viewer.problem_viewer import view_model
     # view_model(prob)
-
@@ -0,0 +1,102 @@
+"""
+SSBJ test case - http://ntrs.nasa.gov/archive/nasa/casi.ntrs.nasa.gov/19980234657.pdf
+Python implementation and OpenMDAO integration developed by
+Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
+
+Multi-start MDF optimization: independent optimizations of ssbj_mdf from
+sampled start points on a pool of processes, each process setting up its
+problem once and reusing it for all its start points.
+"""
+from __future__ import print_function
+from timeit import default_timer as timer
+import numpy as np
+
+from ssbj_mda import init_ssbj_mda
+from ssbj_mdf import BOUNDS, mdf_options, build_mdf_problem, run_mdf
+from ssbj_pool import WorkerPool, worker
+# pylint: disable=C0103
+
+def latin_hypercube(n_points, lower, upper, seed=0):
+    """
+    n_points of a random Latin hypercube between the bounds lower and upper.
+    """
+    rng = np.random.RandomState(seed)
+    n = len(lower)
+    strata = np.column_stack([rng.permutation(n_points) for _ in range(n)])
+    u = (strata + rng.uniform(size=(n_points, n)))/n_points
+    return lower + u*(upper - lower)
+
+def _flatten(design):
+    return np.hstack([np.reshape(design[name], -1) for name in BOUNDS])
+
+def _unflatten(x):
+    design = {}
+    i = 0
+    for name, (lower, _) in BOUNDS.items():
+        size = np.size(lower)
+        design[name] = x[i:i+size].copy()
+        i += size
+    return design
+
+def start_points(n_starts, seed=0):
+    """
+    n_starts dicts of scaled design variables on a Latin hypercube of BOUNDS.
+    """
+    lower = _flatten(dict((name, bounds[0]) for name, bounds in BOUNDS.items()))
+    upper = _flatten(dict((name, bounds[1]) for name, bounds in BOUNDS.items()))
+    return [_unflatten(x) for x in latin_hypercube(n_starts, lower, upper, seed)]
+
+def _init_worker(options):
+    """
+    Sets up the MDF problem of the worker process.
+    """
+    worker['prob'] = build_mdf_problem(options)
+
+def _optimize(x0):
+    """
+    Result of run_mdf from the start point x0 on the problem of the worker
+    process, with the start point and the optimization time.
+    """
+    t0 = timer()
+    _, result = run_mdf(x0, prob=worker['prob'])
+    result['start'] = x0
+    result['time'] = timer() - t0
+    return result
+
+def unique_optima(results, tol=1e-3):
+    """
+    Successful results of run_mdf ranked by decreasing range, a design within
+    tol of a better one in the max norm of the scaled design variables being
+    counted as the same optimum. Each optimum gets the number of starts which
+    converged to it as count.
+    """
+    optima = []
+    for result in sorted((r for r in results if r['success']), key=lambda r: -r['R']):
+        x = _flatten(result)
+        for optimum in optima:
+            if np.max(np.abs(x - _flatten(optimum))) <= tol:
+                optimum['count'] += 1
+                break
+        else:
+            optima.append(dict(result, count=1))
+    return optima
+
+def multistart_mdf(n_starts, options=None, seed=0, max_workers=None, tol=1e-3, starts=None):
+    """
+    Runs MDF optimizations built with options, see ssbj_mdf.DEFAULT_OPTIONS,
+    from n_starts start points of start_points(n_starts, seed), or from the
+    dicts of starts when given, on a pool of max_workers processes (the number
+    of processors by default), or in this process when use_pool(max_workers)
+    is False.
+    Returns the unique optima ranked by range, see unique_optima, and the
+    results of all the starts in their order.
+    """
+    options = mdf_options(dict({'disp': False}, **(options or {})))
+    if options['scalers'] is None or options['pf'] is None:
+        # computed once here rather than by every worker
+        options['scalers'], options['pf'] = init_ssbj_mda()
+    if starts is None:
+        starts = start_points(n_starts, seed)
+    with WorkerPool(_init_worker, (options,), max_workers) as pool:
+        results = list(pool.map(_optimize, starts))
+    return unique_optima(results, tol), results
@@ -0,0 +1,149 @@
+"""
+SSBJ test case - http://ntrs.nasa.gov/archive/nasa/casi.ntrs.nasa.gov/19980234657.pdf
+Python implementation and OpenMDAO integration developed by
+Sylvain Dubreuil and Remi Lafage of ONERA, the French Aerospace Lab.
+
+Pools of processes which set up their problems once and reuse them for all
+their tasks, and evaluation of many design points through SSBJ_MDA on such a
+pool.
+"""
+from __future__ import print_function
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from openmdao.api import Problem
+
+from ssbj_mda import SSBJ_MDA
+# pylint: disable=C0103
+
+# Design variables of SSBJ_MDA, the other outputs being returned
+DESIGN_VARIABLES = ['z', 'x_str', 'x_aer', 'x_pro']
+
+# State of the worker process, set up by the initializer of its WorkerPool
+worker = {}
+
+# WorkerPools started and not closed yet, closed at exit
+_started_pools = set()
+
+def use_pool(max_workers=None):
+    """
+    Whether work for max_workers processes (the number of processors when None)
+    goes to a pool of processes rather than running in this process. A pool of
+    a single process only adds overhead, so one worker or, by default, a single
+    processor runs in this process.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    return max_workers > 1
+
+class WorkerPool(object):
+    """
+    Pool of max_workers processes (the number of processors when None), each
+    process running initializer(*initargs) once to set up its state in worker,
+    then the tasks of map. The initializer and the tasks run in this process
+    instead when use_pool(max_workers) is False. The pool starts at the first
+    map and stops at close or at the exit of a with statement, otherwise at exit.
+    """
+
+    def __init__(self, initializer, initargs=(), max_workers=None):
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_workers = max_workers
+        self.executor = None
+        self.started = False
+
+    def map(self, function, tasks, chunksize=1):
+        """
+        Iterator over function(task) for the tasks, in their order.
+        """
+        if not self.started:
+            if use_pool(self.max_workers):
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                    initializer=self.initializer,
+                                                    initargs=self.initargs)
+            else:
+                self.initializer(*self.initargs)
+            self.started = True
+            _started_pools.add(self)
+        if self.executor is None:
+            return map(function, tasks)
+        return self.executor.map(function, tasks, chunksize=chunksize)
+
+    def close(self):
+        """
+        Shuts down the processes, or clears the state of this process, until the
+        next map.
+        """
+        if self.started:
+            _started_pools.discard(self)
+            if self.executor is None:
+                worker.clear()
+            else:
+                self.executor.shutdown()
+                self.executor = None
+            self.started = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+@atexit.register
+def _close_pools():
+    """
+    Closes the pools left started at exit.
+    """
+    for pool in list(_started_pools):
+        pool.close()
+
+def _init_worker(scalers, pf, mda):
+    """
+    Sets up the SSBJ_MDA problem of the worker process.
+    """
+    prob = Problem(SSBJ_MDA(scalers, pf, mda=mda))
+    prob.setup()
+    prob.set_solver_print(level=-1)
+    prob.final_setup()
+    names = [meta['prom_name'] for _, meta in
+             prob.model.list_outputs(prom_name=True, out_stream=None)]
+    outputs = [name for name in names if name not in DESIGN_VARIABLES]
+    # Every point starts from the same couplings, so that its results do not
+    # depend on the points evaluated before by the same worker
+    couplings = [meta['prom_name'] for _, meta in
+                 prob.model.Mda.list_outputs(prom_name=True, out_stream=None)]
+    start = dict((name, prob[name].copy()) for name in couplings)
+    worker.update(prob=prob, outputs=outputs, start=start)
+
+def _evaluate(point):
+    """
+    Returns the dictionary of the scaled outputs of SSBJ_MDA at the design point
+    (z, x_str, x_aer, x_pro) of the worker process.
+    """
+    prob = worker['prob']
+    for name, value in worker['start'].items():
+        prob[name] = value
+    for name, value in zip(DESIGN_VARIABLES, point):
+        prob[name] = value
+    prob.run_model()
+    return dict((name, prob[name].copy()) for name in worker['outputs'])
+
+def evaluate_points(scalers, pf, z, x_str, x_aer, x_pro, max_workers=None, chunksize=16,
+                    mda='gs'):
+    """
+    Evaluates SSBJ_MDA at N design points on a pool of max_workers processes
+    (the number of processors by default), sending them chunksize points at a
+    time: z is (N, 6), x_str is (N, 2), x_aer and x_pro have length N, all
+    scaled as the SSBJ_MDA inputs. The points are evaluated in this process
+    instead when use_pool(max_workers) is False.
+    Yields the dictionary of the scaled outputs of each point, in the order of
+    the points, as soon as it is available.
+    """
+    z = np.atleast_2d(z)
+    n = z.shape[0]
+    points = zip(z, np.reshape(x_str, (n, 2)), np.reshape(x_aer, n), np.reshape(x_pro, n))
+    with WorkerPool(_init_worker, (scalers, pf, mda), max_workers) as pool:
+        for outputs in pool.map(_evaluate, points, chunksize=chunksize):
+            yield outputs
@@ -0,0 +1,69 @@
+"""
+Tests of the post-optimality sensitivities of the CO suboptimizations.
+"""
+import unittest
+
+import numpy as np
+
+from openmdao.api import Problem, IndepVarComp, ExecComp, ScipyOptimizeDriver
+
+from ssbj_mda import init_ssbj_mda
+from ssbj_co import SubOpt, DISCIPLINES, SUBOPT_PARAMS, SUBOPT_OUTPUTS, optimal_sensitivities
+
+
+class TestOptimalSensitivities(unittest.TestCase):
+
+    def test_equality_constraint(self):
+        # min |x| s.t. x[0] + x[1] = c: x = c/2, the multiplier of the equality is negative
+        prob = Problem()
+        ivc = prob.model.add_subsystem('params', IndepVarComp(), promotes=['*'])
+        ivc.add_output('x', val=np.array([1., 0.]))
+        ivc.add_output('c', val=1.)
+        prob.model.add_subsystem('J', ExecComp('J = (x[0]**2 + x[1]**2)**.5', x=np.ones(2)),
+                                 promotes=['*'])
+        prob.model.add_subsystem('con', ExecComp('con = x[0] + x[1] - c', x=np.ones(2)),
+                                 promotes=['*'])
+        prob.model.add_design_var('x', lower=-10., upper=10.)
+        prob.model.add_objective('J')
+        prob.model.add_constraint('con', equals=0.)
+        prob.driver = ScipyOptimizeDriver(optimizer='SLSQP', tol=1e-12, disp=False)
+        prob.setup()
+        prob.run_driver()
+
+        jac = optimal_sensitivities(prob, ['c'], ['x'])
+        np.testing.assert_allclose(jac['x', 'c'], [[0.5], [0.5]], atol=1e-5)
+
+    def check_subopt_kkt_vs_fd(self, discipline):
+        # Suboptimization away from the consistent point, solved tightly and differentiated by
+        # central differences so that the finite differences of whole suboptimizations are accurate
+        scalers, pf = init_ssbj_mda()
+        of = ['subopt.' + output for output, _ in SUBOPT_OUTPUTS[discipline]]
+        totals = {}
+        for partials in ['kkt', 'fd']:
+            prob = Problem()
+            subopt = prob.model.add_subsystem('subopt', SubOpt(discipline=discipline, scalers=scalers,
+                                                               pf=pf, driver=ScipyOptimizeDriver(),
+                                                               partials=partials, fd_step=1e-3,
+                                                               fd_form='central', record=False),
+                                              promotes_inputs=['*'])
+            prob.setup()
+            subopt.prob.driver.options['tol'] = 1e-14
+            subopt.prob.driver.options['maxiter'] = 1000
+            rng = np.random.RandomState(1)
+            for param in SUBOPT_PARAMS[discipline]:
+                prob[param] = prob[param] + 0.05*rng.uniform(-1, 1, np.shape(prob[param]))
+            prob.run_model()
+            totals[partials] = prob.compute_totals(of=of, wrt=SUBOPT_PARAMS[discipline])
+
+        for key, value in totals['fd'].items():
+            np.testing.assert_allclose(totals['kkt'][key], value, rtol=1e-3, atol=1e-5,
+                                       err_msg=str(key))
+
+    def test_subopt_kkt_vs_fd(self):
+        for discipline in DISCIPLINES:
+            with self.subTest(discipline=discipline):
+                self.check_subopt_kkt_vs_fd(discipline)
+
+
+if __name__ == '__main__':
+    unittest.main()